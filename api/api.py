@@ -1,21 +1,26 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import abc
-import json
 import logging
 import hashlib
-import uuid
-from optparse import OptionParser
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import math
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from collections import OrderedDict
 import re
+from array import array
 from datetime import datetime
-from collections import defaultdict
-from itertools import chain
+from itertools import groupby
 
+from api import cache
+from api import codec
+from api import compression
+from api import history
+from api import profiler
 from api import scoring
 from api import store
+from api import tracing
 
 SALT = "Otus"
 ADMIN_LOGIN = "admin"
@@ -47,6 +52,26 @@ redis_config = {
     "port": 6379,
     "db": 0
 }
+store_config = {
+    "backend": "redis",
+    "redis_config": redis_config,
+}
+# command line options every backend requires
+STORE_OPTIONS = {
+    "redis": (),
+    "memory": (),
+    "mmap": ("path",),
+    "snapshot": ("path",),
+    "sharded": ("nodes",),
+}
+MAX_CLIENT_IDS = 100000
+INTERESTS_CHUNK_SIZE = 1000
+MAX_BATCH_SIZE = 1000
+# client_ids of all the items of one batch together
+MAX_BATCH_CLIENT_IDS = 100000
+# ResponseCache for the CACHED_METHODS, disabled by default
+response_cache = None
+CACHED_METHODS = {"clients_interests"}
 
 
 class ValidationError(Exception):
@@ -61,17 +86,21 @@ class Field:
         self.clean_data = None
 
     def valid(self, value):
+        is_valid, clean_data = self.clean(value)
+        if is_valid:
+            self.clean_data = clean_data
+        return is_valid
+
+    def clean(self, value):
+        """Return (is valid, clean data) without touching the shared field."""
         if value is None:
-            self.clean_data = value
-            return not self.required
+            return not self.required, value
         elif value in self.null_values:
-            self.clean_data = value
-            return self.nullable
+            return self.nullable, value
         try:
-            self.clean_data = self.validate(value)
+            return True, self.validate(value)
         except ValidationError:
-            return False
-        return True
+            return False, None
 
     def validate(self, value):
         return value
@@ -155,14 +184,33 @@ class GenderField(Field):
 
 
 class ClientIDsField(Field):
-    def __init__(self, **kwargs):
+    """Sorted unique ids packed into array('Q'), 8 bytes per id."""
+    def __init__(self, max_size=None, **kwargs):
         super().__init__(null_values=[[]], **kwargs)
+        self.max_size = max_size
 
     def validate(self, value):
         value = super().validate(value)
         if not isinstance(value, list):
             raise ValidationError
-        if not all(isinstance(v, int) and v >= 0 for v in value):
+        if len(value) > (self.max_size or MAX_CLIENT_IDS):
+            raise ValidationError
+        try:
+            ids = array('Q', sorted(value))
+        except (TypeError, OverflowError):
+            raise ValidationError
+        return array('Q', (cid for cid, _ in groupby(ids)))
+
+
+class NumberField(Field):
+    def __init__(self, **kwargs):
+        super().__init__(null_values=[], **kwargs)
+
+    def validate(self, value):
+        value = super().validate(value)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValidationError
+        if not math.isfinite(value) or value <= 0:
             raise ValidationError
         return value
 
@@ -184,18 +232,19 @@ class BaseRequest(metaclass=DeclarativeFields):
     def __init__(self, req_args=None):
         self.req_args = req_args
         self.errors = []
+        self.clean_data = {}
 
     def __getattr__(self, attr):
         if attr in self.fields:
-            field = self.fields[attr]
-            return field.clean_data
+            return self.clean_data.get(attr)
         return None
 
     def is_valid(self):
         self.errors = []
         for field_name, field in self.fields.items():
             field_data = self.req_args.get(field_name)
-            if not field.valid(field_data):
+            is_valid, self.clean_data[field_name] = field.clean(field_data)
+            if not is_valid:
                 self.errors.append("{}:{} invalid".format(field_name,
                                                           field_data))
                 logging.error("{}:{} invalid".format(field_name, field_data))
@@ -207,9 +256,15 @@ class ClientsInterestsRequest(BaseRequest):
     date = DateField(required=False, nullable=True)
 
     def get_response(self, ctx, store, is_admin=False):
-        ctx["nclients"] = len(self.client_ids)
         ids = self.client_ids
-        r = {i: scoring.get_interests(store, i) for i in ids}
+        ctx["nclients"] = len(ids)
+        r = {}
+        for start in range(0, len(ids), INTERESTS_CHUNK_SIZE):
+            chunk = ids[start:start + INTERESTS_CHUNK_SIZE]
+            if self.date is None:
+                r.update(zip(chunk, scoring.get_interests_many(store, chunk)))
+            else:
+                r.update(zip(chunk, history.get_interests_many(store, chunk, self.date)))
         return r, OK
 
 
@@ -253,6 +308,41 @@ class OnlineScoreRequest(BaseRequest):
         return {"score": score}, OK
 
 
+class ProfileRequest(BaseRequest):
+    seconds = NumberField(required=False)
+    interval = NumberField(required=False)
+    limit = NumberField(required=False)
+
+    modes = ("stacks", "allocations")
+
+    def __init__(self, req_args=None, mode="stacks"):
+        super().__init__(req_args)
+        self.mode = mode
+
+    def is_valid(self):
+        if not super().is_valid():
+            return False
+        if (self.seconds or 0) > profiler.MAX_SECONDS:
+            self.errors.append("seconds:{} invalid".format(self.seconds))
+        if self.interval is not None and self.interval < profiler.MIN_INTERVAL:
+            self.errors.append("interval:{} invalid".format(self.interval))
+        return not self.errors
+
+    def get_response(self, ctx, store, is_admin=False):
+        seconds = self.seconds or 5
+        ctx["profile"] = self.mode
+        if not profiler.lock.acquire(blocking=False):
+            return "Profiling is already running", INVALID_REQUEST
+        try:
+            if self.mode == "allocations":
+                requests, top = profiler.collect_allocations(seconds, int(self.limit or 20))
+                return {"requests": requests, "allocations": top}, OK
+            samples, stacks = profiler.sample_stacks(seconds, self.interval or 0.01)
+            return {"samples": samples, "stacks": profiler.format_collapsed(stacks)}, OK
+        finally:
+            profiler.lock.release()
+
+
 class MethodRequest(BaseRequest):
     account = CharField(required=False, nullable=True)
     login = CharField(required=True, nullable=True)
@@ -265,14 +355,16 @@ class MethodRequest(BaseRequest):
         return self.login == ADMIN_LOGIN
 
 
-def check_auth(request):
-    if request.is_admin:
-        date = datetime.now().strftime("%Y%m%d%H") + ADMIN_SALT
-        digest = hashlib.sha512(date.encode('utf-8')).hexdigest()
+def make_token(login, account, now=None):
+    if login == ADMIN_LOGIN:
+        date = (now or datetime.now()).strftime("%Y%m%d%H") + ADMIN_SALT
     else:
-        date = request.account + request.login + SALT
-        digest = hashlib.sha512(date.encode('utf-8')).hexdigest()
-    if digest == request.token:
+        date = account + login + SALT
+    return hashlib.sha512(date.encode('utf-8')).hexdigest()
+
+
+def check_auth(request):
+    if make_token(request.login, request.account) == request.token:
         return True
     return False
 
@@ -285,40 +377,158 @@ def method_handler(request, ctx, store):
     logging.info("request: {}".format(request))
 
     req_base = MethodRequest(request.get('body'))
-    if not req_base.is_valid():
+    with tracing.span("validation"):
+        is_valid = req_base.is_valid()
+    if not is_valid:
         return ",".join(req_base.errors), INVALID_REQUEST
-    if not check_auth(req_base):
+    with tracing.span("auth"):
+        is_authorized = check_auth(req_base)
+    if not is_authorized:
         return "", FORBIDDEN
 
     try:
         req = router[req_base.method](req_base.arguments)
-        if not req.is_valid():
+        with tracing.span("validation.arguments", method=req_base.method):
+            is_valid = req.is_valid()
+        if not is_valid:
             return ",".join(req.errors), INVALID_REQUEST
     except KeyError:
         return "", NOT_FOUND
 
+    cache_key = None
+    if response_cache is not None and req_base.method in CACHED_METHODS:
+        cache_key = response_cache.make_key(req_base.method, req.clean_data)
+        cached = response_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            body, cached_ctx = cached
+            ctx.update(cached_ctx)
+            return body, OK
+        generation = response_cache.generation
+
+    known_ctx = set(ctx)
+    with tracing.span("scoring", method=req_base.method), profiler.track_allocations(req_base.method):
+        response, code = req.get_response(ctx, tracing.traced_store(store), req_base.is_admin)
+    if cache_key is not None and code == OK:
+        response = cache.Encoded(codec.dumps(response))
+        response_ctx = {k: v for k, v in ctx.items() if k not in known_ctx}
+        response_cache.set(cache_key, response, req.client_ids, response_ctx, generation)
+    return response, code
+
+
+def make_reply(response, code):
+    if code not in ERRORS:
+        return {"response": response, "code": code}
+    return {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
+
+
+def batch_client_ids(body):
+    total = 0
+    for item in body:
+        arguments = item.get("arguments") if isinstance(item, dict) else None
+        if isinstance(arguments, dict) and isinstance(arguments.get("client_ids"), list):
+            total += len(arguments["client_ids"])
+    return total
+
+
+def batch_handler(request, ctx, store):
+    """Handle a list of method requests, each authorized on its own."""
+    body = request.get('body')
+    if not isinstance(body, list) or len(body) > MAX_BATCH_SIZE:
+        return "", INVALID_REQUEST
+    if batch_client_ids(body) > MAX_BATCH_CLIENT_IDS:
+        return "More than {} client_ids in the batch".format(MAX_BATCH_CLIENT_IDS), INVALID_REQUEST
+    ctx["batch"] = len(body)
+    results = []
+    for item in body:
+        if not isinstance(item, dict):
+            results.append(make_reply("", INVALID_REQUEST))
+            continue
+        try:
+            response, code = method_handler({"body": item, "headers": request.get('headers')}, {}, store)
+        except Exception as e:
+            logging.exception("Unexpected error: %s" % e)
+            response, code = "", INTERNAL_ERROR
+        if isinstance(response, cache.Encoded):
+            response = codec.loads(response)
+        results.append(make_reply(response, code))
+    return results, OK
+
+
+def profile_handler(request, ctx, store):
+    req_base = MethodRequest(request.get('body'))
+    if not req_base.is_valid():
+        return ",".join(req_base.errors), INVALID_REQUEST
+    if not req_base.is_admin or not check_auth(req_base):
+        return "", FORBIDDEN
+    if req_base.method not in ProfileRequest.modes:
+        return "", NOT_FOUND
+    req = ProfileRequest(req_base.arguments or {}, req_base.method)
+    if not req.is_valid():
+        return ",".join(req.errors), INVALID_REQUEST
     return req.get_response(ctx, store, req_base.is_admin)
 
 
 class MainHTTPHandler(BaseHTTPRequestHandler):
+    # keep-alive: every response carries a Content-Length; headers and
+    # body go out in separate writes, which Nagle would delay on a kept
+    # connection until the client's delayed ACK
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    # seconds a kept connection may stay idle before its thread drops it
+    timeout = 30
     router = {
-        "method": method_handler
+        "method": method_handler,
+        "batch": batch_handler,
+        "admin/profile": profile_handler,
     }
-    store = store.Store(redis_config)
+    store_config = store_config
+    store_lock = threading.Lock()
+    _store = None
+    _store_pid = None
+
+    @classmethod
+    def get_store(cls):
+        """Create the store on first use in every worker process."""
+        if cls._store is None or cls._store_pid != os.getpid():
+            with cls.store_lock:
+                if cls._store is None or cls._store_pid != os.getpid():
+                    cls._store = store.create_store(cls.store_config)
+                    if response_cache is not None:
+                        cls._store.add_listener(response_cache.invalidate)
+                    cls._store_pid = os.getpid()
+        return cls._store
+
+    @property
+    def store(self):
+        return self.get_store()
 
     def get_request_id(self, headers):
-        return headers.get('HTTP_X_REQUEST_ID', uuid.uuid4().hex)
+        request_id = headers.get('X-Request-ID')
+        if request_id is None:
+            import uuid
+            request_id = uuid.uuid4().hex
+        return request_id
 
     def do_POST(self):
-        response, code = {}, OK
         context = {"request_id": self.get_request_id(self.headers)}
+        with tracing.tracer.trace("POST " + self.path, self.headers,
+                                  request_id=context["request_id"]) as span:
+            self.process_post(context)
+            span.set("code", context["code"])
+
+    def process_post(self, context):
+        response, code = {}, OK
         request = None
         try:
-            data_string = self.rfile.read(int(self.headers['Content-Length']))
-            request = json.loads(data_string.decode("utf-8"))
+            with tracing.span("parse"):
+                data_string = self.rfile.read(int(self.headers['Content-Length']))
+                data_string = compression.decompress(data_string, self.headers.get('Content-Encoding'))
+                request = codec.loads(data_string)
         except Exception as e:
             logging.exception("Unexpected error: %s" % e)
             code = BAD_REQUEST
+            # the rest of the body may still be unread
+            self.close_connection = True
         if request:
             path = self.path.strip("/")
             logging.info("%s: %s %s" % (self.path, data_string, context["request_id"]))
@@ -331,27 +541,74 @@ class MainHTTPHandler(BaseHTTPRequestHandler):
             else:
                 code = NOT_FOUND
 
+        r = make_reply(response, code)
+        context.update(r)
+        logging.info(context)
+        if isinstance(response, cache.Encoded):
+            body = b'{"response": ' + response + b', "code": ' + str(code).encode() + b'}'
+        else:
+            body = codec.dumps(r)
+        encoding = None
+        if len(body) >= compression.MIN_SIZE:
+            encoding = compression.choose_encoding(self.headers.get('Accept-Encoding'))
+        if encoding:
+            with tracing.span("compress", encoding=encoding, size=len(body)):
+                body = compression.compress(body, encoding)
+
         self.send_response(code)
         self.send_header("Content-Type", "application/json")
+        self.send_header("X-Request-ID", context["request_id"])
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        if code not in ERRORS:
-            r = {"response": response, "code": code}
-        else:
-            r = {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
-        context.update(r)
-        logging.info(context)
-        self.wfile.write(json.dumps(r).encode('utf-8'))
+        self.wfile.write(body)
         return
 
 
 if __name__ == "__main__":
+    from optparse import OptionParser
+
     op = OptionParser()
     op.add_option("-p", "--port", action="store", type=int, default=8080)
     op.add_option("-l", "--log", action="store", default=None)
+    op.add_option("-s", "--store", action="store", default=store_config["backend"],
+                  choices=list(store.BACKENDS))
+    op.add_option("--store-path", action="store", default=None)
+    op.add_option("--store-nodes", action="store", default=None,
+                  help="HOST:PORT/DB,... of the sharded store")
+    op.add_option("--max-client-ids", action="store", type=int, default=MAX_CLIENT_IDS)
+    op.add_option("--response-cache-ttl", action="store", type=float, default=0,
+                  help="seconds to cache clients_interests responses, 0 disables")
+    op.add_option("--response-cache-size", action="store", type=int, default=64 * 1024 * 1024)
+    op.add_option("--trace-rate", action="store", type=float, default=0.0)
+    op.add_option("--trace-file", action="store", default=None)
+    op.add_option("--trace-endpoint", action="store", default=None)
     (opts, args) = op.parse_args()
+    for option, value in (("path", opts.store_path), ("nodes", opts.store_nodes)):
+        required = option in STORE_OPTIONS.get(opts.store, ())
+        if required and not value:
+            op.error("--store {} requires --store-{}".format(opts.store, option))
+        if value and not required:
+            op.error("--store-{} does not apply to --store {}".format(option, opts.store))
+    if opts.store_path and not os.path.isfile(opts.store_path):
+        op.error("--store-path {} is not a file".format(opts.store_path))
     logging.basicConfig(filename=opts.log, level=logging.INFO,
                         format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
-    server = HTTPServer(("localhost", opts.port), MainHTTPHandler)
+    if opts.store != store_config["backend"]:
+        store_config = {"backend": opts.store}
+        if opts.store_path:
+            store_config["path"] = opts.store_path
+        if opts.store_nodes:
+            from api.sharding import parse_node
+            store_config["nodes"] = [parse_node(node) for node in opts.store_nodes.split(",")]
+    MainHTTPHandler.store_config = store_config
+    MAX_CLIENT_IDS = opts.max_client_ids
+    if opts.response_cache_ttl > 0:
+        response_cache = cache.ResponseCache(opts.response_cache_ttl, opts.response_cache_size)
+    tracing.configure(opts.trace_rate, opts.trace_file, opts.trace_endpoint)
+    server = ThreadingHTTPServer(("localhost", opts.port), MainHTTPHandler)
     logging.info("Starting server at %s" % opts.port)
     try:
         server.serve_forever()
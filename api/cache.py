@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+
+# current interests and their history, see api.history
+INTERESTS_PREFIXES = ("i:", "ih:", "il:")
+
+
+class Encoded(bytes):
+    """Response value that is already serialized to JSON."""
+
+
+class ResponseCache:
+    """Size-bounded LRU cache of serialized responses with a short TTL.
+
+    An entry is dropped as soon as one of the `i:<cid>`, `ih:<cid>` or
+    `il:<cid>` keys it was built from is written through a store it listens to (see
+    `BaseStore.add_listener`).  Writes that bypass the store are only
+    picked up when the entry expires.
+
+    Every such write bumps `generation`; a response is only stored if
+    the generation read before the store was read has not changed, so
+    a write racing the read can't leave a stale entry behind.
+    """
+
+    def __init__(self, ttl_sec=5, max_bytes=64 * 1024 * 1024):
+        self.ttl_sec = ttl_sec
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.by_client = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+
+    @staticmethod
+    def make_key(method, arguments):
+        """Hash of validated method arguments, None if they can't be hashed.
+
+        The arguments must be the cleaned values of a valid request, so
+        equal requests have equal arguments (client_ids sorted and unique).
+        """
+        try:
+            data = json.dumps([method, arguments], sort_keys=True, default=_canonical)
+        except TypeError:
+            return None
+        return hashlib.sha1(data.encode("utf-8")).digest()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[3]
+
+    def set(self, key, body, client_ids, ctx=None, generation=None):
+        """Store a response; skipped if `generation` is given and outdated."""
+        if len(body) > self.max_bytes:
+            return
+        client_ids = frozenset(client_ids)
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (time.monotonic() + self.ttl_sec, body, client_ids, dict(ctx or {}))
+            self.size += len(body)
+            for cid in client_ids:
+                self.by_client.setdefault(cid, set()).add(key)
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+
+    def _drop(self, key):
+        _, body, client_ids, _ = self.entries.pop(key)
+        self.size -= len(body)
+        for cid in client_ids:
+            keys = self.by_client.get(cid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_client[cid]
+
+    def invalidate(self, store_keys):
+        """Store listener: drop the entries built from the written interests keys."""
+        with self.lock:
+            for store_key in store_keys:
+                if not store_key.startswith(INTERESTS_PREFIXES):
+                    continue
+                self.generation += 1
+                try:
+                    cid = int(store_key.partition(":")[2])
+                except ValueError:
+                    continue
+                for key in list(self.by_client.get(cid, ())):
+                    self._drop(key)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.by_client.clear()
+            self.size = 0
+
+
+def _canonical(value):
+    if isinstance(value, array):
+        return value.tolist()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError("{} is not serializable".format(type(value).__name__))
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Client of the scoring API, sync and asyncio.
+
+    with client.Client("localhost", 8080, account="horns&hoofs", login="h&f") as c:
+        c.online_score(phone="79175002040", email="stupnikov@otus.ru")
+        c.online_scores([{"first_name": "a", "last_name": "b"}, ...])
+        c.clients_interests([1, 2, 3], date="20.07.2017")
+
+Connections are kept alive and reused from a pool, tokens are computed
+once per account (once per hour for the admin).  `online_scores` sends
+the calls in batches of `batch_size` through /batch/; on AsyncClient
+concurrent `online_score` calls made within `batch_delay` seconds of each
+other are coalesced into one batch request as well.
+"""
+
+import asyncio
+import collections
+import http.client
+import threading
+from datetime import datetime
+
+from api import api
+from api import codec
+from api import compression
+
+DEFAULT_BATCH_SIZE = 100
+RETRY_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                ConnectionResetError, BrokenPipeError)
+
+
+class APIError(Exception):
+    def __init__(self, code, error):
+        super().__init__("{}: {}".format(code, error))
+        self.code = code
+        self.error = error
+
+
+class TokenCache:
+    def __init__(self):
+        self.tokens = {}
+
+    def get(self, login, account):
+        now = datetime.now()
+        period = now.strftime("%Y%m%d%H") if login == api.ADMIN_LOGIN else None
+        cached = self.tokens.get((login, account))
+        if cached is None or cached[0] != period:
+            cached = self.tokens[login, account] = (period, api.make_token(login, account, now))
+        return cached[1]
+
+
+class BaseClient:
+    def __init__(self, host="localhost", port=8080, account="", login="", timeout=10,
+                 pool_size=8, batch_size=DEFAULT_BATCH_SIZE, compress=True):
+        self.host = host
+        self.port = port
+        self.account = account
+        self.login = login
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.batch_size = min(batch_size, api.MAX_BATCH_SIZE)
+        self.headers = {"Content-Type": "application/json"}
+        if compress:
+            self.headers["Accept-Encoding"] = ", ".join(compression.CODECS)
+        self.tokens = TokenCache()
+
+    def make_request(self, method, arguments):
+        return {"account": self.account, "login": self.login, "method": method,
+                "token": self.tokens.get(self.login, self.account), "arguments": arguments}
+
+    def parse_response(self, content_encoding, data):
+        reply = codec.loads(compression.decompress(data, content_encoding))
+        return reply.get("response"), reply.get("error"), reply["code"]
+
+    @staticmethod
+    def result(response, error, code):
+        if code != api.OK:
+            raise APIError(code, error)
+        return response
+
+    @staticmethod
+    def batch_results(response, error, code, return_exceptions):
+        if code != api.OK:
+            raise APIError(code, error)
+        results = []
+        for item in response:
+            if item["code"] == api.OK:
+                results.append(item["response"])
+            elif return_exceptions:
+                results.append(APIError(item["code"], item.get("error")))
+            else:
+                raise APIError(item["code"], item.get("error"))
+        return results
+
+    @staticmethod
+    def score(response):
+        return response["score"]
+
+    @staticmethod
+    def interests(response):
+        return {int(cid): interests for cid, interests in response.items()}
+
+
+class ConnectionPool:
+    """Idle keep-alive connections, the most recently used first."""
+
+    def __init__(self, host, port, timeout, size):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.size = size
+        self.idle = collections.deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def release(self, conn):
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, path, body, headers):
+        """Return (status, Content-Encoding, body); retries once on a stale connection."""
+        conn, reused = self.acquire()
+        while True:
+            try:
+                conn.request("POST", path, body, headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except RETRY_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                conn, reused = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+            except Exception:
+                conn.close()
+                raise
+        if response.will_close:
+            conn.close()
+        else:
+            self.release(conn)
+        return response.status, response.getheader("Content-Encoding"), data
+
+    def close(self):
+        with self.lock:
+            while self.idle:
+                self.idle.pop().close()
+
+
+class Client(BaseClient):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = ConnectionPool(self.host, self.port, self.timeout, self.pool_size)
+
+    def post(self, path, body):
+        _, content_encoding, data = self.pool.request(path, codec.dumps(body), self.headers)
+        return self.parse_response(content_encoding, data)
+
+    def call(self, method, arguments):
+        return self.result(*self.post("/method/", self.make_request(method, arguments)))
+
+    def batch(self, calls, return_exceptions=False):
+        """Results of (method, arguments) calls, batch_size calls per request."""
+        requests = [self.make_request(method, arguments) for method, arguments in calls]
+        results = []
+        for start in range(0, len(requests), self.batch_size):
+            reply = self.post("/batch/", requests[start:start + self.batch_size])
+            results.extend(self.batch_results(*reply, return_exceptions))
+        return results
+
+    def online_score(self, **arguments):
+        return self.score(self.call("online_score", arguments))
+
+    def online_scores(self, arguments_list, return_exceptions=False):
+        results = self.batch([("online_score", arguments) for arguments in arguments_list], return_exceptions)
+        return [r if isinstance(r, APIError) else self.score(r) for r in results]
+
+    def clients_interests(self, client_ids, date=None):
+        arguments = {"client_ids": list(client_ids)}
+        if date is not None:
+            arguments["date"] = date
+        return self.interests(self.call("clients_interests", arguments))
+
+    def close(self):
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class AsyncConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def request(self, host, path, body, headers):
+        """Return (status, Content-Encoding, body, keep alive)."""
+        lines = ["POST {} HTTP/1.1".format(path), "Host: {}".format(host),
+                 "Content-Length: {}".format(len(body))]
+        lines.extend("{}: {}".format(name, value) for name, value in headers.items())
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise http.client.RemoteDisconnected("Remote end closed connection without response")
+        version, status = status_line.split(None, 2)[:2]
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        length = response_headers.get("content-length")
+        if length is None:
+            data = await self.reader.read()
+        else:
+            data = await self.reader.readexactly(int(length))
+        keep_alive = (version == b"HTTP/1.1" and length is not None and
+                      response_headers.get("connection", "").lower() != "close")
+        return int(status), response_headers.get("content-encoding"), data, keep_alive
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncClient(BaseClient):
+    def __init__(self, *args, batch_delay=0.001, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_delay = batch_delay
+        self.idle = collections.deque()
+        self.slots = asyncio.Semaphore(self.pool_size)
+        self.pending = []
+        self.flush_handle = None
+        self.tasks = set()
+
+    async def request(self, path, body):
+        async with self.slots:
+            reused = bool(self.idle)
+            conn = self.idle.pop() if reused else await AsyncConnection.open(self.host, self.port)
+            while True:
+                try:
+                    _, content_encoding, data, keep_alive = await asyncio.wait_for(
+                        conn.request(self.host, path, body, self.headers), self.timeout)
+                    break
+                except (RETRY_ERRORS + (asyncio.IncompleteReadError,)):
+                    conn.close()
+                    if not reused:
+                        raise
+                    conn, reused = await AsyncConnection.open(self.host, self.port), False
+                except BaseException:
+                    conn.close()
+                    raise
+            if keep_alive:
+                self.idle.append(conn)
+            else:
+                conn.close()
+        return content_encoding, data
+
+    async def post(self, path, body):
+        return self.parse_response(*await self.request(path, codec.dumps(body)))
+
+    async def call(self, method, arguments):
+        return self.result(*await self.post("/method/", self.make_request(method, arguments)))
+
+    async def batch(self, calls, return_exceptions=False):
+        requests = [self.make_request(method, arguments) for method, arguments in calls]
+        replies = await asyncio.gather(*[self.post("/batch/", requests[start:start + self.batch_size])
+                                         for start in range(0, len(requests), self.batch_size)])
+        results = []
+        for reply in replies:
+            results.extend(self.batch_results(*reply, return_exceptions))
+        return results
+
+    async def online_score(self, **arguments):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((arguments, future))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.batch_delay, self.flush)
+        return self.score(await future)
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        pending, self.pending = self.pending, []
+        if pending:
+            task = asyncio.ensure_future(self.send_pending(pending))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def send_pending(self, pending):
+        try:
+            if len(pending) == 1:
+                results = [await self.call("online_score", pending[0][0])]
+            else:
+                results = await self.batch([("online_score", arguments) for arguments, _ in pending],
+                                           return_exceptions=True)
+        except Exception as e:
+            results = [e] * len(pending)
+        for (_, future), result in zip(pending, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def online_scores(self, arguments_list, return_exceptions=False):
+        results = await self.batch([("online_score", arguments) for arguments in arguments_list],
+                                   return_exceptions)
+        return [r if isinstance(r, APIError) else self.score(r) for r in results]
+
+    async def clients_interests(self, client_ids, date=None):
+        arguments = {"client_ids": list(client_ids)}
+        if date is not None:
+            arguments["date"] = date
+        return self.interests(await self.call("clients_interests", arguments))
+
+    async def close(self):
+        self.flush()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        while self.idle:
+            self.idle.pop().close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+        return False
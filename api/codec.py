@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""JSON codec used for request bodies, responses and stored interests.
+
+`loads` takes bytes (str and memoryview too), `dumps` returns bytes.
+orjson is used when it is installed, the stdlib json module otherwise;
+set API_JSON_CODEC=json|orjson to choose explicitly.  Both codecs accept
+the same documents: orjson hands everything it rejects (NaN, Infinity,
+lone surrogates) over to the stdlib parser.  The one difference left is
+that orjson decodes integers wider than 64 bits as floats; no request
+field accepts such a number either way, so responses do not change.
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StdlibCodec:
+    name = "json"
+
+    @staticmethod
+    def loads(data):
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(obj).encode("utf-8")
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    @staticmethod
+    def loads(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return StdlibCodec.loads(data)
+
+    @staticmethod
+    def dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+CODECS = {"json": StdlibCodec}
+if orjson is not None:
+    CODECS["orjson"] = OrjsonCodec
+
+current = None
+loads = None
+dumps = None
+
+
+def use(name=None):
+    """Switch to codec `name`, the fastest available one by default."""
+    global current, loads, dumps
+    if name is None:
+        name = "orjson" if "orjson" in CODECS else "json"
+    if name not in CODECS:
+        raise ValueError("Unknown or unavailable JSON codec: {}".format(name))
+    current = CODECS[name]
+    loads, dumps = current.loads, current.dumps
+    return current
+
+
+use(os.environ.get("API_JSON_CODEC") or None)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""HTTP content coding of request and response bodies.
+
+gzip and deflate are always available, zstd when the `zstandard`
+package is installed.  zlib and zstandard release the GIL while they
+work, so compressing a large response in one handler thread does not
+stall the others.
+"""
+
+import importlib.util
+import zlib
+
+# zstandard is imported the first time zstd is used: most workers never
+# see it, and importing it costs more than the rest of this module
+ZSTD_AVAILABLE = importlib.util.find_spec("zstandard") is not None
+
+MIN_SIZE = 1024
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+
+
+class DecompressionError(Exception):
+    pass
+
+
+def _zlib_compress(wbits):
+    def compress(data):
+        c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, wbits)
+        return c.compress(data) + c.flush()
+    return compress
+
+
+def _zlib_decompress(wbits):
+    def decompress(data, max_size):
+        d = zlib.decompressobj(wbits)
+        try:
+            out = d.decompress(data, max_size)
+        except zlib.error as e:
+            raise DecompressionError(e)
+        if d.unconsumed_tail:
+            raise DecompressionError("Decompressed body is larger than {} bytes".format(max_size))
+        if not d.eof:
+            raise DecompressionError("Truncated body")
+        return out
+    return decompress
+
+
+def _zstandard():
+    import zstandard
+    return zstandard
+
+
+def _zstd_compress(data):
+    return _zstandard().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+def _zstd_decompress(data, max_size):
+    # read at most max_size + 1 bytes, never the whole body of a bomb
+    zstandard = _zstandard()
+    chunks = []
+    size = 0
+    try:
+        with zstandard.ZstdDecompressor().stream_reader(data) as reader:
+            while size <= max_size:
+                chunk = reader.read(max_size + 1 - size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+    except zstandard.ZstdError as e:
+        raise DecompressionError(e)
+    if size > max_size:
+        raise DecompressionError("Decompressed body is larger than {} bytes".format(max_size))
+    return b"".join(chunks)
+
+
+# codec name -> (compress, decompress), in the order of server preference
+CODECS = {}
+if ZSTD_AVAILABLE:
+    CODECS["zstd"] = (_zstd_compress, _zstd_decompress)
+CODECS["gzip"] = (_zlib_compress(16 + zlib.MAX_WBITS), _zlib_decompress(16 + zlib.MAX_WBITS))
+CODECS["deflate"] = (_zlib_compress(zlib.MAX_WBITS), _zlib_decompress(zlib.MAX_WBITS))
+ALIASES = {"x-gzip": "gzip"}
+
+
+def parse_accept_encoding(header):
+    """Map coding -> q value from an Accept-Encoding header."""
+    accepted = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        coding = ALIASES.get(coding, coding)
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """Best supported coding the client accepts, None for identity."""
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for coding in CODECS:
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body, encoding):
+    return CODECS[encoding][0](body)
+
+
+def decompress(body, encoding, max_size=MAX_DECOMPRESSED_SIZE):
+    encoding = (encoding or "identity").strip().lower()
+    encoding = ALIASES.get(encoding, encoding)
+    if encoding == "identity":
+        return body
+    if encoding not in CODECS:
+        raise DecompressionError("Unsupported Content-Encoding: {}".format(encoding))
+    return CODECS[encoding][1](body, max_size)
@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Interests of clients as of a date.
+
+Every update of a client's interests is appended to its change log
+`il:<cid>`; once the log holds `compact_every` entries it is merged into
+the yearly segments `ih:<cid>:<year>` it touches and emptied.  The newest
+interests stay in `i:<cid>`, so requests without a date do not touch the
+history.
+
+Segments and their directory `ih:<cid>` are strings, so they are stored as
+is by every backend.  A segment holds the entries of one year:
+
+    "H1", count: 8 hex digits, dates: count * 6 hex digits (date ordinals,
+    ascending), offsets: (count + 1) * 8 hex digits, blob of JSON lists
+
+the directory the year, first and last date of every segment:
+
+    "D1", segments: 4 + 6 + 6 hex digits each, by year
+
+A dated query reads the directory and the log, then the one segment
+holding the last entry up to the date, bisects its fixed width dates and
+decodes the one JSON list it needs.  Neither the transfer nor the parsing
+grows with the years of history, and compaction rewrites only the
+segments the log touches.  Clients without history and dates from the
+newest entry of the history on are served from `i:<cid>`, which a backfill
+of older updates does not overwrite.
+
+    python3 -m api.history --redis localhost:6379/0 ingest updates.jsonl
+    python3 -m api.history --redis localhost:6379/0 compact
+
+An update line is {"cid": 1, "date": "19.07.2017", "interests": [...]}.
+Ingestion reads and rewrites the log of a client, run one writer at a time.
+"""
+
+import json
+import logging
+from datetime import date as Date
+from datetime import datetime
+
+from api import codec
+
+INTERESTS_PREFIX = "i:"
+HISTORY_PREFIX = "ih:"
+LOG_PREFIX = "il:"
+MAGIC = "H1"
+DIRECTORY_MAGIC = "D1"
+YEAR_WIDTH = 4
+COUNT_WIDTH = 8
+DATE_WIDTH = 6
+OFFSET_WIDTH = 8
+DEFAULT_COMPACT_EVERY = 64
+
+
+def to_ordinal(date):
+    return date.toordinal()
+
+
+def year_of(ordinal):
+    return Date.fromordinal(ordinal).year
+
+
+def segment_key(cid, year):
+    return "{}{}:{}".format(HISTORY_PREFIX, cid, year)
+
+
+class HistoryIndex:
+    """Read view of an encoded segment."""
+
+    def __init__(self, data):
+        if not data.startswith(MAGIC):
+            raise ValueError("Not an interests history index")
+        self.data = data
+        self.count = int(data[len(MAGIC):len(MAGIC) + COUNT_WIDTH], 16)
+        self.dates_at = len(MAGIC) + COUNT_WIDTH
+        self.offsets_at = self.dates_at + self.count * DATE_WIDTH
+        self.blob_at = self.offsets_at + (self.count + 1) * OFFSET_WIDTH
+
+    @staticmethod
+    def build(entries):
+        """Encode (date ordinal, interests) pairs sorted by date."""
+        blobs = [json.dumps(interests, separators=(",", ":")) for _, interests in entries]
+        offsets = [0]
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+        return "".join([MAGIC, "%0*x" % (COUNT_WIDTH, len(entries))] +
+                       ["%0*x" % (DATE_WIDTH, date) for date, _ in entries] +
+                       ["%0*x" % (OFFSET_WIDTH, offset) for offset in offsets] + blobs)
+
+    def __len__(self):
+        return self.count
+
+    def date(self, i):
+        start = self.dates_at + i * DATE_WIDTH
+        return int(self.data[start:start + DATE_WIDTH], 16)
+
+    def offset(self, i):
+        start = self.offsets_at + i * OFFSET_WIDTH
+        return int(self.data[start:start + OFFSET_WIDTH], 16)
+
+    def interests(self, i):
+        return codec.loads(self.data[self.blob_at + self.offset(i):self.blob_at + self.offset(i + 1)])
+
+    def find(self, ordinal):
+        """Position of the last entry dated `ordinal` or earlier, -1 if none."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.date(middle) <= ordinal:
+                low = middle + 1
+            else:
+                high = middle
+        return low - 1
+
+    def entries(self):
+        return [(self.date(i), self.interests(i)) for i in range(self.count)]
+
+
+class Directory:
+    """Read view of the (year, first date, last date) of the segments of a client."""
+
+    WIDTH = YEAR_WIDTH + 2 * DATE_WIDTH
+
+    def __init__(self, data):
+        if not data.startswith(DIRECTORY_MAGIC) or (len(data) - len(DIRECTORY_MAGIC)) % self.WIDTH:
+            raise ValueError("Not an interests history directory")
+        self.data = data
+        self.count = (len(data) - len(DIRECTORY_MAGIC)) // self.WIDTH
+
+    @staticmethod
+    def build(segments):
+        """Encode (year, first date, last date) triples."""
+        return "".join([DIRECTORY_MAGIC] + ["%0*x%0*x%0*x" % (YEAR_WIDTH, year, DATE_WIDTH, first, DATE_WIDTH, last)
+                                            for year, first, last in sorted(segments)])
+
+    def __len__(self):
+        return self.count
+
+    def segment(self, i):
+        start = len(DIRECTORY_MAGIC) + i * self.WIDTH
+        first_at = start + YEAR_WIDTH
+        last_at = first_at + DATE_WIDTH
+        return (int(self.data[start:first_at], 16), int(self.data[first_at:last_at], 16),
+                int(self.data[last_at:last_at + DATE_WIDTH], 16))
+
+    def first_date(self, i):
+        start = len(DIRECTORY_MAGIC) + i * self.WIDTH + YEAR_WIDTH
+        return int(self.data[start:start + DATE_WIDTH], 16)
+
+    def find(self, ordinal):
+        """Year of the segment with the last entry dated `ordinal` or earlier, None if none."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.first_date(middle) <= ordinal:
+                low = middle + 1
+            else:
+                high = middle
+        return self.segment(low - 1)[0] if low else None
+
+    def last_date(self):
+        return self.segment(self.count - 1)[2] if self.count else None
+
+    def segments(self):
+        return [self.segment(i) for i in range(self.count)]
+
+
+def compact(index, log):
+    """Segment data merging `log` into the segment `index` (HistoryIndex or None).
+
+    Of the entries of one date the last logged wins, an entry equal to
+    the one before it is dropped.
+    """
+    entries = index.entries() if index is not None else []
+    # sorted() is stable: the log keeps its order within a date
+    merged = sorted(entries + [(date, interests) for date, interests in log], key=lambda e: e[0])
+    result = []
+    for date, interests in merged:
+        if result and result[-1][0] == date:
+            result[-1] = (date, interests)
+        else:
+            result.append((date, interests))
+    deduplicated = []
+    for date, interests in result:
+        if not deduplicated or deduplicated[-1][1] != interests:
+            deduplicated.append((date, interests))
+    return HistoryIndex.build(deduplicated)
+
+
+def interests_as_of(index, log, ordinal):
+    """Interests at the end of the day `ordinal`, [] before the first entry."""
+    found_date, found = None, []
+    if index is not None:
+        i = index.find(ordinal)
+        if i >= 0:
+            found_date, found = index.date(i), index.interests(i)
+    for date, interests in log:
+        if date <= ordinal and (found_date is None or date >= found_date):
+            found_date, found = date, interests
+    return found
+
+
+def parse(directory_data, log_data):
+    directory = Directory(directory_data) if directory_data else None
+    log = codec.loads(log_data) if log_data else []
+    return directory, log
+
+
+def get_interests_many(store, cids, date):
+    """Interests of `cids` as of `date`, the current ones for clients without history."""
+    n = len(cids)
+    values = store.get_many(["%s%s" % (prefix, cid) for prefix in (HISTORY_PREFIX, LOG_PREFIX, INTERESTS_PREFIX)
+                             for cid in cids])
+    ordinal = to_ordinal(date)
+    result = []
+    lookups = []
+    for cid, directory_data, log_data, current in zip(cids, values[:n], values[n:2 * n], values[2 * n:]):
+        directory, log = parse(directory_data, log_data)
+        newest = latest_date(directory, log)
+        if current and (newest is None or ordinal >= newest):
+            result.append(codec.loads(current))
+            continue
+        year = directory.find(ordinal) if directory is not None else None
+        lookups.append((len(result), year is not None and segment_key(cid, year), log))
+        result.append(None)
+    keys = [key for _, key, _ in lookups if key]
+    segments = iter(store.get_many(keys) if keys else [])
+    for i, key, log in lookups:
+        data = next(segments) if key else None
+        result[i] = interests_as_of(HistoryIndex(data) if data else None, log, ordinal)
+    return result
+
+
+def latest_date(directory, log):
+    dates = [date for date, _ in log]
+    if directory is not None and len(directory):
+        dates.append(directory.last_date())
+    return max(dates, default=None)
+
+
+def compaction_writes(store, clients):
+    """Writes merging the logs of (cid, Directory or None, log) into their segments.
+
+    Only the segments of the years a log touches are read and rewritten.
+    """
+    touched = []
+    for cid, _, log in clients:
+        by_year = {}
+        for date, interests in log:
+            by_year.setdefault(year_of(date), []).append((date, interests))
+        touched.extend((cid, year, year_log) for year, year_log in sorted(by_year.items()))
+    values = store.get_many([segment_key(cid, year) for cid, year, _ in touched]) if touched else []
+    writes = []
+    dates = {}
+    for (cid, year, year_log), data in zip(touched, values):
+        merged = compact(HistoryIndex(data) if data else None, year_log)
+        segment = HistoryIndex(merged)
+        writes.append((segment_key(cid, year), merged))
+        dates.setdefault(cid, {})[year] = (segment.date(0), segment.date(len(segment) - 1))
+    # segments first: a reader never finds a directory entry without its segment
+    for cid, directory, _ in clients:
+        years = {year: (first, last) for year, first, last in directory.segments()} if directory else {}
+        years.update(dates.get(cid, {}))
+        writes.append((HISTORY_PREFIX + str(cid),
+                       Directory.build([(year, first, last) for year, (first, last) in years.items()])))
+        writes.append((LOG_PREFIX + str(cid), "[]"))
+    return writes
+
+
+def ingest(store, updates, compact_every=DEFAULT_COMPACT_EVERY):
+    """Append (cid, date, interests) updates; returns the number of compacted logs.
+
+    `i:<cid>` is rewritten when an update is the newest one of a client
+    with history, or when the client has no `i:<cid>` yet.
+    """
+    by_client = {}
+    for cid, date, interests in updates:
+        by_client.setdefault(cid, []).append((to_ordinal(date), interests))
+    cids = list(by_client)
+    n = len(cids)
+    values = store.get_many(["%s%s" % (prefix, cid) for prefix in (HISTORY_PREFIX, LOG_PREFIX, INTERESTS_PREFIX)
+                             for cid in cids])
+    writes = []
+    full = []
+    for cid, directory_data, log_data, known in zip(cids, values[:n], values[n:2 * n], values[2 * n:]):
+        directory, log = parse(directory_data, log_data)
+        newest = latest_date(directory, log)
+        current = None
+        for date, interests in by_client[cid]:
+            log.append([date, interests])
+            if newest is None or date >= newest:
+                newest, current = date, interests
+        if known and not (directory_data or log_data):
+            # interests set before the history of the client began are newer than its backfill
+            current = None
+        if len(log) >= compact_every:
+            full.append((cid, directory, log))
+        else:
+            writes.append((LOG_PREFIX + str(cid), codec.dumps(log).decode("utf-8")))
+        if current is not None:
+            writes.append((INTERESTS_PREFIX + str(cid), json.dumps(current)))
+    writes.extend(compaction_writes(store, full))
+    if writes:
+        store.set_many(writes)
+    return len(full)
+
+
+def compact_many(store, cids):
+    """Merge the logs of `cids` into their segments."""
+    cids = list(cids)
+    n = len(cids)
+    values = store.get_many(["%s%s" % (prefix, cid) for prefix in (HISTORY_PREFIX, LOG_PREFIX) for cid in cids])
+    clients = []
+    for cid, directory_data, log_data in zip(cids, values[:n], values[n:]):
+        directory, log = parse(directory_data, log_data)
+        if log:
+            clients.append((cid, directory, log))
+    writes = compaction_writes(store, clients)
+    if writes:
+        store.set_many(writes)
+    return len(clients)
+
+
+def read_updates(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                update = json.loads(line)
+                yield int(update["cid"]), datetime.strptime(update["date"], "%d.%m.%Y"), update["interests"]
+
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    from api import store
+    from api.sharding import parse_node
+
+    op = OptionParser(usage="%prog --redis HOST:PORT/DB (ingest FILE.jsonl... | compact)")
+    op.add_option("--redis", action="store", default="localhost:6379/0")
+    op.add_option("--batch", action="store", type=int, default=1000)
+    op.add_option("--compact-every", action="store", type=int, default=DEFAULT_COMPACT_EVERY)
+    (opts, args) = op.parse_args()
+    if not args or args[0] not in ("ingest", "compact"):
+        op.error("a command is required: ingest or compact")
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
+    db = store.Store(parse_node(opts.redis))
+    if args[0] == "ingest":
+        count = compacted = 0
+        for path in args[1:]:
+            for batch in batches(read_updates(path), opts.batch):
+                compacted += ingest(db, batch, opts.compact_every)
+                count += len(batch)
+        logging.info("{} updates ingested, {} logs compacted".format(count, compacted))
+    else:
+        cids = (key[len(LOG_PREFIX):] for key in db.db.scan_iter(match=LOG_PREFIX + "*", count=opts.batch))
+        compacted = sum(compact_many(db, batch) for batch in batches(cids, opts.batch))
+        logging.info("{} logs compacted".format(compacted))
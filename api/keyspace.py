@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Capacity report of the `uid:` score, `i:` interest and `ih:`/`il:` history keys.
+
+    python3 -m api.keyspace --redis localhost:6379/0 [--sample 0.1] [--batch 500] [--pause 0.01]
+    python3 -m api.keyspace --redis localhost:6379/0 --purge [--purge-rate 1000] [--dry-run]
+
+The keyspace is walked with SCAN; for a sample of the keys MEMORY USAGE,
+TTL and the value are fetched in one pipeline per batch, so the server
+only ever runs short commands and `--pause` leaves it room between
+batches.  Counts are exact, sizes and TTLs are scaled from the sample.
+
+Score keys expire after their TTL.  Versions of `Store.cache_set` that
+passed the TTL as the NX flag left `uid:` keys without an expiry;
+`--purge` is a one-off cleanup of those leftovers after an upgrade and
+deletes them at `--purge-rate` keys per second.  A score is computed
+again on the next request for it.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from collections import Counter
+
+from api import codec
+
+PREFIXES = ("uid:", "i:", "ih:", "il:")
+OTHER = "other"
+# cost of a field/value pair in a small listpack encoded hash
+HASH_FIELD_OVERHEAD = 4
+NO_TTL = -1
+
+
+def key_prefix(key):
+    for prefix in PREFIXES:
+        if key.startswith(prefix.encode()):
+            return prefix
+    return OTHER
+
+
+class Histogram:
+    """Counts in power of two buckets: bucket b holds [2**(b-1), 2**b)."""
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.total = 0
+        self.count = 0
+
+    def add(self, value, weight=1):
+        self.buckets[max(int(value), 0).bit_length()] += weight
+        self.total += value * weight
+        self.count += weight
+
+    @staticmethod
+    def bucket_range(bucket):
+        if bucket == 0:
+            return 0, 0
+        return 2 ** (bucket - 1), 2 ** bucket - 1
+
+    def format(self, unit="", width=40):
+        if not self.count:
+            return "    (empty)"
+        peak = max(self.buckets.values())
+        lines = []
+        for bucket in range(min(self.buckets), max(self.buckets) + 1):
+            low, high = self.bucket_range(bucket)
+            count = self.buckets.get(bucket, 0)
+            lines.append("    {:>10}-{:<10} {:>12.0f} {}".format(
+                "{}{}".format(low, unit), "{}{}".format(high, unit), count, "#" * round(width * count / peak)))
+        return "\n".join(lines)
+
+
+def compact_json_saving(key, value, memory):
+    """Bytes saved by JSON without spaces and \\u escapes."""
+    try:
+        data = codec.loads(value)
+    except ValueError:
+        return 0
+    compact = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return max(len(value) - len(compact), 0)
+
+
+def interest_ids_saving(key, value, memory):
+    """Bytes saved by storing one byte id per interest instead of JSON."""
+    try:
+        data = codec.loads(value)
+    except ValueError:
+        return 0
+    if not isinstance(data, list):
+        return 0
+    return max(len(value) - len(data), 0)
+
+
+def binary_key_saving(key, value, memory):
+    """Bytes saved by a raw 16 byte md5 instead of its 32 hex digits."""
+    return 16 if len(key) == len("uid:") + 32 else 0
+
+
+def hash_bucket_saving(key, value, memory):
+    """Bytes saved by moving the key into a small hash of ~100 keys."""
+    if memory is None:
+        return 0
+    return max(memory - (len(key) + len(value) + HASH_FIELD_OVERHEAD), 0)
+
+
+ENCODINGS = {
+    "uid:": [("binary md5 key", binary_key_saving), ("hash buckets", hash_bucket_saving)],
+    "i:": [("compact json", compact_json_saving), ("interest ids", interest_ids_saving),
+           ("hash buckets", hash_bucket_saving)],
+    "ih:": [],
+    "il:": [("compact json", compact_json_saving)],
+    OTHER: [],
+}
+
+
+class PrefixStats:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.keys = 0
+        self.sampled = 0
+        self.memory = Histogram()
+        self.value_size = Histogram()
+        self.ttl = Histogram()
+        self.no_ttl = 0
+        self.savings = Counter()
+
+    def add_sample(self, key, value, memory, ttl, weight):
+        self.sampled += 1
+        if memory is not None:
+            self.memory.add(memory, weight)
+        if value is not None:
+            self.value_size.add(len(value), weight)
+            for name, saving in ENCODINGS[self.prefix]:
+                self.savings[name] += saving(key, value, memory) * weight
+        if ttl == NO_TTL:
+            self.no_ttl += weight
+        elif ttl is not None and ttl >= 0:
+            self.ttl.add(ttl, weight)
+
+    def format(self):
+        lines = ["{}  keys: {}  sampled: {}  memory: ~{:.0f} bytes  without ttl: ~{:.0f}".format(
+            self.prefix, self.keys, self.sampled, self.memory.total, self.no_ttl)]
+        lines.append("  memory usage per key:")
+        lines.append(self.memory.format("B"))
+        lines.append("  value size:")
+        lines.append(self.value_size.format("B"))
+        lines.append("  ttl of expiring keys:")
+        lines.append(self.ttl.format("s"))
+        for name, saved in sorted(self.savings.items()):
+            share = saved / self.memory.total if self.memory.total else 0
+            lines.append("  {:<16} saves ~{:.0f} bytes ({:.1%})".format(name, saved, share))
+        return "\n".join(lines)
+
+
+class RateLimiter:
+    def __init__(self, rate):
+        self.rate = rate
+        self.next_at = time.monotonic()
+
+    def wait(self, n=1):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(self.next_at, now) + n / self.rate
+
+
+def scan_batches(client, batch_size=500, match=None, pause=0.0):
+    batch = []
+    for key in client.scan_iter(match=match, count=batch_size):
+        batch.append(key)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+            if pause:
+                time.sleep(pause)
+    if batch:
+        yield batch
+
+
+def in_sample(key, rate):
+    """Stable choice of keys, the same keys are sampled on every run."""
+    if rate >= 1:
+        return True
+    return int.from_bytes(hashlib.md5(key).digest()[:8], "big") < rate * 2 ** 64
+
+
+def analyze(client, sample_rate=1.0, batch_size=500, pause=0.0):
+    """Return {prefix: PrefixStats} of the keyspace of a redis client."""
+    stats = {prefix: PrefixStats(prefix) for prefix in PREFIXES + (OTHER,)}
+    weight = 1 / sample_rate
+    for keys in scan_batches(client, batch_size, pause=pause):
+        sampled = []
+        for key in keys:
+            prefix = key_prefix(key)
+            stats[prefix].keys += 1
+            if in_sample(key, sample_rate):
+                sampled.append((key, prefix))
+        if not sampled:
+            continue
+        pipe = client.pipeline(transaction=False)
+        for key, _ in sampled:
+            pipe.memory_usage(key)
+            pipe.ttl(key)
+            pipe.get(key)
+        replies = pipe.execute(raise_on_error=False)
+        for i, (key, prefix) in enumerate(sampled):
+            memory, ttl, value = [None if isinstance(r, Exception) else r for r in replies[3 * i:3 * i + 3]]
+            if ttl == -2:
+                continue
+            stats[prefix].add_sample(key, value, memory, ttl, weight)
+    return stats
+
+
+def purge_persistent_scores(client, rate=1000, batch_size=500, dry_run=False):
+    """Delete leftover `uid:` keys without expiry, at most `rate` keys per second.
+
+    A key that got a TTL between the check and the delete is deleted as
+    well, that only costs a recomputation of its score.
+    """
+    limiter = RateLimiter(rate)
+    found = 0
+    for keys in scan_batches(client, batch_size, match="uid:*"):
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.ttl(key)
+        persistent = [key for key, ttl in zip(keys, pipe.execute()) if ttl == NO_TTL]
+        found += len(persistent)
+        for start in range(0, len(persistent), 100):
+            chunk = persistent[start:start + 100]
+            limiter.wait(len(chunk))
+            if not dry_run:
+                client.delete(*chunk)
+    return found
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    import redis
+
+    from api.sharding import parse_node
+
+    op = OptionParser(usage="%prog --redis HOST:PORT/DB [--sample 0.1] [--purge [--purge-rate 1000]]")
+    op.add_option("--redis", action="store", default="localhost:6379/0")
+    op.add_option("--sample", action="store", type=float, default=1.0)
+    op.add_option("--batch", action="store", type=int, default=500)
+    op.add_option("--pause", action="store", type=float, default=0.0,
+                  help="seconds to sleep between SCAN batches")
+    op.add_option("--purge", action="store_true", default=False)
+    op.add_option("--purge-rate", action="store", type=float, default=1000)
+    op.add_option("--dry-run", action="store_true", default=False)
+    (opts, args) = op.parse_args()
+    if not 0 < opts.sample <= 1:
+        op.error("--sample must be in (0, 1]")
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
+    client = redis.StrictRedis(**parse_node(opts.redis))
+    if opts.purge:
+        count = purge_persistent_scores(client, opts.purge_rate, opts.batch, opts.dry_run)
+        logging.info("{} uid: keys without expiry {}".format(count, "found" if opts.dry_run else "deleted"))
+    else:
+        for prefix_stats in analyze(client, opts.sample, opts.batch, opts.pause).values():
+            if prefix_stats.keys:
+                print(prefix_stats.format())
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Scores computed ahead of the requests that need them.
+
+User profile change events are read in batches from a queue, a tailed
+file or a Redis stream.  A profile is validated like `online_score`
+arguments and its score is written under the `uid:` key `get_score`
+looks up, so the request finds it cached:
+
+    {"profile": {"phone": "79175002040", "email": "a@b.ru", ...}, "ts": 1500000000.5}
+    {"op": "delete", "profile": {...}}
+
+A delete event removes the key of its profile.  Keys cover exactly the
+fields of the profile, the event should carry the arguments of the
+requests that will ask for the score.  `ts` is the time of the change
+(unix seconds, for a stream the entry id by default); the lag of an
+event is the time from the change to the write of its score.
+
+    python3 -m api.precompute --redis localhost:6379/0 --tail events.jsonl [--from-start]
+    python3 -m api.precompute --redis localhost:6379/0 --stream profiles [--checkpoint-key KEY]
+
+Metrics (events, per second, lag) are logged every `--stats-interval`
+seconds and available as `Metrics.snapshot()`.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+
+from api import api
+from api import codec
+from api import scoring
+from api import store as store_module
+
+UPSERT = "upsert"
+DELETE = "delete"
+OPS = (UPSERT, DELETE)
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_BATCH_TIMEOUT = 0.1
+STREAM_FIELD = "event"
+
+
+def parse_event(data):
+    """Return (op, uid key, score) of an event, raise ValueError if it is invalid."""
+    event = codec.loads(data) if isinstance(data, (bytes, str)) else data
+    if not isinstance(event, dict):
+        raise ValueError("Event is not an object")
+    op = event.get("op", UPSERT)
+    if op not in OPS:
+        raise ValueError("Unknown op: {}".format(op))
+    if not isinstance(event.get("profile"), dict):
+        raise ValueError("Profile is not an object")
+    profile = api.OnlineScoreRequest(event["profile"])
+    if not profile.is_valid():
+        raise ValueError("Invalid profile: {}".format(", ".join(profile.errors)))
+    args = (profile.phone, profile.email, profile.birthday, profile.gender, profile.first_name, profile.last_name)
+    return op, scoring.score_key(*args), scoring.compute_score(*args)
+
+
+def event_time(data, default=None):
+    if isinstance(data, (bytes, str)):
+        try:
+            data = codec.loads(data)
+        except ValueError:
+            return default
+    ts = data.get("ts") if isinstance(data, dict) else None
+    return ts if isinstance(ts, (int, float)) and not isinstance(ts, bool) else default
+
+
+class QueueSource:
+    """Events put on a `queue.Queue`, as dicts or JSON."""
+
+    def __init__(self, events=None):
+        self.events = events if events is not None else queue.Queue()
+
+    def read(self, max_events, timeout):
+        """Return (event, time of the change) pairs, waiting up to `timeout` for the first."""
+        try:
+            batch = [self.events.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < max_events:
+            try:
+                batch.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        return [(data, event_time(data)) for data in batch]
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileTailSource:
+    """JSON lines appended to a file; follows truncation and rotation."""
+
+    def __init__(self, path, from_start=False, poll_interval=0.05):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.file = None
+        self.partial = b""
+        self.open(from_start)
+
+    def open(self, from_start=True):
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+        self.partial = b""
+        try:
+            self.file = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        if not from_start:
+            self.file.seek(0, os.SEEK_END)
+
+    def replaced(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if self.file is None:
+            return True
+        current = os.fstat(self.file.fileno())
+        return stat.st_ino != current.st_ino or stat.st_size < self.file.tell()
+
+    def read_lines(self, max_events):
+        if self.file is None:
+            return []
+        lines = []
+        while len(lines) < max_events:
+            line = self.file.readline()
+            if not line:
+                break
+            if not line.endswith(b"\n"):
+                self.partial += line
+                break
+            line, self.partial = self.partial + line, b""
+            if line.strip():
+                lines.append(line)
+        return lines
+
+    def read(self, max_events, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            lines = self.read_lines(max_events)
+            if lines:
+                return [(line, event_time(line)) for line in lines]
+            if self.replaced():
+                # the rest of a rotated file is lost, it is written to the new one
+                self.open()
+                continue
+            if time.monotonic() >= deadline:
+                return []
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+    def commit(self):
+        pass
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def stream_entries(reply):
+    """(id, fields) of the one stream in an XREAD reply, in any of the shapes redis-py parses it into."""
+    if not reply:
+        return []
+    entries = next(iter(reply.values())) if isinstance(reply, dict) else reply[0][1]
+    if entries and isinstance(entries[0], list):
+        # RESP3 replies wrap the entries in one more list
+        entries = entries[0]
+    return [entry for entry in entries if entry[0] is not None]
+
+
+def stream_id_time(entry_id):
+    return int(entry_id.split("-")[0]) / 1000
+
+
+class RedisStreamSource:
+    """Entries of a Redis stream with the event JSON in the `event` field.
+
+    The id of the last processed entry is saved to `checkpoint_key` on
+    commit and reading resumes after it; without a checkpoint reading
+    starts at the end of the stream or, with `from_start`, at its head.
+    Events are processed at least once.
+    """
+
+    def __init__(self, client, stream, checkpoint_key=None, from_start=False):
+        self.client = client
+        self.stream = stream
+        self.checkpoint_key = checkpoint_key
+        self.last_id = client.get(checkpoint_key) if checkpoint_key else None
+        if self.last_id is None:
+            self.last_id = "0-0" if from_start else self.tail_id()
+        self.read_id = self.last_id
+
+    def read(self, max_events, timeout):
+        reply = self.client.xread({self.stream: self.read_id}, count=max_events, block=max(int(timeout * 1000), 1))
+        entries = stream_entries(reply)
+        if not entries:
+            return []
+        self.read_id = entries[-1][0]
+        return [(fields.get(STREAM_FIELD, ""), event_time(fields.get(STREAM_FIELD, ""), stream_id_time(entry_id)))
+                for entry_id, fields in entries]
+
+    def tail_id(self):
+        entries = self.client.xrevrange(self.stream, count=1)
+        return entries[0][0] if entries else "0-0"
+
+    def commit(self):
+        if self.checkpoint_key and self.read_id != self.last_id:
+            self.client.set(self.checkpoint_key, self.read_id)
+        self.last_id = self.read_id
+
+    def close(self):
+        self.client.close()
+
+
+class Metrics:
+    """Counters of a pipeline; lag in seconds from the change to the write."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.events = 0
+        self.written = 0
+        self.deleted = 0
+        self.invalid = 0
+        self.batches = 0
+        self.lag = None
+        self.max_lag = None
+        self.window_started = self.started
+        self.window_events = 0
+
+    def observe(self, events, written, deleted, invalid, lags):
+        with self.lock:
+            self.events += events
+            self.written += written
+            self.deleted += deleted
+            self.invalid += invalid
+            self.batches += 1
+            self.window_events += events
+            if lags:
+                self.lag = max(lags)
+                self.max_lag = self.lag if self.max_lag is None else max(self.max_lag, self.lag)
+
+    def snapshot(self, reset_window=True):
+        """Totals, events per second overall and since the last snapshot, last and max lag."""
+        with self.lock:
+            now = time.monotonic()
+            window = now - self.window_started
+            result = {
+                "events": self.events,
+                "written": self.written,
+                "deleted": self.deleted,
+                "invalid": self.invalid,
+                "batches": self.batches,
+                "events_per_sec": self.events / (now - self.started) if now > self.started else 0.0,
+                "recent_events_per_sec": self.window_events / window if window > 0 else 0.0,
+                "lag_sec": self.lag,
+                "max_lag_sec": self.max_lag,
+            }
+            if reset_window:
+                self.window_started = now
+                self.window_events = 0
+            return result
+
+    def format(self):
+        s = self.snapshot()
+        lag = "-" if s["lag_sec"] is None else "{:.3f}s".format(s["lag_sec"])
+        max_lag = "-" if s["max_lag_sec"] is None else "{:.3f}s".format(s["max_lag_sec"])
+        return "{} events ({:.0f}/s, now {:.0f}/s), {} written, {} deleted, {} invalid, lag {} (max {})".format(
+            s["events"], s["events_per_sec"], s["recent_events_per_sec"], s["written"], s["deleted"],
+            s["invalid"], lag, max_lag)
+
+
+class Precomputer:
+    def __init__(self, store, source, batch_size=DEFAULT_BATCH_SIZE, batch_timeout=DEFAULT_BATCH_TIMEOUT,
+                 ttl_sec=scoring.SCORE_TTL_SEC, metrics=None):
+        self.store = store
+        self.source = source
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.ttl_sec = ttl_sec
+        self.metrics = metrics or Metrics()
+
+    def process(self, events):
+        """Write the scores of a batch of (event, change time) pairs; the last event of a key wins."""
+        ops = {}
+        invalid = 0
+        for data, _ in events:
+            try:
+                op, key, score = parse_event(data)
+            except ValueError as e:
+                invalid += 1
+                logging.warning("Invalid event: {}".format(e))
+                continue
+            ops.pop(key, None)
+            ops[key] = (op, score)
+        writes = [(key, score) for key, (op, score) in ops.items() if op == UPSERT]
+        deletes = [key for key, (op, _) in ops.items() if op == DELETE]
+        if writes:
+            # overwrite: a repeated event refreshes the value and the expiry of a key
+            self.store.set_many(writes, self.ttl_sec)
+        if deletes:
+            self.store.cache_delete_many(deletes)
+        now = time.time()
+        lags = [now - ts for _, ts in events if ts is not None]
+        self.metrics.observe(len(events), len(writes), len(deletes), invalid, lags)
+        return len(writes), len(deletes)
+
+    def run_once(self):
+        events = self.source.read(self.batch_size, self.batch_timeout)
+        if events:
+            self.process(events)
+            self.source.commit()
+        return len(events)
+
+    def run(self, stop=None, max_events=None, stats_interval=None):
+        """Process batches until `stop` (threading.Event) is set or `max_events` are processed."""
+        count = 0
+        next_stats = time.monotonic() + stats_interval if stats_interval else None
+        while not (stop is not None and stop.is_set()) and (max_events is None or count < max_events):
+            count += self.run_once()
+            if next_stats is not None and time.monotonic() >= next_stats:
+                logging.info(self.metrics.format())
+                next_stats = time.monotonic() + stats_interval
+        return count
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    import redis
+
+    from api.sharding import parse_node
+
+    op = OptionParser(usage="%prog --redis HOST:PORT/DB (--tail FILE | --stream NAME) [--from-start]")
+    op.add_option("--redis", action="store", default="localhost:6379/0")
+    op.add_option("--tail", action="store", default=None)
+    op.add_option("--stream", action="store", default=None)
+    op.add_option("--checkpoint-key", action="store", default=None,
+                  help="key that keeps the last processed stream entry id")
+    op.add_option("--from-start", action="store_true", default=False)
+    op.add_option("--batch", action="store", type=int, default=DEFAULT_BATCH_SIZE)
+    op.add_option("--batch-timeout", action="store", type=float, default=DEFAULT_BATCH_TIMEOUT)
+    op.add_option("--stats-interval", action="store", type=float, default=10.0)
+    (opts, args) = op.parse_args()
+    if bool(opts.tail) == bool(opts.stream):
+        op.error("one of --tail and --stream is required")
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
+    redis_config = parse_node(opts.redis)
+    if opts.tail:
+        source = FileTailSource(opts.tail, opts.from_start)
+    else:
+        source = RedisStreamSource(redis.StrictRedis(**redis_config, decode_responses=True), opts.stream,
+                                   opts.checkpoint_key or "precompute:" + opts.stream, opts.from_start)
+    precomputer = Precomputer(store_module.Store(redis_config), source, opts.batch, opts.batch_timeout)
+    try:
+        precomputer.run(stats_interval=opts.stats_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        source.close()
+        logging.info(precomputer.metrics.format())
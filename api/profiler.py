@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""On-demand profiling of a running server.
+
+`sample_stacks` polls the stacks of all other threads at a fixed
+interval and returns them in the collapsed format of flamegraph.pl
+("frame;frame;frame count").  `collect_allocations` traces memory
+allocations with tracemalloc and groups the top allocation sites by
+request method; requests running at the same time in other threads are
+attributed to each other, so use it on a quiet worker for exact numbers.
+"""
+
+import contextlib
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+MAX_SECONDS = 60
+# shorter intervals make the sampler spin holding the GIL
+MIN_INTERVAL = 0.001
+TRACEMALLOC_FRAMES = 10
+
+lock = threading.Lock()
+_allocations = None
+_null_context = contextlib.nullcontext()
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return "{}:{}".format(os.path.basename(code.co_filename), code.co_name)
+
+
+def collapse(frame):
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(seconds, interval=0.01):
+    """Return (number of samples, Counter of collapsed stacks)."""
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident != me:
+                stacks["{};{}".format(names.get(ident, ident), collapse(frame))] += 1
+        samples += 1
+        time.sleep(interval)
+        if len(names) != threading.active_count():
+            names = {t.ident: t.name for t in threading.enumerate()}
+    return samples, stacks
+
+
+def format_collapsed(stacks):
+    return "\n".join("{} {}".format(stack, count) for stack, count in stacks.most_common())
+
+
+class AllocationProfile:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sizes = {}
+        self.counts = {}
+        self.requests = Counter()
+
+    def add(self, name, diff):
+        with self.lock:
+            self.requests[name] += 1
+            sizes = self.sizes.setdefault(name, Counter())
+            counts = self.counts.setdefault(name, Counter())
+            for stat in diff:
+                if stat.size_diff > 0:
+                    site = str(stat.traceback[0])
+                    sizes[site] += stat.size_diff
+                    counts[site] += stat.count_diff
+
+    def top(self, limit):
+        return {
+            name: [{"site": site, "bytes_per_request": size / self.requests[name],
+                    "blocks_per_request": self.counts[name][site] / self.requests[name]}
+                   for site, size in sizes.most_common(limit)]
+            for name, sizes in self.sizes.items()
+        }
+
+
+class _AllocationTracker:
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+               tracemalloc.Filter(False, __file__)]
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+        self.before = None
+
+    def snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(self.filters)
+
+    def __enter__(self):
+        if tracemalloc.is_tracing():
+            self.before = self.snapshot()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # the session may have ended and stopped tracing meanwhile
+        if self.before is not None and tracemalloc.is_tracing():
+            self.profile.add(self.name, self.snapshot().compare_to(self.before, "lineno"))
+        return False
+
+
+def track_allocations(name):
+    """Context around the handling of one request of method `name`."""
+    profile = _allocations
+    if profile is None:
+        return _null_context
+    return _AllocationTracker(profile, name)
+
+
+def collect_allocations(seconds, limit=20):
+    """Trace allocations of the requests handled in the next `seconds`."""
+    global _allocations
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    profile = _allocations = AllocationProfile()
+    try:
+        time.sleep(seconds)
+    finally:
+        _allocations = None
+        if started:
+            tracemalloc.stop()
+    return dict(profile.requests), profile.top(limit)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Replay requests captured in server logs against a running server.
+
+    python3 -m api.replay server.log [--host localhost] [--port 8080]
+        [--speed 1.0 | --rate 200] [--concurrency 32] [--limit N]
+
+`--speed` keeps the original inter-arrival times scaled by the factor,
+`--rate` sends at a fixed number of requests per second.  Both are open
+loop: a request is sent on schedule whatever the latency of the previous
+ones, and latency is measured from the scheduled send time, so a server
+that falls behind shows up in the distribution.  Tokens are regenerated,
+so captured admin tokens that expired long ago still pass auth, also in
+the items of `/batch/` requests.  Profiling requests are not replayed.
+"""
+
+import ast
+import http.client
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from api import api
+
+LOG_DATE_FORMAT = "%Y.%m.%d %H:%M:%S"
+REQUEST_RE = re.compile(r"^\[(?P<time>[^\]]+)\] I (?P<path>/\S*): "
+                        r"(?P<body>b(?P<q>['\"]).*(?P=q)) (?P<request_id>\S+)$")
+PERCENTILES = (50, 90, 99, 99.9)
+# profiling stalls a worker for seconds and slows every request replayed meanwhile
+SKIPPED_PATHS = ("admin/profile",)
+
+
+class Captured:
+    __slots__ = ("offset", "path", "body", "request_id", "method")
+
+    def __init__(self, offset, path, body, request_id, method):
+        self.offset = offset
+        self.path = path
+        self.body = body
+        self.request_id = request_id
+        self.method = method
+
+
+def parse_log(lines):
+    """Yield (timestamp, path, raw body, request id) of logged requests."""
+    for line in lines:
+        match = REQUEST_RE.match(line.rstrip("\n"))
+        if match is None:
+            continue
+        try:
+            timestamp = datetime.strptime(match.group("time"), LOG_DATE_FORMAT).timestamp()
+            body = ast.literal_eval(match.group("body"))
+        except (ValueError, SyntaxError):
+            continue
+        yield timestamp, match.group("path"), body, match.group("request_id")
+
+
+def sign(request):
+    login, account = request.get("login"), request.get("account", "")
+    if isinstance(login, str) and (login == api.ADMIN_LOGIN or isinstance(account, str)):
+        request["token"] = api.make_token(login, account)
+
+
+def with_valid_auth(body):
+    """Request body with tokens that pass check_auth now, if it can be parsed.
+
+    Returns the body and the method, "batch" for a list of requests whose
+    items are signed one by one.
+    """
+    try:
+        request = json.loads(body)
+    except ValueError:
+        return body, None
+    if isinstance(request, list):
+        for item in request:
+            if isinstance(item, dict):
+                sign(item)
+        return json.dumps(request).encode("utf-8"), "batch"
+    if not isinstance(request, dict):
+        return body, None
+    sign(request)
+    return json.dumps(request).encode("utf-8"), request.get("method")
+
+
+def load(lines, limit=None):
+    """Captured requests with offsets from the first one.
+
+    The log has a one second resolution, requests logged within the same
+    second are spread evenly over it.  Requests to SKIPPED_PATHS are left out.
+    """
+    records = sorted((record for record in parse_log(lines) if record[1].strip("/") not in SKIPPED_PATHS),
+                     key=lambda record: record[0])[:limit]
+    per_second = Counter(timestamp for timestamp, _, _, _ in records)
+    seen = Counter()
+    captured = []
+    start = records[0][0] if records else 0
+    for timestamp, path, body, request_id in records:
+        offset = timestamp - start + seen[timestamp] / per_second[timestamp]
+        seen[timestamp] += 1
+        body, method = with_valid_auth(body)
+        captured.append(Captured(offset, path, body, request_id, method))
+    return captured
+
+
+def schedule(captured, speed=1.0, rate=None):
+    """Send time of every request relative to the start of the replay."""
+    if rate:
+        return [i / rate for i in range(len(captured))]
+    return [c.offset / speed for c in captured]
+
+
+class Replayer:
+    def __init__(self, host, port, concurrency=32, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+        self.latencies = []
+        self.by_method = {}
+        self.codes = Counter()
+        self.errors = Counter()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def send(self, request, scheduled_at):
+        code, error = None, None
+        try:
+            conn = self.connection()
+            conn.request("POST", request.path, request.body,
+                         {"Content-Type": "application/json", "X-Request-ID": request.request_id})
+            response = conn.getresponse()
+            data = response.read()
+            if response.will_close:
+                conn.close()
+            code = json.loads(data).get("code", response.status)
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            self.local.conn = None
+            error = type(e).__name__
+        latency = time.monotonic() - scheduled_at
+        with self.lock:
+            self.latencies.append(latency)
+            self.by_method.setdefault(request.method, []).append(latency)
+            if error:
+                self.errors[error] += 1
+            else:
+                self.codes[code] += 1
+
+    def run(self, captured, send_times):
+        start = time.monotonic()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            for request, send_at in zip(captured, send_times):
+                delay = start + send_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.send, request, start + send_at)
+        elapsed = time.monotonic() - start
+        # kept-alive connections hold a server thread until they are closed
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+        return elapsed
+
+    def report(self, elapsed):
+        lines = ["requests: {}  elapsed: {:.2f}s  throughput: {:.1f} req/s".format(
+            len(self.latencies), elapsed, len(self.latencies) / elapsed if elapsed else 0)]
+        lines.append("codes: {}".format(dict(sorted(self.codes.items()))))
+        lines.append("errors: {}".format(dict(self.errors)))
+        lines.append(format_latencies("all", self.latencies))
+        for method, latencies in sorted(self.by_method.items(), key=lambda item: str(item[0])):
+            lines.append(format_latencies(str(method), latencies))
+        return "\n".join(lines)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def format_latencies(name, latencies):
+    parts = ["p{}={:.2f}ms".format(p, percentile(latencies, p) * 1000) for p in PERCENTILES]
+    parts.append("max={:.2f}ms".format(max(latencies, default=0) * 1000))
+    return "{:<18} n={:<7} {}".format(name, len(latencies), " ".join(parts))
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    op = OptionParser(usage="%prog [options] LOGFILE...")
+    op.add_option("--host", action="store", default="localhost")
+    op.add_option("-p", "--port", action="store", type=int, default=8080)
+    op.add_option("--speed", action="store", type=float, default=1.0)
+    op.add_option("--rate", action="store", type=float, default=None)
+    op.add_option("-c", "--concurrency", action="store", type=int, default=32)
+    op.add_option("--limit", action="store", type=int, default=None)
+    (opts, args) = op.parse_args()
+    if not args:
+        op.error("at least one log file is required")
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname).1s %(message)s', datefmt=LOG_DATE_FORMAT)
+    lines = []
+    for path in args:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            lines.extend(f)
+    captured = load(lines, opts.limit)
+    logging.info("Replaying {} requests".format(len(captured)))
+    replayer = Replayer(opts.host, opts.port, opts.concurrency)
+    elapsed = replayer.run(captured, schedule(captured, opts.speed, opts.rate))
+    print(replayer.report(elapsed))
@@ -1,8 +1,13 @@
 import hashlib
-import json
 
+from api import codec
 
-def get_score(store, phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+
+# scores are cached for 60 minutes
+SCORE_TTL_SEC = 60 * 60
+
+
+def score_key(phone, email, birthday=None, gender=None, first_name=None, last_name=None):
     key_parts = [
         first_name or "",
         last_name or "",
@@ -11,12 +16,11 @@ def get_score(store, phone, email, birthday=None, gender=None, first_name=None,
         email or "",
         birthday.strftime("%Y%m%d") if birthday is not None else "",
     ]
-    key = "uid:" + hashlib.md5("".join(key_parts).encode('utf-8')).hexdigest()
-    # try get from cache,
-    # fallback to heavy calculation in case of cache miss
-    score = store.cache_get(key) or 0
-    if score:
-        return float(score)
+    return "uid:" + hashlib.md5("".join(key_parts).encode('utf-8')).hexdigest()
+
+
+def compute_score(phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+    score = 0
     if phone:
         score += 1.5
     if email:
@@ -25,11 +29,26 @@ def get_score(store, phone, email, birthday=None, gender=None, first_name=None,
         score += 1.5
     if first_name and last_name:
         score += 0.5
-    # cache for 60 minutes
-    store.cache_set(key, score, 60 * 60)
+    return score
+
+
+def get_score(store, phone, email, birthday=None, gender=None, first_name=None, last_name=None):
+    key = score_key(phone, email, birthday, gender, first_name, last_name)
+    # try get from cache,
+    # fallback to heavy calculation in case of cache miss
+    score = store.cache_get(key) or 0
+    if score:
+        return float(score)
+    score = compute_score(phone, email, birthday, gender, first_name, last_name)
+    store.cache_set(key, score, SCORE_TTL_SEC)
     return score
 
 
 def get_interests(store, cid):
     r = store.get("i:%s" % cid)
-    return json.loads(r) if r else []
+    return codec.loads(r) if r else []
+
+
+def get_interests_many(store, cids):
+    values = store.get_many(["i:%s" % cid for cid in cids])
+    return [codec.loads(r) if r else [] for r in values]
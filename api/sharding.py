@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Client-side sharding of keys over several Redis nodes.
+
+Keys are placed on a consistent-hash ring with `vnodes` virtual nodes
+per shard, so adding a node moves about 1/N of the keys.  Move them
+after adding (or before removing) a node with:
+
+    python3 -m api.sharding --nodes localhost:6379/0,localhost:6380/0 \\
+        --new-nodes localhost:6379/0,localhost:6380/0,localhost:6381/0 [--dry-run]
+"""
+
+import bisect
+import hashlib
+import logging
+
+from api import store
+
+DEFAULT_VNODES = 160
+
+
+def key_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+def node_name(redis_config):
+    return "{}:{}/{}".format(redis_config.get("host", "localhost"),
+                             redis_config.get("port", 6379),
+                             redis_config.get("db", 0))
+
+
+def parse_node(name):
+    address, _, db = name.partition("/")
+    host, _, port = address.partition(":")
+    return {"host": host or "localhost", "port": int(port or 6379), "db": int(db or 0)}
+
+
+class HashRing:
+    def __init__(self, nodes, vnodes=DEFAULT_VNODES):
+        self.nodes = sorted(nodes)
+        if not self.nodes:
+            raise ValueError("Hash ring needs at least one node")
+        points = sorted((key_hash("{}#{}".format(node, i)), node)
+                        for node in self.nodes for i in range(vnodes))
+        self.hashes = [h for h, _ in points]
+        self.owners = [node for _, node in points]
+
+    def get_node(self, key):
+        i = bisect.bisect(self.hashes, key_hash(key))
+        return self.owners[i % len(self.owners)]
+
+    def group(self, keys):
+        """Map node -> positions of its keys in `keys`."""
+        groups = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(self.get_node(key), []).append(i)
+        return groups
+
+
+class ShardedStore(store.BaseStore):
+    """Routes every key to the shard that owns it on the hash ring.
+
+    Batch calls are split into one batch call per shard and the results
+    are merged back in the order of the requested keys.
+    """
+
+    def __init__(self, shards, vnodes=DEFAULT_VNODES):
+        self.shards = dict(shards)
+        self.ring = HashRing(self.shards, vnodes)
+
+    def shard(self, key):
+        return self.shards[self.ring.get_node(key)]
+
+    def _get_many(self, method, keys):
+        keys = list(keys)
+        values = [None] * len(keys)
+        for node, positions in self.ring.group(keys).items():
+            found = getattr(self.shards[node], method)([keys[i] for i in positions])
+            for i, value in zip(positions, found):
+                values[i] = value
+        return values
+
+    def _set_many(self, method, items, ttl_sec):
+        items = list(items)
+        for node, positions in self.ring.group([key for key, _ in items]).items():
+            getattr(self.shards[node], method)([items[i] for i in positions], ttl_sec)
+        return items
+
+    def get(self, key):
+        return self.shard(key).get(key)
+
+    def get_many(self, keys):
+        return self._get_many("get_many", keys)
+
+    def cache_get(self, key):
+        return self.shard(key).cache_get(key)
+
+    def cache_get_many(self, keys):
+        return self._get_many("cache_get_many", keys)
+
+    def cache_set(self, key, value, ttl_sec):
+        self.shard(key).cache_set(key, value, ttl_sec)
+
+    def cache_set_many(self, items, ttl_sec):
+        self._set_many("cache_set_many", items, ttl_sec)
+
+    def cache_delete_many(self, keys):
+        keys = list(keys)
+        for node, positions in self.ring.group(keys).items():
+            self.shards[node].cache_delete_many([keys[i] for i in positions])
+
+    def set(self, key, value, ttl_sec=None):
+        self.shard(key).set(key, value, ttl_sec)
+        self.notify([key])
+
+    def set_many(self, items, ttl_sec=None):
+        items = self._set_many("set_many", items, ttl_sec)
+        self.notify([key for key, _ in items])
+
+
+def create_sharded_store(nodes, vnodes=DEFAULT_VNODES, **store_kwargs):
+    """ShardedStore over Redis nodes given as configs or "host:port/db" names."""
+    configs = [parse_node(node) if isinstance(node, str) else node for node in nodes]
+    return ShardedStore({node_name(config): store.Store(config, **store_kwargs)
+                         for config in configs}, vnodes)
+
+
+def make_ring(nodes, vnodes=DEFAULT_VNODES):
+    """HashRing over "host:port/db" names, normalized as `create_sharded_store` names its shards."""
+    return HashRing([node_name(parse_node(node)) for node in nodes], vnodes)
+
+
+def moved_keys(keys, old_ring, new_ring):
+    """Yield (key, old node, new node) for keys that change owner."""
+    for key in keys:
+        old, new = old_ring.get_node(key), new_ring.get_node(key)
+        if old != new:
+            yield key, old, new
+
+
+def rebalance(nodes, new_nodes, vnodes=DEFAULT_VNODES, batch_size=500, dry_run=False):
+    """Move keys of `nodes` to their owners on the `new_nodes` ring.
+
+    Keys are copied with DUMP/RESTORE, keeping their TTL, and then
+    deleted from the old node.  A write in between is lost, so pause
+    writers of persistent keys for the move.  Returns the number of
+    moved keys per (old node, new node) pair.
+    """
+    import redis
+
+    old_ring, new_ring = make_ring(nodes, vnodes), make_ring(new_nodes, vnodes)
+    clients = {node: redis.StrictRedis(**parse_node(node))
+               for node in set(old_ring.nodes) | set(new_ring.nodes)}
+    stats = {}
+    for node in old_ring.nodes:
+        source = clients[node]
+        batch = []
+        for key in source.scan_iter(count=batch_size):
+            key = key.decode("utf-8")
+            new = new_ring.get_node(key)
+            if new != node:
+                batch.append((key, new))
+                stats[node, new] = stats.get((node, new), 0) + 1
+            if len(batch) == batch_size:
+                _move(source, clients, batch, dry_run)
+                batch = []
+        _move(source, clients, batch, dry_run)
+    return stats
+
+
+def _move(source, clients, batch, dry_run):
+    if not batch or dry_run:
+        return
+    pipe = source.pipeline(transaction=False)
+    for key, _ in batch:
+        pipe.dump(key)
+        pipe.pttl(key)
+    dumped = pipe.execute()
+    targets = {}
+    for (key, new), data, ttl in zip(batch, dumped[::2], dumped[1::2]):
+        if data is None:
+            continue
+        targets.setdefault(new, clients[new].pipeline(transaction=False)).restore(
+            key, max(ttl, 0), data, replace=True)
+    for pipe in targets.values():
+        pipe.execute()
+    source.delete(*[key for key, _ in batch])
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    op = OptionParser(usage="%prog --nodes HOST:PORT/DB,... --new-nodes HOST:PORT/DB,... [--dry-run]")
+    op.add_option("--nodes", action="store")
+    op.add_option("--new-nodes", action="store")
+    op.add_option("--vnodes", action="store", type=int, default=DEFAULT_VNODES)
+    op.add_option("--batch", action="store", type=int, default=500)
+    op.add_option("--dry-run", action="store_true", default=False)
+    (opts, args) = op.parse_args()
+    if not opts.nodes or not opts.new_nodes:
+        op.error("--nodes and --new-nodes are required")
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
+    stats = rebalance(opts.nodes.split(","), opts.new_nodes.split(","),
+                      opts.vnodes, opts.batch, opts.dry_run)
+    for (old, new), count in sorted(stats.items()):
+        logging.info("{} -> {}: {} keys{}".format(old, new, count, " (dry run)" if opts.dry_run else ""))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Read-only memory-mapped snapshot of client interests.
+
+A snapshot is a `store.MmapStore` file holding the `i:<cid>` keys, so it
+can also be served by the mmap backend.
+
+Build a snapshot:
+
+    python3 -m api.snapshot -o interests.snap --redis localhost:6379/0
+    python3 -m api.snapshot -o interests.snap --jsonl interests.jsonl
+
+where every JSONL line is {"cid": <int>, "interests": [...]}.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from api import store
+
+INTERESTS_PREFIX = "i:"
+
+
+def write_snapshot(path, items):
+    """Write (cid, interests) pairs to `path`, replacing it atomically.
+
+    `interests` is either a list or its JSON encoding.
+    """
+    entries = {}
+    for cid, interests in items:
+        if not isinstance(interests, (str, bytes)):
+            interests = json.dumps(interests)
+        if isinstance(interests, bytes):
+            interests = interests.decode("utf-8")
+        entries[INTERESTS_PREFIX + str(int(cid))] = interests
+    store.MmapStore.build(path, entries.items())
+    return len(entries)
+
+
+class InterestsSnapshot:
+    """Snapshot reader.
+
+    `get` returns a memoryview into the mapped file, no bytes are copied.
+    The file is re-checked at most every `check_interval` seconds and a
+    replaced file (see `write_snapshot`) is mapped and swapped in with
+    a single reference assignment, so concurrent readers never see a
+    half-built snapshot.  The old mapping is released once no views
+    into it are left.
+    """
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.mapping = store.MmapStore(path)
+        self.checked_at = time.monotonic()
+
+    def __len__(self):
+        return self.mapping.count
+
+    def reload(self):
+        """Swap in the current file if it was replaced. Return True on swap."""
+        with self.lock:
+            self.checked_at = time.monotonic()
+            try:
+                stat = os.stat(self.path)
+            except OSError as e:
+                logging.error("Snapshot stat error: {}".format(e))
+                return False
+            if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == self.mapping.version:
+                return False
+            try:
+                mapping = store.MmapStore(self.path)
+            except (OSError, ValueError) as e:
+                logging.error("Snapshot reload error: {}".format(e))
+                return False
+            self.mapping = mapping
+        logging.info("Snapshot {} reloaded: {} clients".format(self.path, len(self)))
+        return True
+
+    def get(self, cid):
+        if time.monotonic() - self.checked_at > self.check_interval:
+            self.reload()
+        return self.mapping.view(INTERESTS_PREFIX + str(cid))
+
+
+class SnapshotStore(store.BaseStore):
+    """Serves `i:<cid>` keys from a snapshot, everything else from `fallback`."""
+
+    def __init__(self, path, fallback=None, check_interval=1.0):
+        self.snapshot = InterestsSnapshot(path, check_interval)
+        if fallback is None:
+            self.fallback = store.MemoryStore()
+        elif isinstance(fallback, dict):
+            self.fallback = store.create_store(fallback)
+        else:
+            self.fallback = fallback
+
+    def _snapshot_get(self, key):
+        if not key.startswith(INTERESTS_PREFIX):
+            return None
+        try:
+            cid = int(key[len(INTERESTS_PREFIX):])
+        except ValueError:
+            return None
+        if cid < 0:
+            return None
+        return self.snapshot.get(cid)
+
+    def get(self, key):
+        data = self._snapshot_get(key)
+        if data is None:
+            return self.fallback.get(key)
+        return data
+
+    def get_many(self, keys):
+        values = [self._snapshot_get(key) for key in keys]
+        missing = [key for key, value in zip(keys, values) if value is None]
+        if missing:
+            found = iter(self.fallback.get_many(missing))
+            values = [next(found) if value is None else value for value in values]
+        return values
+
+    def cache_get(self, key):
+        return self.fallback.cache_get(key)
+
+    def cache_get_many(self, keys):
+        return self.fallback.cache_get_many(keys)
+
+    def cache_set(self, key, value, ttl_sec):
+        self.fallback.cache_set(key, value, ttl_sec)
+
+    def cache_set_many(self, items, ttl_sec):
+        self.fallback.cache_set_many(items, ttl_sec)
+
+    def cache_delete_many(self, keys):
+        self.fallback.cache_delete_many(keys)
+
+
+def read_jsonl(path):
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record["cid"], record["interests"]
+
+
+def read_redis(redis_config, batch_size=1000):
+    db = store.Store(redis_config)
+    keys = []
+    for key in db.db.scan_iter(match=INTERESTS_PREFIX + "*", count=batch_size):
+        keys.append(key)
+        if len(keys) == batch_size:
+            yield from _redis_batch(db, keys)
+            keys = []
+    yield from _redis_batch(db, keys)
+
+
+def _redis_batch(db, keys):
+    for key, value in zip(keys, db.get_many(keys)):
+        cid = key[len(INTERESTS_PREFIX):]
+        if value is not None and cid.isdigit():
+            yield int(cid), value
+
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    from api.sharding import parse_node
+
+    op = OptionParser(usage="%prog -o OUTPUT (--redis HOST:PORT/DB | --jsonl FILE)")
+    op.add_option("-o", "--output", action="store")
+    op.add_option("--redis", action="store", default=None)
+    op.add_option("--jsonl", action="store", default=None)
+    (opts, args) = op.parse_args()
+    if not opts.output or bool(opts.redis) == bool(opts.jsonl):
+        op.error("an output file and exactly one source are required")
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname).1s %(message)s', datefmt='%Y.%m.%d %H:%M:%S')
+    if opts.jsonl:
+        source = read_jsonl(opts.jsonl)
+    else:
+        source = read_redis(parse_node(opts.redis))
+    count = write_snapshot(opts.output, source)
+    logging.info("Snapshot {} written: {} clients".format(opts.output, count))
@@ -1,13 +1,72 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import abc
+import bisect
 import logging
-import redis
+import mmap
+import os
+import struct
+import threading
 import time
+import zlib
 import functools
+from array import array
 
 
-class Store:
+class BaseStore(abc.ABC):
+    """Storage backend interface used by the scoring functions.
+
+    `get` is the persistent storage: a missing key is an error.
+    `cache_*` is the best-effort cache: misses and failures return None.
+    Batch variants return values in the order of the requested keys,
+    None stands for a missing key.
+    Writable backends call the listeners with the written keys.
+    """
+
+    listeners = ()
+
+    def add_listener(self, callback):
+        self.listeners = self.listeners + (callback,)
+
+    def notify(self, keys):
+        for listener in self.listeners:
+            listener(keys)
+
+    @abc.abstractmethod
+    def get(self, key):
+        pass
+
+    @abc.abstractmethod
+    def cache_get(self, key):
+        pass
+
+    @abc.abstractmethod
+    def cache_set(self, key, value, ttl_sec):
+        pass
+
+    @abc.abstractmethod
+    def cache_delete_many(self, keys):
+        pass
+
+    def get_many(self, keys):
+        values = []
+        for key in keys:
+            try:
+                values.append(self.get(key))
+            except ValueError:
+                values.append(None)
+        return values
+
+    def cache_get_many(self, keys):
+        return [self.cache_get(key) for key in keys]
+
+    def cache_set_many(self, items, ttl_sec):
+        for key, value in items:
+            self.cache_set(key, value, ttl_sec)
+
+
+class Store(BaseStore):
     def __init__(self, redis_config,
                  reconnect_attempts=100,
                  reconnect_delay=0.01,
@@ -19,16 +78,28 @@ class Store:
         self.connect_to_db = None
         self.read_from_db = None
         self.write_from_db = None
+        self.read_many_from_db = None
+        self.write_many_from_db = None
+        self.delete_from_db = None
         if connect_now:
             self.connect()
 
     def connect(self):
-        self.db = redis.StrictRedis(**self.config, decode_responses=True,
+        import redis
+        from redis.backoff import NoBackoff
+        from redis.retry import Retry
+
+        # _reconnect does the retrying, the client must not retry on its own
+        config = dict({"retry": Retry(NoBackoff(), 0)}, **self.config)
+        self.db = redis.StrictRedis(**config, decode_responses=True,
                                     socket_timeout=1,
                                     socket_connect_timeout=1)
         self.connect_to_db = self._reconnect(self.db.ping)
         self.read_from_db = self._reconnect(self.db.get)
         self.write_from_db = self._reconnect(self.db.set)
+        self.read_many_from_db = self._reconnect(self.db.mget)
+        self.write_many_from_db = self._reconnect(self._set_many)
+        self.delete_from_db = self._reconnect(self.db.delete)
         self.connect_to_db()
 
     def cache_get(self, key):
@@ -41,17 +112,49 @@ class Store:
 
     def cache_set(self, key, value, ttl_sec):
         try:
-            self.write_from_db(key, value, nx=ttl_sec)
+            self.write_from_db(key, value, ex=ttl_sec or None, nx=True)
         except ConnectionError as e:
             logging.error("Connection error: {}".format(e))
 
+    def cache_get_many(self, keys):
+        data = [None] * len(keys)
+        if not keys:
+            return data
+        try:
+            data = self.read_many_from_db(keys)
+        except ConnectionError as e:
+            logging.error("Connection error: {}".format(e))
+        return data
+
+    def cache_set_many(self, items, ttl_sec):
+        try:
+            self.write_many_from_db(items, ttl_sec)
+        except ConnectionError as e:
+            logging.error("Connection error: {}".format(e))
+
+    def cache_delete_many(self, keys):
+        if not keys:
+            return
+        try:
+            self.delete_from_db(*keys)
+        except ConnectionError as e:
+            logging.error("Connection error: {}".format(e))
+
+    def _set_many(self, items, ttl_sec, nx=True):
+        pipe = self.db.pipeline(transaction=False)
+        for key, value in items:
+            pipe.set(key, value, ex=ttl_sec or None, nx=nx)
+        return pipe.execute()
+
     def _reconnect(self, func, *args, **kwargs):
+        import redis
+
         def wrapper(*args, **kwargs):
             attempts = self.reconnect_attempts
             while True:
                 try:
                     return func(*args, **kwargs)
-                except redis.exceptions.ConnectionError as e:
+                except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
                     time.sleep(self.reconnect_delay)
                     logging.error("Connection error: reconnecting ... ")
                     attempts -= 1
@@ -64,3 +167,218 @@ class Store:
         if data is None:
             raise ValueError("{} key doesn’t exist".format(key))
         return data
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        return self.read_many_from_db(keys)
+
+    def set(self, key, value, ttl_sec=None):
+        self.write_from_db(key, value, ex=ttl_sec)
+        self.notify([key])
+
+    def set_many(self, items, ttl_sec=None):
+        items = list(items)
+        self.write_many_from_db(items, ttl_sec, nx=False)
+        self.notify([key for key, _ in items])
+
+
+class MemoryStore(BaseStore):
+    """In-process dict backend with TTL eviction.
+
+    Expired keys are dropped on access and by a sweep of the whole dict
+    every `sweep_every` writes.
+    """
+
+    def __init__(self, data=None, sweep_every=1024):
+        self.sweep_every = sweep_every
+        self.data = {}
+        self.lock = threading.Lock()
+        self.writes = 0
+        for key, value in (data or {}).items():
+            self.set(key, value)
+
+    def _lookup(self, key, now):
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= now:
+            del self.data[key]
+            return None
+        return value
+
+    def _sweep(self, now):
+        expired = [key for key, (_, expires_at) in self.data.items()
+                   if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self.data[key]
+
+    def set(self, key, value, ttl_sec=None):
+        now = time.monotonic()
+        expires_at = now + ttl_sec if ttl_sec else None
+        with self.lock:
+            self.data[key] = (str(value), expires_at)
+            self.writes += 1
+            if self.writes % self.sweep_every == 0:
+                self._sweep(now)
+        self.notify([key])
+
+    def set_many(self, items, ttl_sec=None):
+        for key, value in items:
+            self.set(key, value, ttl_sec)
+
+    def get(self, key):
+        data = self.cache_get(key)
+        if data is None:
+            raise ValueError("{} key doesn’t exist".format(key))
+        return data
+
+    def get_many(self, keys):
+        return self.cache_get_many(keys)
+
+    def cache_get(self, key):
+        with self.lock:
+            return self._lookup(key, time.monotonic())
+
+    def cache_get_many(self, keys):
+        now = time.monotonic()
+        with self.lock:
+            return [self._lookup(key, now) for key in keys]
+
+    def cache_set(self, key, value, ttl_sec):
+        self.set(key, value, ttl_sec)
+
+    def cache_delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+
+
+class MmapStore(BaseStore):
+    """Read-only key/value file served through mmap.
+
+    File layout (native byte order, aligned): header (magic, number of
+    keys), (count + 1) uint64 offsets of the entries in the blob, count
+    uint32 CRC-32 of the keys sorted, count uint32 key lengths, then the
+    blob of packed keys and values.  A lookup bisects the hashes in C and
+    compares the key of the entries with its hash, `view` returns the value as
+    a memoryview into the mapped file without copying it.  Cache calls go
+    to `cache` (in-process by default), since the snapshot itself is never
+    written to.
+    """
+
+    MAGIC = b"APIKV002"
+    HEADER = struct.Struct("=8sQ")
+
+    def __init__(self, path, cache=None):
+        self.path = path
+        self.cache = cache if cache is not None else MemoryStore()
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = self.HEADER.unpack_from(self.mm, 0)
+        if magic != self.MAGIC:
+            raise ValueError("{} is not a key/value snapshot".format(path))
+        self.data = memoryview(self.mm)
+        offsets_end = self.HEADER.size + 8 * (self.count + 1)
+        hashes_end = offsets_end + 4 * self.count
+        lengths_end = hashes_end + 4 * self.count
+        self.offsets = self.data[self.HEADER.size:offsets_end].cast("Q")
+        self.hashes = self.data[offsets_end:hashes_end].cast("I")
+        self.key_lengths = self.data[hashes_end:lengths_end].cast("I")
+        self.blob = self.data[lengths_end:]
+
+    @classmethod
+    def build(cls, path, items):
+        """Write `items` (key, value) to `path` atomically."""
+        entries = sorted((zlib.crc32(key), key, value) for key, value in (
+            (str(k).encode("utf-8"), str(v).encode("utf-8")) for k, v in items))
+        offsets = array("Q", [0])
+        for _, key, value in entries:
+            offsets.append(offsets[-1] + len(key) + len(value))
+        tmp_path = "{}.tmp".format(path)
+        with open(tmp_path, "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, len(entries)))
+            offsets.tofile(f)
+            array("I", [h for h, _, _ in entries]).tofile(f)
+            array("I", [len(key) for _, key, _ in entries]).tofile(f)
+            for _, key, value in entries:
+                f.write(key)
+                f.write(value)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        for view in (self.hashes, self.offsets, self.key_lengths, self.blob, self.data):
+            view.release()
+        self.mm.close()
+
+    def view(self, key):
+        key = key.encode("utf-8")
+        key_hash = zlib.crc32(key)
+        i = bisect.bisect_left(self.hashes, key_hash)
+        while i < self.count and self.hashes[i] == key_hash:
+            start, end = self.offsets[i], self.offsets[i + 1]
+            key_end = start + self.key_lengths[i]
+            if self.blob[start:key_end] == key:
+                return self.blob[key_end:end]
+            i += 1
+        return None
+
+    def _find(self, key):
+        data = self.view(key)
+        return str(data, "utf-8") if data is not None else None
+
+    def get(self, key):
+        data = self._find(key)
+        if data is None:
+            raise ValueError("{} key doesn’t exist".format(key))
+        return data
+
+    def get_many(self, keys):
+        return [self._find(key) for key in keys]
+
+    def cache_get(self, key):
+        return self.cache.cache_get(key)
+
+    def cache_get_many(self, keys):
+        return self.cache.cache_get_many(keys)
+
+    def cache_set(self, key, value, ttl_sec):
+        self.cache.cache_set(key, value, ttl_sec)
+
+    def cache_set_many(self, items, ttl_sec):
+        self.cache.cache_set_many(items, ttl_sec)
+
+    def cache_delete_many(self, keys):
+        self.cache.cache_delete_many(keys)
+
+
+def _snapshot_store(**options):
+    # api.snapshot builds on this module, import it on demand
+    from api import snapshot
+    return snapshot.SnapshotStore(**options)
+
+
+def _sharded_store(**options):
+    from api import sharding
+    return sharding.create_sharded_store(**options)
+
+
+BACKENDS = {
+    "redis": Store,
+    "memory": MemoryStore,
+    "mmap": MmapStore,
+    "snapshot": _snapshot_store,
+    "sharded": _sharded_store,
+}
+
+
+def create_store(config):
+    """Build a store from `{"backend": name, **backend_kwargs}`."""
+    options = dict(config)
+    backend = options.pop("backend", "redis")
+    if backend not in BACKENDS:
+        raise ValueError("Unknown store backend: {}".format(backend))
+    return BACKENDS[backend](**options)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Lightweight request tracing.
+
+A request is traced when the upstream `traceparent` header says so, or
+with probability `sample_rate` otherwise.  Spans of an unsampled request
+are a shared no-op object, so the untraced path costs one thread-local
+lookup per span.  Finished spans go to an exporter: a JSON lines file or
+an OTLP/HTTP JSON collector.
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_local = threading.local()
+
+
+def new_id(n_bytes):
+    return os.urandom(n_bytes).hex()
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, key, value):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id",
+                 "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, tracer, name, trace_id, parent_id=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_id(8)
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start_ns = None
+        self.end_ns = None
+        self.error = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        _local.stack.pop()
+        if exc is not None:
+            self.error = repr(exc)
+        self.tracer.export(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Tracer:
+    def __init__(self, exporter=None, sample_rate=0.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def trace(self, name, headers, **attributes):
+        """Root span of a request, or NOOP_SPAN if it is not sampled."""
+        if self.exporter is None:
+            return NOOP_SPAN
+        trace_id, parent_id, sampled = None, None, None
+        match = TRACEPARENT_RE.match(headers.get("traceparent") or "")
+        if match:
+            trace_id, parent_id, flags = match.groups()
+            sampled = bool(int(flags, 16) & 1)
+        if sampled is None:
+            sampled = random.random() < self.sample_rate
+        if not sampled:
+            return NOOP_SPAN
+        return Span(self, name, trace_id or new_id(16), parent_id, attributes)
+
+    def export(self, span):
+        try:
+            self.exporter.export(span)
+        except Exception as e:
+            logging.error("Span export error: {}".format(e))
+
+
+class FileExporter:
+    """Append spans to `path` as JSON lines.
+
+    The file stays open, line buffered, so every span is one write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "a", buffering=1)
+
+    def export(self, span):
+        line = json.dumps(span.to_dict()) + "\n"
+        with self.lock:
+            self.file.write(line)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class OTLPExporter:
+    """Send spans in batches to an OTLP/HTTP JSON endpoint from a background thread.
+
+    Spans are dropped, not queued without bound, when the collector
+    falls behind.
+    """
+
+    def __init__(self, endpoint, service_name="scoring-api", batch_size=256,
+                 flush_interval=1.0, max_queue=10000, timeout=1.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.queue = queue.Queue(max_queue)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def export(self, span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self.send(batch)
+            except Exception as e:
+                logging.error("OTLP export error: {}".format(e))
+
+    def send(self, spans):
+        import urllib.request
+
+        body = json.dumps(self.encode(spans)).encode("utf-8")
+        request = urllib.request.Request(self.endpoint, data=body, method="POST",
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def encode(self, spans):
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [_attribute(k, v) for k, v in span.attributes.items()],
+                    "status": {"code": 2, "message": span.error} if span.error else {},
+                } for span in spans],
+            }],
+        }]}
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class TracedStore:
+    """Proxy that records a span for every store call."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getattr__(self, attr):
+        func = getattr(self.store, attr)
+        if not callable(func):
+            return func
+
+        def wrapper(*args, **kwargs):
+            with span("store." + attr):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+tracer = Tracer()
+
+
+def configure(sample_rate=0.0, path=None, endpoint=None):
+    global tracer
+    exporter = None
+    if endpoint:
+        exporter = OTLPExporter(endpoint)
+    elif path:
+        exporter = FileExporter(path)
+    tracer = Tracer(exporter, sample_rate)
+    return tracer
+
+
+def current_span():
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+def span(name, **attributes):
+    """Child of the current span, or NOOP_SPAN outside a sampled trace."""
+    parent = current_span()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.tracer, name, parent.trace_id, parent.span_id, attributes)
+
+
+def traced_store(store):
+    return TracedStore(store) if current_span() is not None else store
@@ -0,0 +1,72 @@
+"""Client-side cost of online_score calls against a local server.
+
+One new connection and token per call (what callers did by hand) against
+the pooled Client, batched online_scores and the coalescing AsyncClient.
+
+    python3 -m benchmarks.client [N_CALLS]
+"""
+import asyncio
+import http.client
+import json
+import logging
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from api import api
+from api import client
+
+
+def naive(address, arguments_list):
+    for arguments in arguments_list:
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+                   "token": api.make_token("h&f", "horns&hoofs"), "arguments": arguments}
+        conn = http.client.HTTPConnection(*address)
+        conn.request("POST", "/method/", json.dumps(request), {"Content-Type": "application/json",
+                                                                "Connection": "close"})
+        json.loads(conn.getresponse().read())
+        conn.close()
+
+
+def pooled(address, arguments_list):
+    with client.Client(*address, account="horns&hoofs", login="h&f") as c:
+        for arguments in arguments_list:
+            c.online_score(**arguments)
+
+
+def batched(address, arguments_list):
+    with client.Client(*address, account="horns&hoofs", login="h&f") as c:
+        c.online_scores(arguments_list)
+
+
+def coalesced(address, arguments_list):
+    async def run():
+        async with client.AsyncClient(*address, account="horns&hoofs", login="h&f") as c:
+            await asyncio.gather(*[c.online_score(**arguments) for arguments in arguments_list])
+    asyncio.run(run())
+
+
+def main(n_calls):
+    logging.disable(logging.INFO)
+    handler = type("Handler", (api.MainHTTPHandler,), {
+        "store_config": {"backend": "memory"},
+        "log_message": lambda *args: None,
+    })
+    server = ThreadingHTTPServer(("localhost", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    arguments_list = [{"first_name": "a", "last_name": str(i), "phone": "79175002040", "email": "a@b"}
+                      for i in range(n_calls)]
+    for name, func in (("new connection", naive), ("pooled", pooled),
+                       ("batched", batched), ("async coalesced", coalesced)):
+        started, cpu = time.perf_counter(), time.process_time()
+        func(server.server_address, arguments_list)
+        elapsed, cpu = time.perf_counter() - started, time.process_time() - cpu
+        print("{:<16} {:>8.1f} us/call {:>8.1f} us cpu/call (client and server)".format(
+            name, elapsed / n_calls * 1e6, cpu / n_calls * 1e6))
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,40 @@
+"""clients_interests with large client_ids lists: time and memory.
+
+Half of the ids in every request are repeats.
+
+    python3 -m benchmarks.client_ids
+"""
+import logging
+import random
+import timeit
+import tracemalloc
+
+from api import api
+from api import store
+
+
+def main():
+    logging.disable(logging.INFO)
+    n_clients = 100000
+    s = store.MemoryStore({"i:%s" % cid: '["cars", "pets"]' for cid in range(n_clients)})
+    field = api.ClientIDsField()
+    print("{:>7} {:>12} {:>12} {:>14}".format("ids", "validate", "response", "field mem/id"))
+    for n_ids in (100, 1000, 10000, 100000):
+        unique = random.sample(range(n_clients), n_ids // 2)
+        ids = unique + random.choices(unique, k=n_ids - len(unique))
+        number = max(1, 100000 // n_ids)
+        validate = min(timeit.repeat(lambda: field.validate(ids), number=number, repeat=3)) / number
+        req = api.ClientsInterestsRequest({"client_ids": ids})
+        req.is_valid()
+        respond = min(timeit.repeat(lambda: req.get_response({}, s), number=number, repeat=3)) / number
+        tracemalloc.start()
+        clean = field.validate(ids)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del clean
+        print("{:>7} {:>10.2f}ms {:>10.2f}ms {:>12.1f} B".format(
+            n_ids, validate * 1000, respond * 1000, size / n_ids))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""JSON codecs on typical payloads.
+
+    python3 -m benchmarks.codec
+"""
+import random
+import timeit
+
+from api import codec
+
+INTERESTS = ["cars", "pets", "travel", "hi-tech", "sport", "music", "books", "tv", "cinema", "geek", "otus"]
+
+
+def payloads():
+    score_request = codec.StdlibCodec.dumps({
+        "account": "horns&hoofs", "login": "h&f", "method": "online_score",
+        "token": "55cc9ce545bcd144300fe9efc28e65d415b923ebb6be1e19d2750a2c03e80dd2"
+                 "09a27954dca045e5bb12418e7d89b6d718a9e35af34e14e1d5bcd5a08f21fc95",
+        "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru", "first_name": "Стансилав",
+                      "last_name": "Ступников", "birthday": "01.01.1990", "gender": 1}})
+    score_response = {"response": {"score": 5.0}, "code": 200}
+    ids = random.sample(range(10 ** 7), 10000)
+    interests_request = codec.StdlibCodec.dumps({
+        "account": "horns&hoofs", "login": "admin", "method": "clients_interests", "token": "x" * 128,
+        "arguments": {"client_ids": ids, "date": "20.07.2017"}})
+    interests_response = {"response": {cid: random.sample(INTERESTS, 2) for cid in ids}, "code": 200}
+    return [
+        ("online_score request", "loads", score_request),
+        ("online_score response", "dumps", score_response),
+        ("clients_interests request 10k ids", "loads", interests_request),
+        ("clients_interests response 10k ids", "dumps", interests_response),
+        ("stored interests", "loads", b'["cars", "pets"]'),
+    ]
+
+
+def main():
+    print("{:<36} {:<6}".format("payload", "op") + "".join("{:>12}".format(name) for name in codec.CODECS))
+    for name, op, payload in payloads():
+        number = 20 if "10k" in name else 20000
+        line = "{:<36} {:<6}".format(name, op)
+        for c in codec.CODECS.values():
+            func = getattr(c, op)
+            best = min(timeit.repeat(lambda: func(payload), number=number, repeat=3)) / number
+            line += "{:>10.2f}us".format(best * 1e6)
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
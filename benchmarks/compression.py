@@ -0,0 +1,45 @@
+"""Bandwidth / latency trade-off of response compression.
+
+For clients_interests responses of growing size prints the compression
+ratio, the time to compress and the estimated time to deliver the body
+over a few link speeds, compressed and not.
+
+    python3 -m benchmarks.compression
+"""
+import json
+import random
+import timeit
+
+from api import compression
+
+INTERESTS = ["cars", "pets", "travel", "hi-tech", "sport", "music", "books", "tv", "cinema", "geek", "otus"]
+LINKS = {"10Mbit": 10e6 / 8, "100Mbit": 100e6 / 8, "1Gbit": 1e9 / 8}
+
+
+def payload(n_ids):
+    response = {cid: random.sample(INTERESTS, 2) for cid in range(n_ids)}
+    return json.dumps({"response": response, "code": 200}).encode("utf-8")
+
+
+def main():
+    header = "{:>7} {:>9} {:<8} {:>6} {:>9}".format("ids", "bytes", "codec", "ratio", "compress")
+    print(header + "".join("{:>12}".format(link) for link in LINKS))
+    for n_ids in (10, 100, 1000, 10000, 100000):
+        body = payload(n_ids)
+        rows = [("identity", body, 0.0)]
+        for codec in compression.CODECS:
+            compressed = compression.compress(body, codec)
+            number = max(1, 200000 // len(body))
+            seconds = min(timeit.repeat(lambda: compression.compress(body, codec), number=number, repeat=3)) / number
+            rows.append((codec, compressed, seconds))
+        for codec, data, seconds in rows:
+            line = "{:>7} {:>9} {:<8} {:>6.2f} {:>7.2f}ms".format(
+                n_ids, len(body), codec, len(body) / len(data), seconds * 1000)
+            line += "".join("{:>10.2f}ms".format((seconds + len(data) / speed) * 1000)
+                            for speed in LINKS.values())
+            print(line)
+    print("compression is skipped below {} bytes".format(compression.MIN_SIZE))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Point-in-time interests queries as the history of a client grows.
+
+Compares decoding a plain JSON list of (date, interests) entries and
+bisecting it, the cost of every request without an index, with a query
+of the yearly segments in memory and through `store.Store` against
+a local Redis stand-in.  A query reads the directory and one segment,
+"read KB" is their size at most.  Ingestion is timed with the default
+compaction interval.
+
+    python3 -m benchmarks.history
+"""
+import bisect
+import json
+import logging
+import random
+import timeit
+from datetime import datetime, timedelta
+
+from api import codec
+from api import history
+from api import store
+from tests.fake_redis import FakeRedis
+
+INTERESTS = ["cars", "pets", "travel", "hi-tech", "sport", "music", "books", "tv", "cinema", "geek", "otus"]
+START = datetime(2010, 1, 1)
+
+
+def make_entries(n):
+    return [((START + timedelta(days=i)).toordinal(), random.sample(INTERESTS, 3)) for i in range(n)]
+
+
+def main():
+    logging.disable(logging.INFO)
+    with FakeRedis(latency=0.0002) as server:
+        redis_store = store.Store(server.config)
+        run(redis_store)
+    ingestion()
+
+
+def run(redis_store):
+    print("{:>7} {:>10} {:>12} {:>14} {:>14}".format(
+        "entries", "read KB", "json list", "as of (memory)", "as of (redis)"))
+    for n in (10, 100, 1000, 10000, 100000):
+        entries = make_entries(n)
+        writes = history.compaction_writes(store.MemoryStore(), [(1, None, entries)])
+        read = len(dict(writes)["ih:1"]) + max(len(value) for key, value in writes if key.startswith("ih:1:"))
+        plain = json.dumps(entries)
+        dates = [random.choice(entries)[0] for _ in range(100)]
+
+        def scan():
+            for date in dates:
+                loaded = codec.loads(plain)
+                i = bisect.bisect_right([d for d, _ in loaded], date) - 1
+                loaded[i][1]
+
+        s = store.MemoryStore(dict(writes))
+        redis_store.set_many(writes)
+        as_of = [datetime.fromordinal(date) for date in dates]
+
+        def query(db):
+            for date in as_of:
+                history.get_interests_many(db, [1], date)
+
+        number = max(1, 1000 // n)
+        times = [min(timeit.repeat(f, number=number, repeat=3)) / number / len(dates)
+                 for f in (scan, lambda: query(s), lambda: query(redis_store))]
+        print("{:>7} {:>10.1f} {:>10.1f}us {:>12.1f}us {:>12.1f}us".format(
+            n, read / 1024, *(t * 1e6 for t in times)))
+
+
+def ingestion():
+    n_clients, n_updates = 1000, 50000
+    updates = [(random.randrange(n_clients), START + timedelta(days=random.randrange(3650)),
+                random.sample(INTERESTS, 3)) for _ in range(n_updates)]
+    s = store.MemoryStore()
+    elapsed = timeit.timeit(lambda: [history.ingest(s, updates[i:i + 1000]) for i in range(0, n_updates, 1000)],
+                            number=1)
+    print("ingest: {:.0f} updates/s".format(n_updates / elapsed))
+
+
+if __name__ == "__main__":
+    main()
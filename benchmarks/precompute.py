@@ -0,0 +1,63 @@
+"""Score precomputation: request latency with and without it, pipeline throughput.
+
+Runs against the in-process fake server with a 0.2ms round trip.  The
+first request for a profile misses and writes the score, after the
+pipeline processed its change event the request only reads it.  The
+pipeline is fed from a queue with a batch size per run.
+
+    python3 -m benchmarks.precompute [N_PROFILES]
+"""
+import logging
+import sys
+import time
+
+from api import precompute
+from api import scoring
+from api import store
+from tests.fake_redis import FakeRedis
+
+
+def profiles(n, tag):
+    return [{"phone": "7917{:07d}".format(i), "email": "{}{}@otus.ru".format(tag, i)} for i in range(n)]
+
+
+def request_all(s, batch):
+    for profile in batch:
+        scoring.get_score(s, profile["phone"], profile["email"])
+
+
+def main(n_profiles):
+    logging.disable(logging.WARNING)
+    with FakeRedis(latency=0.0002) as server:
+        s = store.Store(server.config)
+        cold = profiles(n_profiles, "cold")
+        started = time.perf_counter()
+        request_all(s, cold)
+        miss = (time.perf_counter() - started) / n_profiles
+        print("{:>24} {:>10}".format("first request", "per call"))
+        print("{:>24} {:>8.1f}us".format("cold cache", miss * 1e6))
+        warm = profiles(n_profiles, "warm")
+        source = precompute.QueueSource()
+        for profile in warm:
+            source.events.put({"profile": profile})
+        precompute.Precomputer(s, source, batch_size=500, batch_timeout=0).run(max_events=n_profiles)
+        started = time.perf_counter()
+        request_all(s, warm)
+        hit = (time.perf_counter() - started) / n_profiles
+        print("{:>24} {:>8.1f}us".format("precomputed", hit * 1e6))
+
+        print()
+        print("{:>7} {:>12} {:>12}".format("batch", "events/s", "max lag"))
+        for batch_size in (1, 10, 100, 500):
+            source = precompute.QueueSource()
+            now = time.time()
+            for profile in profiles(n_profiles, "b{}".format(batch_size)):
+                source.events.put({"profile": profile, "ts": now})
+            pipeline = precompute.Precomputer(s, source, batch_size=batch_size, batch_timeout=0)
+            pipeline.run(max_events=n_profiles)
+            metrics = pipeline.metrics.snapshot()
+            print("{:>7} {:>12.0f} {:>10.3f}s".format(batch_size, metrics["events_per_sec"], metrics["max_lag_sec"]))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,56 @@
+"""Key distribution and per-shard load of the consistent-hash ring.
+
+Synthetic client ids are mapped to `i:<cid>` and `uid:<md5>` keys, a
+request mix picks ids with a skewed (Zipf-like) popularity.
+
+    python3 -m benchmarks.sharding [N_CLIENTS]
+"""
+import hashlib
+import random
+import statistics
+import sys
+import timeit
+from collections import Counter
+
+from api import sharding
+from api import store
+
+NODES = ["10.0.0.{}:6379/0".format(i) for i in range(1, 5)]
+
+
+def spread(counts, nodes):
+    values = [counts.get(node, 0) for node in nodes]
+    mean = statistics.mean(values)
+    return max(values) / mean, statistics.pstdev(values) / mean
+
+
+def main(n_clients):
+    keys = ["i:{}".format(cid) for cid in range(n_clients)]
+    keys += ["uid:" + hashlib.md5(str(cid).encode()).hexdigest() for cid in range(n_clients)]
+    print("{} keys on {} shards".format(len(keys), len(NODES)))
+    print("{:>7} {:>10} {:>8} {:>10}".format("vnodes", "max/mean", "cv", "moved(+1)"))
+    for vnodes in (1, 10, 40, 160, 640):
+        ring = sharding.HashRing(NODES, vnodes)
+        bigger = sharding.HashRing(NODES + ["10.0.0.5:6379/0"], vnodes)
+        peak, cv = spread(Counter(ring.get_node(k) for k in keys), NODES)
+        moved = sum(1 for _ in sharding.moved_keys(keys, ring, bigger)) / len(keys)
+        print("{:>7} {:>10.3f} {:>8.3f} {:>9.1%}".format(vnodes, peak, cv, moved))
+
+    ring = sharding.HashRing(NODES)
+    weights = [1 / (rank + 1) for rank in range(n_clients)]
+    requests = random.choices(range(n_clients), weights, k=100000)
+    load = Counter(ring.get_node("i:{}".format(cid)) for cid in requests)
+    peak, cv = spread(load, NODES)
+    print("skewed request load: max/mean {:.3f}, cv {:.3f}".format(peak, cv))
+
+    sharded = sharding.ShardedStore({node: store.MemoryStore() for node in NODES})
+    sharded.set_many([(k, "[]") for k in keys[:n_clients]])
+    batch = keys[:1000]
+    for name, func in (("get", lambda: [sharded.get(k) for k in batch]),
+                       ("get_many", lambda: sharded.get_many(batch))):
+        best = min(timeit.repeat(func, number=1, repeat=5))
+        print("{:<9} {:.3f} us/key".format(name, best / len(batch) * 1e6))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,39 @@
+"""Interests lookup latency: mmap snapshot vs in-process dict store.
+
+    python3 -m benchmarks.snapshot [N_CLIENTS]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+from api import scoring
+from api import snapshot
+from api import store
+
+
+def main(n_clients):
+    interests = ["cars", "pets", "travel", "hi-tech", "sport", "music", "books", "tv"]
+    items = [(cid, random.sample(interests, 2)) for cid in range(0, n_clients * 3, 3)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "interests.snap")
+        snapshot.write_snapshot(path, items)
+        reader = snapshot.InterestsSnapshot(path)
+        snapshot_store = snapshot.SnapshotStore(path)
+        memory_store = store.MemoryStore({"i:%s" % cid: json.dumps(v) for cid, v in items})
+        ids = [random.randrange(n_clients * 3) // 3 * 3 for _ in range(10000)]
+        cases = [
+            ("snapshot view", lambda: [reader.get(cid) for cid in ids]),
+            ("snapshot get_interests", lambda: [scoring.get_interests(snapshot_store, cid) for cid in ids]),
+            ("memory get_interests", lambda: [scoring.get_interests(memory_store, cid) for cid in ids]),
+        ]
+        print("{} clients, {} lookups per run".format(n_clients, len(ids)))
+        for name, func in cases:
+            best = min(timeit.repeat(func, number=1, repeat=5))
+            print("{:<24} {:8.3f} us/lookup".format(name, best / len(ids) * 1e6))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
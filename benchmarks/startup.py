@@ -0,0 +1,54 @@
+"""Cold start cost of a worker: `import api.api` plus the first request.
+
+Every run is a fresh interpreter, as for a pre-forked worker or a CLI tool.
+
+    python3 -m benchmarks.startup [RUNS]
+"""
+import json
+import statistics
+import subprocess
+import sys
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+from api import api
+t1 = time.perf_counter()
+
+import http.client, threading
+from http.server import HTTPServer
+
+api.MainHTTPHandler.store_config = {"backend": "memory"}
+api.MainHTTPHandler.log_message = lambda *args: None
+server = HTTPServer(("localhost", 0), api.MainHTTPHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+body = {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+        "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}}
+body["token"] = api.hashlib.sha512((body["account"] + body["login"] + api.SALT).encode()).hexdigest()
+t2 = time.perf_counter()
+conn = http.client.HTTPConnection("localhost", server.server_address[1])
+conn.request("POST", "/method/", json.dumps(body))
+assert json.loads(conn.getresponse().read())["code"] == api.OK
+t3 = time.perf_counter()
+# the handler keeps the connection alive, the single-threaded server only
+# returns to shutdown() once it is closed
+conn.close()
+server.shutdown()
+print(json.dumps({"import": t1 - t0, "first_request": t3 - t2}))
+"""
+
+
+def main(runs):
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", CHILD], check=True,
+                             capture_output=True, text=True).stdout
+        results.append(json.loads(out))
+    for name in ("import", "first_request"):
+        values = sorted(r[name] * 1000 for r in results)
+        print("{:<14} median {:7.2f} ms  min {:7.2f} ms  max {:7.2f} ms".format(
+            name, statistics.median(values), values[0], values[-1]))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
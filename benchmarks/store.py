@@ -0,0 +1,68 @@
+"""Redis Store under controlled network conditions.
+
+Runs against the in-process fake server, so no redis-server is needed:
+per-key calls against batched calls at several round-trip latencies,
+then the cost of retries with injected drops and disconnects.
+
+    python3 -m benchmarks.store [N_KEYS]
+"""
+import logging
+import sys
+import time
+
+from api import store
+from tests.fake_redis import FakeRedis
+
+LATENCIES = (0, 0.0002, 0.001)
+
+
+def timed(func):
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def batching(n_keys):
+    keys = ["i:{}".format(cid) for cid in range(n_keys)]
+    items = [(key, '["cars", "pets"]') for key in keys]
+    print("{:>9} {:>12} {:>12} {:>12} {:>12}".format("rtt", "set", "set_many", "get", "get_many"))
+    for latency in LATENCIES:
+        with FakeRedis(latency=latency) as server:
+            s = store.Store(server.config)
+            results = [timed(lambda: [s.set(key, value) for key, value in items]),
+                       timed(lambda: s.set_many(items)),
+                       timed(lambda: [s.get(key) for key in keys]),
+                       timed(lambda: s.get_many(keys))]
+        print("{:>7.1f}ms".format(latency * 1000) +
+              "".join("{:>10.1f}us".format(t / n_keys * 1e6) for t in results))
+
+
+def faults(n_keys, batch_size=100):
+    keys = ["uid:{}".format(i) for i in range(n_keys)]
+    batches = [keys[i:i + batch_size] for i in range(0, n_keys, batch_size)]
+    print("{:>11} {:>6} {:>12} {:>8} {:>14} {:>8} {:>8}".format(
+        "fault", "rate", "get", "misses", "get_many/{}".format(batch_size), "misses", "conns"))
+    for fault, rate in (("none", 0), ("disconnect", 0.01), ("disconnect", 0.05), ("drop", 0.002)):
+        with FakeRedis(latency=0.0002, seed=1) as server:
+            s = store.Store(server.config, reconnect_delay=0)
+            s.cache_set_many([(key, "5.0") for key in keys], 3600)
+            if rate:
+                setattr(server, fault + "_rate", rate)
+            server.reset_stats()
+            single, batched = [], []
+            get = timed(lambda: single.extend(s.cache_get(key) for key in keys))
+            get_many = timed(lambda: [batched.extend(s.cache_get_many(batch)) for batch in batches])
+            print("{:>11} {:>6.3f} {:>10.1f}us {:>8} {:>12.1f}us {:>8} {:>8}".format(
+                fault, rate, get / n_keys * 1e6, single.count(None),
+                get_many / n_keys * 1e6, batched.count(None), server.connections))
+
+
+def main(n_keys):
+    logging.disable(logging.ERROR)
+    batching(n_keys)
+    print()
+    faults(n_keys)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,54 @@
+"""Per-request tracing overhead of method_handler at several sample rates.
+
+    python3 -m benchmarks.tracing [REQUESTS]
+"""
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import timeit
+
+from api import api
+from api import store
+from api import tracing
+
+
+class NullExporter:
+    def export(self, span):
+        pass
+
+
+def make_request():
+    request = {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+               "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}}
+    msg = request["account"] + request["login"] + api.SALT
+    request["token"] = hashlib.sha512(msg.encode("utf-8")).hexdigest()
+    return {"body": request, "headers": {}}
+
+
+def run(tracer, s, request, n):
+    for _ in range(n):
+        with tracer.trace("POST /method/", request["headers"]):
+            api.method_handler(request, {}, s)
+
+
+def main(n):
+    logging.disable(logging.INFO)
+    s = store.MemoryStore()
+    request = make_request()
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [("disabled", tracing.Tracer())]
+        for rate in (0.0, 0.01, 0.1, 1.0):
+            cases.append(("null  rate={}".format(rate), tracing.Tracer(NullExporter(), rate)))
+        cases.append(("file  rate=1.0", tracing.Tracer(tracing.FileExporter(os.path.join(tmp, "spans")), 1.0)))
+        baseline = None
+        for name, tracer in cases:
+            best = min(timeit.repeat(lambda: run(tracer, s, request, n), number=1, repeat=5)) / n * 1e6
+            baseline = baseline or best
+            print("{:<16} {:7.2f} us/request  overhead {:+6.2f} us ({:+5.1f}%)".format(
+                name, best, best - baseline, (best - baseline) / baseline * 100))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
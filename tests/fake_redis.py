@@ -0,0 +1,513 @@
+"""In-process Redis stand-in speaking RESP over a local socket.
+
+Supports the commands `store.Store` and the tools around it use (HELLO,
+PING, GET/SET with EX/PX/NX/XX, MGET, DEL, EXISTS, EXPIRE, TTL/PTTL, SCAN,
+MEMORY USAGE, FLUSHDB, DBSIZE, SELECT, XADD, XLEN, XREVRANGE, XREAD with BLOCK) and
+pipelining.  Network
+conditions are injected per server:
+
+    latency          seconds slept once per read from a connection, the
+                     round trip a pipeline pays once
+    command_latency  {"GET": seconds, ...} slept before every such command
+    drop_rate        share of commands that get no reply at all
+    disconnect_rate  share of commands answered by closing the connection
+
+Random faults come from a seeded generator, `fail_next` forces the next
+commands to fail, so runs are reproducible.
+
+    with FakeRedis(latency=0.001, drop_rate=0.01, seed=1) as server:
+        s = store.Store(server.config)
+"""
+import bisect
+import collections
+import fnmatch
+import random
+import socket
+import socketserver
+import threading
+import time
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class Status(str):
+    pass
+
+
+class Error(str):
+    pass
+
+
+OK = Status("OK")
+WRONGTYPE = Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+
+
+class Stream(list):
+    """Entries ((ms, seq), [field, value, ...]) in id order."""
+
+    def last_id(self):
+        return self[-1][0] if self else (0, 0)
+
+
+class Blocked:
+    """Reply of a blocking command that found nothing: retried with
+    `args` until the `deadline` of the first attempt, then answered with nil."""
+
+    def __init__(self, args, deadline):
+        self.args = args
+        self.deadline = deadline
+
+
+def parse_stream_id(value, default_seq=0):
+    ms, _, seq = value.partition(b"-")
+    return int(ms), int(seq) if seq else default_seq
+
+
+def format_stream_id(stream_id):
+    return "{}-{}".format(*stream_id).encode()
+
+
+def encode(value, resp3=False):
+    """Serialize a reply: None, bytes, int, list, dict, Status or Error."""
+    if value is None:
+        return b"_\r\n" if resp3 else b"$-1\r\n"
+    if isinstance(value, Status):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, Error):
+        return b"-" + value.encode() + b"\r\n"
+    if isinstance(value, int):
+        return b":" + str(value).encode() + b"\r\n"
+    if isinstance(value, bytes):
+        return b"$" + str(len(value)).encode() + b"\r\n" + value + b"\r\n"
+    if isinstance(value, dict):
+        if resp3:
+            return b"%" + str(len(value)).encode() + b"\r\n" + b"".join(
+                encode(k, resp3) + encode(v, resp3) for k, v in value.items())
+        value = [item for pair in value.items() for item in pair]
+    return b"*" + str(len(value)).encode() + b"\r\n" + b"".join(encode(item, resp3) for item in value)
+
+
+def parse_command(buffer, start=0):
+    """Return (command args, position after it) or (None, start) if incomplete."""
+    end = buffer.find(b"\r\n", start)
+    if end == -1:
+        return None, start
+    if buffer[start:start + 1] != b"*":
+        return buffer[start:end].split(), end + 2
+    try:
+        count = int(buffer[start + 1:end])
+    except ValueError:
+        raise ProtocolError("invalid multibulk length")
+    args = []
+    pos = end + 2
+    for _ in range(count):
+        end = buffer.find(b"\r\n", pos)
+        if end == -1:
+            return None, start
+        if buffer[pos:pos + 1] != b"$":
+            raise ProtocolError("expected '$', got '{}'".format(buffer[pos:pos + 1].decode(errors="replace")))
+        size = int(buffer[pos + 1:end])
+        pos = end + 2
+        if len(buffer) < pos + size + 2:
+            return None, start
+        args.append(buffer[pos:pos + size])
+        pos += size + 2
+    return args, pos
+
+
+class Database:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def alive(self, key, now):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= now:
+            del self.data[key]
+            del self.expires[key]
+        return key in self.data
+
+    def get(self, key, now):
+        return self.data[key] if self.alive(key, now) else None
+
+    def set(self, key, value, expires_at=None):
+        self.data[key] = value
+        if expires_at is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = expires_at
+
+    def delete(self, key, now):
+        if not self.alive(key, now):
+            return 0
+        del self.data[key]
+        self.expires.pop(key, None)
+        return 1
+
+    def clear(self):
+        self.data.clear()
+        self.expires.clear()
+
+
+class FakeRedis:
+    def __init__(self, host="127.0.0.1", port=0, databases=16, latency=0.0, command_latency=None,
+                 drop_rate=0.0, disconnect_rate=0.0, seed=None):
+        self.host = host
+        self.port = port
+        self.dbs = [Database() for _ in range(databases)]
+        self.latency = latency
+        self.command_latency = dict(command_latency or {})
+        self.drop_rate = drop_rate
+        self.disconnect_rate = disconnect_rate
+        self.random = random.Random(seed)
+        self.forced = collections.deque()
+        self.lock = threading.Lock()
+        self.commands = collections.Counter()
+        self.cursors = {}
+        self.reads = 0
+        self.connections = 0
+        self.server = None
+
+    @property
+    def config(self):
+        return {"host": self.host, "port": self.port, "db": 0}
+
+    def fail_next(self, fault, times=1):
+        """Force the next `times` commands to "drop" or "disconnect"."""
+        if fault not in ("drop", "disconnect"):
+            raise ValueError("Unknown fault: {}".format(fault))
+        with self.lock:
+            self.forced.extend([fault] * times)
+
+    def reset_stats(self):
+        with self.lock:
+            self.commands.clear()
+            self.reads = 0
+            self.connections = 0
+
+    def start(self):
+        fake = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                fake.serve(self.request)
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.server = Server((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05},
+                         name="fake-redis", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def fault(self):
+        with self.lock:
+            if self.forced:
+                return self.forced.popleft()
+            if self.drop_rate and self.random.random() < self.drop_rate:
+                return "drop"
+            if self.disconnect_rate and self.random.random() < self.disconnect_rate:
+                return "disconnect"
+        return None
+
+    def serve(self, sock):
+        with self.lock:
+            self.connections += 1
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = {"db": 0, "resp3": False}
+        buffer = b""
+        while True:
+            try:
+                chunk = sock.recv(65536)
+            except OSError:
+                return
+            if not chunk:
+                return
+            buffer += chunk
+            with self.lock:
+                self.reads += 1
+            if self.latency:
+                time.sleep(self.latency)
+            replies = []
+            pos = 0
+            while True:
+                try:
+                    args, pos = parse_command(buffer, pos)
+                except ProtocolError as e:
+                    replies.append(encode(Error("ERR Protocol error: {}".format(e))))
+                    sock.sendall(b"".join(replies))
+                    return
+                if args is None:
+                    break
+                if not args:
+                    continue
+                name = args[0].decode(errors="replace").upper()
+                fault = self.fault()
+                if fault == "disconnect":
+                    sock.sendall(b"".join(replies))
+                    sock.close()
+                    return
+                delay = self.command_latency.get(name)
+                if delay:
+                    time.sleep(delay)
+                reply = self.execute(session, name, args[1:])
+                deadline = reply.deadline if isinstance(reply, Blocked) else None
+                while isinstance(reply, Blocked):
+                    if time.monotonic() >= deadline:
+                        reply = None
+                        break
+                    time.sleep(0.005)
+                    reply = self.execute(session, name, reply.args)
+                if fault != "drop":
+                    replies.append(encode(reply, session["resp3"]))
+            buffer = buffer[pos:]
+            if replies:
+                try:
+                    sock.sendall(b"".join(replies))
+                except OSError:
+                    return
+
+    def execute(self, session, name, args):
+        handler = getattr(self, "cmd_" + name.lower(), None)
+        if handler is None:
+            return Error("ERR unknown command '{}'".format(name))
+        with self.lock:
+            self.commands[name] += 1
+            try:
+                return handler(session, self.dbs[session["db"]], time.monotonic(), *args)
+            except TypeError:
+                return Error("ERR wrong number of arguments for '{}' command".format(name.lower()))
+            except (ValueError, IndexError):
+                return Error("ERR syntax error")
+
+    def cmd_hello(self, session, db, now, protover=b"2", *args):
+        if protover not in (b"2", b"3"):
+            return Error("NOPROTO unsupported protocol version")
+        session["resp3"] = protover == b"3"
+        return {b"server": b"redis", b"version": b"7.0.0", b"proto": int(protover), b"id": self.connections,
+                b"mode": b"standalone", b"role": b"master", b"modules": []}
+
+    def cmd_client(self, session, db, now, *args):
+        return OK
+
+    def cmd_ping(self, session, db, now, message=None):
+        return Status("PONG") if message is None else message
+
+    def cmd_echo(self, session, db, now, message):
+        return message
+
+    def cmd_select(self, session, db, now, index):
+        index = int(index)
+        if not 0 <= index < len(self.dbs):
+            return Error("ERR DB index is out of range")
+        session["db"] = index
+        return OK
+
+    def cmd_get(self, session, db, now, key):
+        value = db.get(key, now)
+        return WRONGTYPE if isinstance(value, Stream) else value
+
+    def cmd_mget(self, session, db, now, key, *keys):
+        values = [db.get(k, now) for k in (key,) + keys]
+        return [None if isinstance(value, Stream) else value for value in values]
+
+    def cmd_set(self, session, db, now, key, value, *options):
+        expires_at, nx, xx = None, False, False
+        options = [option.upper() for option in options]
+        i = 0
+        while i < len(options):
+            option = options[i]
+            if option in (b"EX", b"PX"):
+                amount = int(options[i + 1])
+                if amount <= 0:
+                    return Error("ERR invalid expire time in 'set' command")
+                expires_at = now + (amount if option == b"EX" else amount / 1000)
+                i += 1
+            elif option == b"NX":
+                nx = True
+            elif option == b"XX":
+                xx = True
+            else:
+                raise ValueError(option)
+            i += 1
+        exists = db.alive(key, now)
+        if (nx and exists) or (xx and not exists):
+            return None
+        db.set(key, value, expires_at)
+        return OK
+
+    def cmd_del(self, session, db, now, key, *keys):
+        return sum(db.delete(k, now) for k in (key,) + keys)
+
+    def cmd_exists(self, session, db, now, key, *keys):
+        return sum(db.alive(k, now) for k in (key,) + keys)
+
+    def cmd_pttl(self, session, db, now, key):
+        if not db.alive(key, now):
+            return -2
+        expires_at = db.expires.get(key)
+        return -1 if expires_at is None else int((expires_at - now) * 1000)
+
+    def cmd_ttl(self, session, db, now, key):
+        if not db.alive(key, now):
+            return -2
+        expires_at = db.expires.get(key)
+        return -1 if expires_at is None else round(expires_at - now)
+
+    def cmd_expire(self, session, db, now, key, seconds):
+        if not db.alive(key, now):
+            return 0
+        db.expires[key] = now + int(seconds)
+        return 1
+
+    def cmd_memory(self, session, db, now, subcommand, key, *options):
+        """USAGE approximated as the key and value plus 48 bytes of overhead."""
+        if subcommand.upper() != b"USAGE":
+            return Error("ERR unknown subcommand '{}'".format(subcommand.decode(errors="replace")))
+        value = db.get(key, now)
+        return None if value is None else len(key) + len(value) + 48
+
+    def cmd_scan(self, session, db, now, cursor, *options):
+        """Keys in sorted order; a cursor remembers the last key returned,
+        so keys deleted meanwhile do not make the scan skip others."""
+        pattern, count = None, 10
+        for option, value in zip(options[::2], options[1::2]):
+            if option.upper() == b"MATCH":
+                pattern = value.decode()
+            elif option.upper() == b"COUNT":
+                count = int(value)
+            else:
+                raise ValueError(option)
+        keys = sorted(db.data)
+        start = 0
+        if int(cursor):
+            start = bisect.bisect_right(keys, self.cursors.pop(int(cursor)))
+        batch = keys[start:start + count]
+        following = 0
+        if start + count < len(keys):
+            following = len(self.cursors) + 1
+            while following in self.cursors:
+                following += 1
+            self.cursors[following] = batch[-1]
+        found = [k for k in batch if db.alive(k, now) and
+                 (pattern is None or fnmatch.fnmatchcase(k.decode(errors="replace"), pattern))]
+        return [str(following).encode(), found]
+
+    def cmd_xadd(self, session, db, now, key, *args):
+        args = list(args)
+        maxlen = None
+        if args and args[0].upper() == b"MAXLEN":
+            args.pop(0)
+            if args[0] in (b"~", b"="):
+                args.pop(0)
+            maxlen = int(args.pop(0))
+        entry_id, fields = args[0], args[1:]
+        if not fields or len(fields) % 2:
+            raise TypeError("wrong number of field values")
+        stream = db.get(key, now)
+        if stream is None:
+            stream = Stream()
+        elif not isinstance(stream, Stream):
+            return WRONGTYPE
+        last = stream.last_id()
+        if entry_id == b"*":
+            ms = int(time.time() * 1000)
+            new_id = (last[0], last[1] + 1) if ms <= last[0] else (ms, 0)
+        else:
+            new_id = parse_stream_id(entry_id)
+            if new_id <= last:
+                return Error("ERR The ID specified in XADD is equal or smaller than the target stream top item")
+        stream.append((new_id, list(fields)))
+        if maxlen is not None and len(stream) > maxlen:
+            del stream[:len(stream) - maxlen]
+        db.set(key, stream, db.expires.get(key))
+        return format_stream_id(new_id)
+
+    def cmd_xlen(self, session, db, now, key):
+        stream = db.get(key, now)
+        if stream is not None and not isinstance(stream, Stream):
+            return WRONGTYPE
+        return len(stream or ())
+
+    def cmd_xrevrange(self, session, db, now, key, end, start, *options):
+        count = None
+        if options:
+            if len(options) != 2 or options[0].upper() != b"COUNT":
+                raise ValueError(options)
+            count = int(options[1])
+        stream = db.get(key, now)
+        if stream is not None and not isinstance(stream, Stream):
+            return WRONGTYPE
+        high = (float("inf"),) if end == b"+" else parse_stream_id(end, float("inf"))
+        low = (0, 0) if start == b"-" else parse_stream_id(start)
+        entries = [[format_stream_id(entry_id), fields] for entry_id, fields in reversed(stream or ())
+                   if low <= entry_id <= high]
+        return entries[:count]
+
+    def cmd_xread(self, session, db, now, *args):
+        """`$` ids are resolved when the command arrives, so a blocked
+        read returns the entries added while it waits."""
+        count, block = None, None
+        upper = [arg.upper() for arg in args]
+        i = 0
+        while upper[i] != b"STREAMS":
+            if upper[i] == b"COUNT":
+                count = int(args[i + 1])
+            elif upper[i] == b"BLOCK":
+                block = int(args[i + 1])
+            else:
+                raise ValueError(args[i])
+            i += 2
+        names = args[i + 1:]
+        if not names or len(names) % 2:
+            return Error("ERR Unbalanced 'xread' list of streams: for each stream key an ID must be specified.")
+        keys, ids = names[:len(names) // 2], list(names[len(names) // 2:])
+        found = {}
+        for n, key in enumerate(keys):
+            stream = db.get(key, now)
+            if stream is not None and not isinstance(stream, Stream):
+                return WRONGTYPE
+            if ids[n] == b"$":
+                ids[n] = format_stream_id((stream or Stream()).last_id())
+            after = parse_stream_id(ids[n])
+            entries = [(format_stream_id(entry_id), fields) for entry_id, fields in (stream or ())
+                       if entry_id > after][:count]
+            if entries:
+                found[key] = [list(entry) for entry in entries]
+        if not found:
+            if block is None:
+                return None
+            deadline = now + block / 1000 if block else float("inf")
+            return Blocked(args[:i + 1] + tuple(keys) + tuple(ids), deadline)
+        if session["resp3"]:
+            return found
+        return [[key, entries] for key, entries in found.items()]
+
+    def cmd_dbsize(self, session, db, now):
+        return sum(db.alive(k, now) for k in list(db.data))
+
+    def cmd_flushdb(self, session, db, now, *args):
+        db.clear()
+        return OK
+
+    def cmd_flushall(self, session, db, now, *args):
+        for d in self.dbs:
+            d.clear()
+        return OK
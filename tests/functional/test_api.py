@@ -1,4 +1,9 @@
 from datetime import datetime
+import http.client
+import json
+import socket
+import threading
+from http.server import ThreadingHTTPServer
 import unittest
 import redis
 import subprocess
@@ -6,6 +11,7 @@ import subprocess
 from tests import helper
 
 from api import api
+from api import history
 from api import store
 from api import scoring
 
@@ -18,7 +24,7 @@ redis_config = {
 }
 
 
-class MockStore():
+class MockStore(store.BaseStore):
     def __init__(self):
         self.data_store = {}
 
@@ -28,6 +34,10 @@ class MockStore():
     def cache_set(self, key, value, ttl_sec=None):
         self.data_store[key] = str(value)
 
+    def cache_delete_many(self, keys):
+        for key in keys:
+            self.data_store.pop(key, None)
+
     def get(self, key):
         return self.data_store.get(key, None)
 
@@ -105,6 +115,27 @@ class TestSuiteApiValidRequests(unittest.TestCase):
         self.assertEqual(score, expected_score(arguments))
         self.assertEqual(sorted(self.context["has"]), sorted(arguments.keys()))
 
+    def test_ok_interests_request_duplicates(self):
+        self.fill_db_interests()
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests",
+                   "arguments": {"client_ids": [3, 1, 3, 3, 1, 7]}}
+        helper.set_valid_auth(request)
+        response, code = self.get_response(request)
+        self.assertEqual(api.OK, code)
+        self.assertEqual(response, {1: ["yoga", "theater"], 3: ["football", "beer"], 7: []})
+        self.assertEqual(self.context.get("nclients"), 3)
+
+    def test_ok_interests_request_chunks(self):
+        for i in range(2500):
+            self.store.set("i:%s" % i, '["cid %s"]' % i)
+        ids = list(range(2500))
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests",
+                   "arguments": {"client_ids": ids[::-1] + ids}}
+        helper.set_valid_auth(request)
+        response, code = self.get_response(request)
+        self.assertEqual(api.OK, code)
+        self.assertEqual(response, {i: ["cid %s" % i] for i in ids})
+
     @helper.cases([
         {"client_ids": [1, 2, 3], "date": datetime.today().strftime("%d.%m.%Y")},
         {"client_ids": [1, 2], "date": "19.07.2017"},
@@ -123,6 +154,24 @@ class TestSuiteApiValidRequests(unittest.TestCase):
         self.assertEqual(self.context.get("nclients"), len(arguments["client_ids"]))
 
 
+    @helper.cases([
+        ("01.01.2017", {1: [], 2: ["beer"], 3: ["football", "beer"]}),
+        ("15.01.2017", {1: ["yoga"], 2: ["beer"], 3: ["football", "beer"]}),
+        ("20.01.2017", {1: ["cars"], 2: ["beer"], 3: ["football", "beer"]}),
+    ])
+    def test_ok_interests_request_as_of_date(self, date, expected):
+        self.store = store.MemoryStore({"i:3": '["football", "beer"]'})
+        history.ingest(self.store, [(1, datetime(2017, 1, 10), ["yoga"]),
+                                    (1, datetime(2017, 1, 20), ["cars"]),
+                                    (2, datetime(2016, 12, 31), ["beer"])])
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests",
+                   "arguments": {"client_ids": [1, 2, 3], "date": date}}
+        helper.set_valid_auth(request)
+        response, code = self.get_response(request)
+        self.assertEqual(api.OK, code)
+        self.assertEqual(response, expected)
+
+
 class TestSuiteApiInvalidRequests(unittest.TestCase):
 
     def setUp(self):
@@ -182,6 +231,7 @@ class TestSuiteApiInvalidRequests(unittest.TestCase):
         {"client_ids": {1: 2}, "date": "20.07.2017"},
         {"client_ids": ["1", "2"], "date": "20.07.2017"},
         {"client_ids": [1, 2], "date": "XXX"},
+        {"client_ids": list(range(api.MAX_CLIENT_IDS + 1))},
     ])
     def test_invalid_interests_request(self, arguments):
         request = {"account": "horns&hoofs", "login": "h&f",
@@ -192,5 +242,344 @@ class TestSuiteApiInvalidRequests(unittest.TestCase):
         self.assertTrue(len(response))
 
 
+class TestSuiteResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.store = store.MemoryStore({"i:1": '["yoga"]', "i:2": '["beer"]'})
+        self.cache = api.cache.ResponseCache()
+        self.store.add_listener(self.cache.invalidate)
+        api.response_cache = self.cache
+        self.addCleanup(setattr, api, "response_cache", None)
+
+    def get_response(self, arguments):
+        request = {"account": "horns&hoofs", "login": "h&f",
+                   "method": "clients_interests", "arguments": arguments}
+        helper.set_valid_auth(request)
+        context = {"request_id": "42"}
+        response, code = api.method_handler({"body": request, "headers": {}},
+                                            context, self.store)
+        return response, code, context
+
+    def test_cached_response(self):
+        response, code, context = self.get_response({"client_ids": [1, 2]})
+        self.assertEqual(api.OK, code)
+        self.assertIsInstance(response, api.cache.Encoded)
+        self.assertEqual(json.loads(response), {"1": ["yoga"], "2": ["beer"]})
+        self.store.data.clear()
+        cached, code, cached_context = self.get_response({"client_ids": [2, 1]})
+        self.assertEqual(api.OK, code)
+        self.assertEqual(cached, response)
+        self.assertEqual(cached_context, context)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_invalidated_response(self):
+        self.get_response({"client_ids": [1, 2]})
+        self.store.set("i:2", '["football"]')
+        response, _, _ = self.get_response({"client_ids": [1, 2]})
+        self.assertEqual(json.loads(response), {"1": ["yoga"], "2": ["football"]})
+
+    def test_validation_before_cache(self):
+        self.get_response({"client_ids": [1]})
+        _, code, _ = self.get_response({"client_ids": [1, 1.0]})
+        self.assertEqual(api.INVALID_REQUEST, code)
+
+    def test_stale_response_not_cached(self):
+        get_many = self.store.get_many
+
+        def racing_get_many(keys):
+            values = get_many(keys)
+            self.store.set("i:2", '["football"]')
+            return values
+        self.store.get_many = racing_get_many
+        response, _, _ = self.get_response({"client_ids": [1, 2]})
+        self.assertEqual(json.loads(response), {"1": ["yoga"], "2": ["beer"]})
+        self.assertEqual(len(self.cache.entries), 0)
+
+    def test_invalid_request_not_cached(self):
+        _, code, _ = self.get_response({"client_ids": [1, 2], "date": "XXX"})
+        self.assertEqual(api.INVALID_REQUEST, code)
+        self.assertEqual(len(self.cache.entries), 0)
+
+    def test_forbidden_before_cache(self):
+        self.get_response({"client_ids": [1, 2]})
+        request = {"account": "horns&hoofs", "login": "h&f", "token": "",
+                   "method": "clients_interests", "arguments": {"client_ids": [1, 2]}}
+        _, code = api.method_handler({"body": request, "headers": {}}, {}, self.store)
+        self.assertEqual(api.FORBIDDEN, code)
+
+
+class TestSuiteBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.context = {}
+        self.store = store.MemoryStore({"i:1": '["yoga"]'})
+
+    def get_response(self, body):
+        return api.batch_handler({"body": body, "headers": {}}, self.context, self.store)
+
+    def make_request(self, method, arguments, login="h&f"):
+        request = {"account": "horns&hoofs", "login": login, "method": method, "arguments": arguments}
+        helper.set_valid_auth(request)
+        return request
+
+    def test_batch(self):
+        forbidden = self.make_request("online_score", {"first_name": "a", "last_name": "b"})
+        forbidden["token"] = ""
+        response, code = self.get_response([
+            self.make_request("online_score", {"first_name": "a", "last_name": "b"}),
+            self.make_request("online_score", {"first_name": "a"}),
+            self.make_request("online_score", {"phone": "79175002040", "email": "a@b"}, "admin"),
+            self.make_request("clients_interests", {"client_ids": [1, 2]}),
+            forbidden,
+            "xxx",
+        ])
+        self.assertEqual(api.OK, code)
+        self.assertEqual([r["code"] for r in response],
+                         [api.OK, api.INVALID_REQUEST, api.OK, api.OK, api.FORBIDDEN, api.INVALID_REQUEST])
+        self.assertEqual(response[0]["response"], {"score": 0.5})
+        self.assertEqual(response[2]["response"], {"score": 42})
+        self.assertEqual(response[3]["response"], {1: ["yoga"], 2: []})
+        self.assertEqual(response[4]["error"], api.ERRORS[api.FORBIDDEN])
+        self.assertEqual(self.context["batch"], 6)
+
+    def test_batch_cached_response(self):
+        api.response_cache = api.cache.ResponseCache()
+        self.addCleanup(setattr, api, "response_cache", None)
+        request = self.make_request("clients_interests", {"client_ids": [1]})
+        response, _ = self.get_response([request, request])
+        self.assertEqual(response[0], response[1])
+        self.assertEqual(api.response_cache.hits, 1)
+        self.assertEqual(json.loads(json.dumps(response[1]["response"])), {"1": ["yoga"]})
+
+    @helper.cases([{}, "xxx", [{}] * (api.MAX_BATCH_SIZE + 1)])
+    def test_batch_invalid(self, body):
+        _, code = self.get_response(body)
+        self.assertEqual(api.INVALID_REQUEST, code)
+
+    def test_batch_client_ids_budget(self):
+        ids = list(range(api.MAX_BATCH_CLIENT_IDS // 2))
+        request = self.make_request("clients_interests", {"client_ids": ids})
+        _, code = self.get_response([request, request, self.make_request("clients_interests", {"client_ids": [1]})])
+        self.assertEqual(api.INVALID_REQUEST, code)
+        self.assertNotIn("batch", self.context)
+
+
+class TestSuiteProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MockStore()
+
+    def get_response(self, method, arguments, login="admin"):
+        request = {"account": "horns&hoofs", "login": login,
+                   "method": method, "arguments": arguments}
+        helper.set_valid_auth(request)
+        return api.profile_handler({"body": request, "headers": {}}, {}, self.store)
+
+    def busy(self, stop):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+                   "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}}
+        helper.set_valid_auth(request)
+        while not stop.is_set():
+            api.method_handler({"body": request, "headers": {}}, {}, self.store)
+
+    def run_busy(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=self.busy, args=(stop,), name="busy")
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(stop.set)
+
+    def test_profile_forbidden(self):
+        _, code = self.get_response("stacks", {"seconds": 0.01}, login="h&f")
+        self.assertEqual(api.FORBIDDEN, code)
+
+    @helper.cases([
+        ("stacks", {"seconds": 61}),
+        ("stacks", {"seconds": "1"}),
+        ("stacks", {"interval": 0}),
+        ("stacks", {"interval": 1e-300}),
+        ("allocations", {"seconds": float("nan")}),
+        ("allocations", {"limit": True}),
+    ])
+    def test_profile_invalid(self, method, arguments):
+        _, code = self.get_response(method, arguments)
+        self.assertEqual(api.INVALID_REQUEST, code)
+
+    def test_profile_unknown_mode(self):
+        _, code = self.get_response("cpu", {})
+        self.assertEqual(api.NOT_FOUND, code)
+
+    def test_profile_stacks(self):
+        self.run_busy()
+        with self.assertLogs(level="INFO"):
+            response, code = self.get_response("stacks", {"seconds": 0.2, "interval": 0.005})
+        self.assertEqual(api.OK, code)
+        self.assertGreater(response["samples"], 0)
+        lines = response["stacks"].splitlines()
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in lines))
+        self.assertTrue(any(line.startswith("busy;") and "api.py:method_handler" in line
+                            for line in lines))
+
+    def test_profile_allocations(self):
+        self.run_busy()
+        with self.assertLogs(level="INFO"):
+            response, code = self.get_response("allocations", {"seconds": 0.2, "limit": 5})
+        self.assertEqual(api.OK, code)
+        self.assertGreater(response["requests"]["online_score"], 0)
+        self.assertLessEqual(len(response["allocations"]["online_score"]), 5)
+
+    def test_profile_busy(self):
+        with api.profiler.lock:
+            response, code = self.get_response("stacks", {"seconds": 0.01})
+        self.assertEqual(api.INVALID_REQUEST, code)
+
+
+class TestSuiteHTTP(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        interests = {"i:%s" % i: '["cars", "pets", "travel"]' for i in range(1000)}
+        handler = type("Handler", (api.MainHTTPHandler,), {
+            "store_config": {"backend": "memory", "data": interests},
+            "log_message": lambda *args: None,
+        })
+        cls.server = ThreadingHTTPServer(("localhost", 0), handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def post(self, body, headers=None, path="/method/"):
+        conn = http.client.HTTPConnection(*self.server.server_address)
+        self.addCleanup(conn.close)
+        with self.assertLogs(level="INFO"):
+            conn.request("POST", path, body, headers or {})
+            response = conn.getresponse()
+            data = response.read()
+        return response, data
+
+    def test_idle_connection_closed(self):
+        handler = type("Handler", (self.server.RequestHandlerClass,), {"timeout": 0.1})
+        server = ThreadingHTTPServer(("localhost", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        with socket.create_connection(server.server_address, timeout=5) as sock:
+            self.assertEqual(sock.recv(1), b"")
+
+    def make_body(self, client_ids):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests",
+                   "arguments": {"client_ids": client_ids}}
+        helper.set_valid_auth(request)
+        return json.dumps(request).encode()
+
+    @helper.cases([(1, None), (500, None), (1, "gzip"), (500, "gzip"), (500, "deflate")])
+    def test_response_encoding(self, n_ids, accept):
+        response, data = self.post(self.make_body(list(range(n_ids))),
+                                   {"Accept-Encoding": accept} if accept else {})
+        encoding = response.getheader("Content-Encoding")
+        self.assertEqual(int(response.getheader("Content-Length")), len(data))
+        if n_ids > 1 and accept:
+            self.assertEqual(encoding, accept)
+            data = api.compression.decompress(data, encoding)
+        else:
+            self.assertIsNone(encoding)
+        self.assertEqual(json.loads(data)["code"], api.OK)
+        self.assertEqual(len(json.loads(data)["response"]), n_ids)
+
+    @helper.cases(["gzip", "deflate"])
+    def test_request_encoding(self, encoding):
+        body = api.compression.compress(self.make_body([1, 2]), encoding)
+        _, data = self.post(body, {"Content-Encoding": encoding})
+        self.assertEqual(json.loads(data)["code"], api.OK)
+
+    @helper.cases([b"", b"{", b"[1,]", b"\xff", b"\xef\xbb\xbf{}", '{"a": 1}'.encode("utf-16")])
+    def test_request_malformed(self, body):
+        _, data = self.post(body)
+        self.assertEqual(json.loads(data)["code"], api.BAD_REQUEST)
+
+    @helper.cases([{"phone": 123456789012345678901234567890, "email": "a@b"},
+                   {"phone": float("nan"), "email": "a@b"}])
+    def test_request_unusual_numbers(self, arguments):
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+                   "arguments": arguments}
+        helper.set_valid_auth(request)
+        _, data = self.post(json.dumps(request).encode())
+        self.assertEqual(json.loads(data)["code"], api.INVALID_REQUEST)
+
+    @helper.cases([("br", b"xxx"), ("gzip", b"not gzip")])
+    def test_request_bad_encoding(self, encoding, body):
+        _, data = self.post(body, {"Content-Encoding": encoding})
+        self.assertEqual(json.loads(data)["code"], api.BAD_REQUEST)
+
+
+class TestSuiteHandlerStore(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = type("Handler", (api.MainHTTPHandler,),
+                            {"store_config": {"backend": "memory"}})
+
+    def test_store_is_lazy(self):
+        self.assertIsNone(self.handler._store)
+        s = self.handler.get_store()
+        self.assertIsInstance(s, store.MemoryStore)
+        self.assertIs(self.handler.get_store(), s)
+
+    def test_store_per_process(self):
+        s = self.handler.get_store()
+        self.handler._store_pid = -1
+        self.assertIsNot(self.handler.get_store(), s)
+
+
+class CodecMixin:
+    codec_name = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.previous_codec = api.codec.current.name
+        api.codec.use(cls.codec_name)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        api.codec.use(cls.previous_codec)
+
+
+class StdlibCodecMixin(CodecMixin):
+    codec_name = "json"
+
+
+@unittest.skipUnless("orjson" in api.codec.CODECS, "orjson is not installed")
+class OrjsonCodecMixin(CodecMixin):
+    codec_name = "orjson"
+
+
+class TestSuiteApiValidRequestsStdlibCodec(StdlibCodecMixin, TestSuiteApiValidRequests):
+    pass
+
+
+class TestSuiteApiValidRequestsOrjsonCodec(OrjsonCodecMixin, TestSuiteApiValidRequests):
+    pass
+
+
+class TestSuiteResponseCacheStdlibCodec(StdlibCodecMixin, TestSuiteResponseCache):
+    pass
+
+
+class TestSuiteResponseCacheOrjsonCodec(OrjsonCodecMixin, TestSuiteResponseCache):
+    pass
+
+
+class TestSuiteHTTPStdlibCodec(StdlibCodecMixin, TestSuiteHTTP):
+    pass
+
+
+class TestSuiteHTTPOrjsonCodec(OrjsonCodecMixin, TestSuiteHTTP):
+    pass
+
+
 if __name__ == "__main__":
     unittest.main()
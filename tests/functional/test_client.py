@@ -0,0 +1,124 @@
+import asyncio
+import http.client
+import socket
+import threading
+import unittest
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer
+
+from api import api
+from api import client
+
+
+class TestSuiteClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        interests = {"i:%s" % i: '["cars", "pets"]' for i in range(1000)}
+        cls.requests = []
+        handler = type("Handler", (api.MainHTTPHandler,), {
+            "store_config": {"backend": "memory", "data": interests},
+            "log_message": lambda *args: None,
+            "do_POST": lambda self: (cls.requests.append((self.path, self.client_address)),
+                                     api.MainHTTPHandler.do_POST(self)),
+        })
+        cls.server = ThreadingHTTPServer(("localhost", 0), handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.requests.clear()
+        self.client = self.make_client()
+
+    def make_client(self, login="h&f", **kwargs):
+        return client.Client(*self.server.server_address, account="horns&hoofs", login=login, **kwargs)
+
+    def test_online_score(self):
+        self.assertEqual(self.client.online_score(first_name="a", last_name="b"), 0.5)
+        self.assertEqual(self.make_client("admin").online_score(first_name="a", last_name="b"), 42)
+
+    def test_clients_interests(self):
+        self.assertEqual(self.client.clients_interests([2, 1, 5000], date="20.07.2017"),
+                         {1: ["cars", "pets"], 2: ["cars", "pets"], 5000: []})
+        self.assertEqual(len(self.client.clients_interests(range(1000))), 1000)
+
+    def test_error(self):
+        with self.assertRaises(client.APIError) as e:
+            self.client.online_score(first_name="a")
+        self.assertEqual(e.exception.code, api.INVALID_REQUEST)
+        with self.assertRaises(client.APIError) as e:
+            self.client.call("xxx", {})
+        self.assertEqual(e.exception.code, api.NOT_FOUND)
+
+    def test_connection_reuse(self):
+        for _ in range(5):
+            self.client.online_score(first_name="a", last_name="b")
+        self.assertEqual(len(self.requests), 5)
+        self.assertEqual(len({address for _, address in self.requests}), 1)
+        self.assertEqual(len(self.client.pool.idle), 1)
+
+    def test_stale_connection_retried(self):
+        listener = socket.create_server(("localhost", 0))
+        stale = http.client.HTTPConnection(*listener.getsockname()[:2])
+        stale.connect()
+        listener.accept()[0].close()
+        listener.close()
+        self.client.pool.idle.append(stale)
+        self.assertEqual(self.client.online_score(first_name="a", last_name="b"), 0.5)
+        self.assertEqual(len(self.requests), 1)
+
+    def test_online_scores_batched(self):
+        arguments = [{"first_name": "a", "last_name": str(i)} for i in range(250)]
+        arguments[7] = {"first_name": "a"}
+        c = self.make_client(batch_size=100)
+        scores = c.online_scores(arguments, return_exceptions=True)
+        self.assertEqual(len(scores), 250)
+        self.assertIsInstance(scores[7], client.APIError)
+        self.assertEqual(scores[:3], [0.5] * 3)
+        self.assertEqual([path for path, _ in self.requests], ["/batch/"] * 3)
+        with self.assertRaises(client.APIError):
+            c.online_scores(arguments)
+
+    def test_async_client(self):
+        async def run():
+            async with client.AsyncClient(*self.server.server_address, account="horns&hoofs",
+                                          login="h&f", batch_delay=0.01) as c:
+                scores = await asyncio.gather(*[c.online_score(first_name="a", last_name=str(i))
+                                                for i in range(30)])
+                single = await c.online_score(phone="79175002040", email="a@b")
+                with self.assertRaises(client.APIError):
+                    await c.online_score(first_name="a")
+                interests = await c.clients_interests([1])
+                many = await c.online_scores([{"first_name": "a", "last_name": "b"}] * 3)
+            return scores, single, interests, many
+
+        scores, single, interests, many = asyncio.run(run())
+        self.assertEqual(scores, [0.5] * 30)
+        self.assertEqual(single, 3.0)
+        self.assertEqual(interests, {1: ["cars", "pets"]})
+        self.assertEqual(many, [0.5] * 3)
+        self.assertEqual([path for path, _ in self.requests],
+                         ["/batch/", "/method/", "/method/", "/method/", "/batch/"])
+        self.assertEqual(len({address for _, address in self.requests}), 1)
+
+
+class TokenCacheTest(unittest.TestCase):
+
+    def test_tokens(self):
+        tokens = client.TokenCache()
+        token = tokens.get("h&f", "horns&hoofs")
+        self.assertEqual(token, api.make_token("h&f", "horns&hoofs"))
+        self.assertIs(tokens.get("h&f", "horns&hoofs"), token)
+        admin = tokens.get("admin", "")
+        self.assertEqual(admin, api.make_token("admin", ""))
+        tokens.tokens["admin", ""] = ("1970010100", "stale")
+        self.assertEqual(tokens.get("admin", ""), admin)
+        self.assertNotEqual(api.make_token("admin", "", datetime.now() + timedelta(hours=1)), admin)
+
+
+if __name__ == "__main__":
+    unittest.main()
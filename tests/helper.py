@@ -1,6 +1,4 @@
 import functools
-import hashlib
-from datetime import datetime
 
 from api import api
 
@@ -19,9 +17,4 @@ def cases(cases):
 
 
 def set_valid_auth(request):
-        if request.get("login") == api.ADMIN_LOGIN:
-            d = datetime.now().strftime("%Y%m%d%H") + api.ADMIN_SALT
-            request["token"] = hashlib.sha512(d.encode('utf-8')).hexdigest()
-        else:
-            msg = request.get("account", "") + request.get("login", "") + api.SALT
-            request["token"] = hashlib.sha512(msg.encode('utf-8')).hexdigest()
\ No newline at end of file
+    request["token"] = api.make_token(request.get("login", ""), request.get("account", ""))
@@ -0,0 +1,51 @@
+import unittest
+
+import redis
+
+from api import keyspace
+from api import store
+from tests.fake_redis import FakeRedis
+
+
+class TestSuiteKeyspace(unittest.TestCase):
+
+    def setUp(self):
+        self.redis_server = FakeRedis().start()
+        self.addCleanup(self.redis_server.stop)
+        self.client = redis.StrictRedis(**self.redis_server.config)
+        s = store.Store(self.redis_server.config)
+        # score keys written without expiry by earlier versions of Store.cache_set
+        s.set_many([("uid:%032x" % i, 1.5) for i in range(300)])
+        s.cache_set_many([("uid:%032x" % i, 3.0) for i in range(300, 400)], 3600)
+        s.set_many([("i:%d" % i, '["cars", "pets"]') for i in range(500)])
+        s.set("version", "1")
+
+    def test_analyze(self):
+        stats = keyspace.analyze(self.client, batch_size=64)
+        self.assertEqual({prefix: s.keys for prefix, s in stats.items()},
+                         {"uid:": 400, "i:": 500, "ih:": 0, "il:": 0, keyspace.OTHER: 1})
+        uid, interests = stats["uid:"], stats["i:"]
+        self.assertEqual(uid.no_ttl, 300)
+        self.assertEqual(uid.ttl.count, 100)
+        self.assertEqual(uid.savings["binary md5 key"], 400 * 16)
+        self.assertEqual(interests.memory.total, sum(len("i:%d" % i) + 16 + 48 for i in range(500)))
+        self.assertEqual(interests.savings["compact json"], 500)
+        self.assertIn("without ttl: ~300", uid.format())
+
+    def test_analyze_sample(self):
+        stats = keyspace.analyze(self.client, sample_rate=0.25, batch_size=64)
+        self.assertEqual(stats["i:"].keys, 500)
+        self.assertLess(stats["i:"].sampled, 250)
+        self.assertAlmostEqual(stats["i:"].value_size.total / (500 * 16), 1, delta=0.3)
+
+    def test_purge(self):
+        self.assertEqual(keyspace.purge_persistent_scores(self.client, batch_size=64, dry_run=True), 300)
+        self.assertEqual(self.client.dbsize(), 901)
+        self.assertEqual(keyspace.purge_persistent_scores(self.client, rate=0, batch_size=64), 300)
+        self.assertEqual(self.client.dbsize(), 601)
+        self.assertEqual(self.client.get("uid:%032x" % 350), b"3.0")
+        self.assertEqual(self.client.get("i:1"), b'["cars", "pets"]')
+
+
+if __name__ == "__main__":
+    unittest.main()
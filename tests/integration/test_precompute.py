@@ -0,0 +1,99 @@
+import json
+import threading
+import unittest
+
+import redis
+
+from api import precompute
+from api import scoring
+from api import store
+from tests.fake_redis import FakeRedis
+
+TEST_PORT = 9008
+redis_config = {"host": "localhost", "port": TEST_PORT, "db": 0}
+
+
+def event(first_name, **fields):
+    return {precompute.STREAM_FIELD: json.dumps(dict({"profile": {"first_name": first_name, "last_name": "b"}},
+                                                     **fields))}
+
+
+def key(first_name):
+    return scoring.score_key(None, None, None, None, first_name, "b")
+
+
+class TestSuiteRedisStream(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.redis_server = FakeRedis(port=TEST_PORT).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.redis_server.stop()
+
+    def setUp(self):
+        self.client = redis.StrictRedis(**redis_config, decode_responses=True)
+        self.store = store.Store(redis_config, reconnect_attempts=5)
+
+    def tearDown(self):
+        self.client.flushdb()
+        self.client.close()
+
+    def make_precomputer(self, **kwargs):
+        source = precompute.RedisStreamSource(redis.StrictRedis(**redis_config, decode_responses=True),
+                                              "profiles", **kwargs)
+        self.addCleanup(source.close)
+        return precompute.Precomputer(self.store, source, batch_size=2, batch_timeout=0.01)
+
+    def test_stream(self):
+        self.client.xadd("profiles", event("old"))
+        precomputer = self.make_precomputer(checkpoint_key="precompute:profiles")
+        self.client.xadd("profiles", event("a"))
+        self.client.xadd("profiles", event("c", op="delete"))
+        self.client.xadd("profiles", {"other": "x"})
+        self.assertEqual(precomputer.run(max_events=3), 3)
+        self.assertEqual(self.client.get(key("a")), "0.5")
+        self.assertEqual(self.client.ttl(key("a")), scoring.SCORE_TTL_SEC)
+        self.assertEqual(self.client.exists(key("old")), 0)
+        metrics = precomputer.metrics.snapshot()
+        self.assertEqual((metrics["events"], metrics["written"], metrics["deleted"], metrics["invalid"]),
+                         (3, 1, 1, 1))
+        self.assertLess(metrics["max_lag_sec"], 10)
+        last_id = self.client.get("precompute:profiles")
+        self.assertEqual(last_id, self.client.xrevrange("profiles", count=1)[0][0])
+
+        self.client.set(key("a"), "7")
+        self.client.xadd("profiles", event("d"))
+        resumed = self.make_precomputer(checkpoint_key="precompute:profiles")
+        self.assertEqual(resumed.run(max_events=1), 1)
+        self.assertEqual(self.client.get(key("d")), "0.5")
+        self.assertEqual(self.client.get(key("a")), "7")
+
+    def test_repeated_event_extends_ttl(self):
+        precomputer = self.make_precomputer()
+        self.client.xadd("profiles", event("a"))
+        self.assertEqual(precomputer.run(max_events=1), 1)
+        self.client.expire(key("a"), 5)
+        self.client.xadd("profiles", event("a"))
+        self.assertEqual(precomputer.run(max_events=1), 1)
+        self.assertEqual(self.client.ttl(key("a")), scoring.SCORE_TTL_SEC)
+
+    def test_from_start(self):
+        self.client.xadd("profiles", event("a"))
+        self.client.xadd("profiles", event("b"))
+        precomputer = self.make_precomputer(from_start=True)
+        self.assertEqual(precomputer.run_once(), 2)
+        self.assertEqual(self.client.get(key("b")), "0.5")
+        self.assertEqual(precomputer.run_once(), 0)
+
+    def test_blocking_read(self):
+        precomputer = self.make_precomputer()
+        precomputer.batch_timeout = 1
+        threading.Timer(0.05, self.client.xadd, ("profiles", event("a"))).start()
+        self.assertEqual(precomputer.run_once(), 1)
+        self.assertEqual(scoring.get_score(self.store, None, None, None, None, "a", "b"), 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
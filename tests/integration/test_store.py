@@ -1,9 +1,10 @@
+import time
 import unittest
 import redis
-import subprocess
 
 from api import store
 from tests import helper
+from tests.fake_redis import FakeRedis
 
 
 TEST_PORT = 9006
@@ -18,21 +19,11 @@ class TestSuiteStoreOk(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        cls.redis_process = subprocess.Popen(['redis-server', '--port',
-                                             str(redis_up_config["port"])],
-                                             stdout=subprocess.DEVNULL)
-        connect = False
-        r = redis.StrictRedis(**redis_up_config)
-        while connect is False:
-            try:
-                connect = r.ping()
-            except redis.exceptions.ConnectionError as e:
-                pass
+        cls.redis_server = FakeRedis(port=TEST_PORT).start()
 
     @classmethod
     def tearDownClass(cls):
-        cls.redis_process.terminate()
-        cls.redis_process.wait()
+        cls.redis_server.stop()
 
     def setUp(self):
         self.store = store.Store(redis_up_config, reconnect_attempts=5)
@@ -75,6 +66,75 @@ class TestSuiteStoreOk(unittest.TestCase):
         self.assertEqual(result, None)
 
 
+    def test_store_set_many_get_many(self):
+        self.store.set_many([("key_0", "a"), ("key_1", "b")], 10)
+        self.assertEqual(self.store.get_many(["key_0", "key_2", "key_1"]), ["a", None, "b"])
+        self.assertEqual(self.store.cache_get_many(["key_1"]), ["b"])
+
+    def test_store_cache_delete_many(self):
+        self.store.cache_set_many([("key_0", "a"), ("key_1", "b")], 10)
+        self.store.cache_delete_many(["key_0", "key_2"])
+        self.store.cache_delete_many([])
+        self.assertEqual(self.store.cache_get_many(["key_0", "key_1"]), [None, "b"])
+
+    def test_store_cache_set_expires(self):
+        self.store.cache_set("key_0", "a", 10)
+        self.store.cache_set_many([("key_1", "b")], 10)
+        self.assertEqual([self.store.db.ttl("key_0"), self.store.db.ttl("key_1")], [10, 10])
+
+    def test_store_cache_set_keeps_existing(self):
+        self.store.cache_set("key_0", "a", 10)
+        self.store.cache_set("key_0", "b", 10)
+        self.assertEqual(self.store.cache_get("key_0"), "a")
+
+    def test_store_set_expires(self):
+        self.store.db.set("key_0", "a", px=50)
+        self.assertEqual(self.store.cache_get("key_0"), "a")
+        time.sleep(0.1)
+        self.assertIsNone(self.store.cache_get("key_0"))
+
+
+class TestSuiteStoreFaults(unittest.TestCase):
+
+    def setUp(self):
+        self.redis_server = FakeRedis(seed=1).start()
+        self.addCleanup(self.redis_server.stop)
+        self.store = store.Store(self.redis_server.config, reconnect_attempts=3, reconnect_delay=0)
+
+    def test_store_reconnects_after_disconnect(self):
+        self.store.set("key_0", "a")
+        self.redis_server.fail_next("disconnect", 2)
+        self.assertEqual(self.store.get("key_0"), "a")
+        self.assertEqual(self.redis_server.connections, 3)
+
+    def test_store_gives_up_after_attempts(self):
+        self.redis_server.fail_next("disconnect", 3)
+        with self.assertRaises(ConnectionError):
+            self.store.get("key_0")
+        self.assertIsNone(self.store.cache_get("key_0"))
+
+    def test_store_retries_dropped_reply(self):
+        self.store.set("key_0", "a")
+        self.redis_server.fail_next("drop")
+        started = time.monotonic()
+        self.assertEqual(self.store.cache_get("key_0"), "a")
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+
+    def test_store_batches_in_one_round_trip(self):
+        self.redis_server.reset_stats()
+        self.store.cache_set_many([("key_{}".format(i), i) for i in range(100)], 10)
+        self.store.cache_get_many(["key_{}".format(i) for i in range(100)])
+        self.assertEqual(self.redis_server.reads, 2)
+        self.assertEqual(self.redis_server.commands["SET"], 100)
+        self.assertEqual(self.redis_server.commands["MGET"], 1)
+
+    def test_store_command_latency(self):
+        self.redis_server.command_latency["GET"] = 0.05
+        started = time.monotonic()
+        self.store.cache_get("key_0")
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+
 class TestSuiteStoreDown(unittest.TestCase):
 
     def setUp(self):
@@ -0,0 +1,91 @@
+import time
+import unittest
+
+from api import api
+from api import cache
+from api import store
+from tests import helper
+
+
+def clean(arguments):
+    req = api.ClientsInterestsRequest(arguments)
+    assert req.is_valid()
+    return req.clean_data
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = cache.ResponseCache(ttl_sec=60, max_bytes=100)
+
+    @helper.cases([
+        ({"client_ids": [1, 2, 3]}, {"client_ids": [3, 2, 1]}),
+        ({"client_ids": [1, 2], "date": "19.07.2017"}, {"date": "19.07.2017", "client_ids": [2, 1, 2]}),
+    ])
+    def test_make_key_canonical(self, args1, args2):
+        self.assertEqual(self.cache.make_key("m", clean(args1)), self.cache.make_key("m", clean(args2)))
+
+    @helper.cases([
+        ({"client_ids": [1, 2]}, {"client_ids": [1, 2], "date": "19.07.2017"}),
+        ({"client_ids": [1, 2]}, {"client_ids": [1, 3]}),
+    ])
+    def test_make_key_differs(self, args1, args2):
+        self.assertNotEqual(self.cache.make_key("m", clean(args1)), self.cache.make_key("m", clean(args2)))
+
+    def test_make_key_unhashable(self):
+        self.assertEqual(self.cache.make_key("m", {"client_ids": object()}), None)
+
+    def test_set_skipped_after_invalidation(self):
+        generation = self.cache.generation
+        self.cache.invalidate(["uid:1", "i:1"])
+        self.cache.set(b"k", b"[]", [1], generation=generation)
+        self.assertEqual(self.cache.get(b"k"), None)
+        self.cache.set(b"k", b"[]", [1], generation=self.cache.generation)
+        self.assertEqual(self.cache.get(b"k"), (b"[]", {}))
+
+    def test_get_set(self):
+        self.assertEqual(self.cache.get(b"k"), None)
+        self.cache.set(b"k", b"[]", [1], {"nclients": 1})
+        self.assertEqual(self.cache.get(b"k"), (b"[]", {"nclients": 1}))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_ttl(self):
+        c = cache.ResponseCache(ttl_sec=0.01)
+        c.set(b"k", b"[]", [1])
+        time.sleep(0.02)
+        self.assertEqual(c.get(b"k"), None)
+        self.assertEqual(c.size, 0)
+        self.assertEqual(c.by_client, {})
+
+    def test_size_bound_lru(self):
+        self.cache.set(b"a", b"x" * 40, [1])
+        self.cache.set(b"b", b"x" * 40, [2])
+        self.cache.get(b"a")
+        self.cache.set(b"c", b"x" * 40, [3])
+        self.assertEqual(list(self.cache.entries), [b"a", b"c"])
+        self.assertEqual(self.cache.size, 80)
+        self.cache.set(b"d", b"x" * 101, [4])
+        self.assertNotIn(b"d", self.cache.entries)
+
+    def test_invalidate_through_store(self):
+        s = store.MemoryStore()
+        s.add_listener(self.cache.invalidate)
+        self.cache.set(b"a", b"[]", [1, 2])
+        self.cache.set(b"b", b"[]", [2, 3])
+        self.cache.set(b"c", b"[]", [4])
+        s.set("uid:1", "1")
+        s.set("i:x", "[]")
+        self.assertEqual(len(self.cache.entries), 3)
+        s.set("i:2", "[]")
+        self.assertEqual(list(self.cache.entries), [b"c"])
+        self.assertEqual(set(self.cache.by_client), {4})
+
+    @helper.cases(["ih:4", "il:4"])
+    def test_invalidate_history_keys(self, store_key):
+        self.cache.set(b"a", b"[]", [4])
+        self.cache.invalidate(["ih:x", store_key])
+        self.assertEqual(len(self.cache.entries), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
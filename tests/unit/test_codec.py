@@ -0,0 +1,70 @@
+import json
+import unittest
+
+from api import codec
+from tests import helper
+
+
+class CodecTest(unittest.TestCase):
+
+    def each_codec(self):
+        for name, c in codec.CODECS.items():
+            with self.subTest(codec=name):
+                yield c
+
+    @helper.cases([
+        b'{"account": "horns&hoofs", "arguments": {"phone": 79175002040, "gender": 1}}',
+        b'{"a": "\\u00e9\\u0436", "b": [1.5, -0, true, false, null]}',
+        '{"a": "é"}'.encode("utf-8"),
+        b'{"a": -12345678901234567890.5}',
+        b'{"a": NaN, "b": Infinity, "c": 1e400}',
+        b'"\\ud800"',
+        b'{"a": 1, "a": 2}',
+        b' [] ',
+    ])
+    def test_loads_same_as_stdlib(self, data):
+        expected = json.loads(data.decode("utf-8"))
+        for c in self.each_codec():
+            for value in (data, data.decode("utf-8"), memoryview(data)):
+                result = c.loads(value)
+                self.assertEqual(json.dumps(result), json.dumps(expected))
+                self.assertEqual(repr(result), repr(expected))
+
+    def test_loads_wide_integers(self):
+        data = b"[18446744073709551615, -9223372036854775808, 123456789012345678901234567890]"
+        for c in self.each_codec():
+            result = c.loads(data)
+            self.assertEqual(result[:2], [2 ** 64 - 1, -2 ** 63])
+            self.assertAlmostEqual(result[2] / 123456789012345678901234567890, 1.0)
+
+    @helper.cases([b"", b"{", b"{}x", b"[1,]", b"\xff", b"\xef\xbb\xbf{}", '{"a": 1}'.encode("utf-16")])
+    def test_loads_malformed(self, data):
+        for c in self.each_codec():
+            with self.assertRaises(ValueError):
+                c.loads(data)
+
+    @helper.cases([
+        {"response": {1: ["cars", "pets"], 2: []}, "code": 200},
+        {"response": {"score": 3.0}, "code": 200},
+        {"error": "phone:ж invalid", "code": 422},
+        [2 ** 64 - 1, -1.5, None, True],
+    ])
+    def test_dumps(self, obj):
+        for c in self.each_codec():
+            data = c.dumps(obj)
+            self.assertIsInstance(data, bytes)
+            self.assertEqual(json.loads(data), json.loads(json.dumps(obj)))
+
+    def test_use(self):
+        previous = codec.current.name
+        self.addCleanup(codec.use, previous)
+        self.assertIs(codec.use("json"), codec.StdlibCodec)
+        self.assertEqual(codec.loads(b"[1]"), [1])
+        self.assertEqual(codec.dumps([1]), b"[1]")
+        with self.assertRaises(ValueError):
+            codec.use("xxx")
+        self.assertIn(codec.use().name, codec.CODECS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import gzip
+import subprocess
+import sys
+import tracemalloc
+import unittest
+import zlib
+
+from api import compression
+from tests import helper
+
+
+class CompressionTest(unittest.TestCase):
+
+    @helper.cases([
+        ("gzip", {"gzip": 1.0}),
+        ("gzip;q=0.5, deflate", {"gzip": 0.5, "deflate": 1.0}),
+        ("GZIP ; q=0 , br;q=x", {"gzip": 0.0, "br": 0.0}),
+        ("", {}),
+        (None, {}),
+    ])
+    def test_parse_accept_encoding(self, header, expected):
+        self.assertEqual(compression.parse_accept_encoding(header), expected)
+
+    @helper.cases([
+        ("gzip, deflate", "gzip"),
+        ("gzip;q=0.5, deflate", "deflate"),
+        ("br", None),
+        ("gzip;q=0", None),
+        ("identity", None),
+        ("", None),
+        ("*;q=0.1, gzip;q=0", "deflate"),
+    ])
+    def test_choose_encoding(self, header, expected):
+        if compression.ZSTD_AVAILABLE and expected and "*" in header:
+            expected = "zstd"
+        self.assertEqual(compression.choose_encoding(header), expected)
+
+    @helper.cases(list(compression.CODECS))
+    def test_roundtrip(self, encoding):
+        data = b'{"response": {"1": ["cars", "pets"]}}' * 100
+        compressed = compression.compress(data, encoding)
+        self.assertLess(len(compressed), len(data))
+        self.assertEqual(compression.decompress(compressed, encoding), data)
+
+    def test_interoperability(self):
+        data = b"x" * 1000
+        self.assertEqual(gzip.decompress(compression.compress(data, "gzip")), data)
+        self.assertEqual(compression.decompress(gzip.compress(data), "gzip"), data)
+        self.assertEqual(compression.decompress(zlib.compress(data), "deflate"), data)
+
+    @helper.cases([None, "", "identity", " Identity "])
+    def test_identity(self, encoding):
+        self.assertEqual(compression.decompress(b"{}", encoding), b"{}")
+
+    @helper.cases([("br", b"xxx"), ("gzip", b"not gzip"), ("gzip", gzip.compress(b"x" * 100)[:-10])])
+    def test_decompress_invalid(self, encoding, data):
+        with self.assertRaises(compression.DecompressionError):
+            compression.decompress(data, encoding)
+
+    @helper.cases(list(compression.CODECS))
+    def test_decompress_limit(self, encoding):
+        compressed = compression.compress(b"\0" * 100000, encoding)
+        with self.assertRaises(compression.DecompressionError):
+            compression.decompress(compressed, encoding, max_size=1000)
+
+    @unittest.skipIf(not compression.ZSTD_AVAILABLE, "zstandard is not installed")
+    def test_zstd_decompress_bounded(self):
+        c = compression._zstandard().ZstdCompressor().compressobj()
+        compressed = b"".join(c.compress(b"\0" * 2 ** 20) for _ in range(256)) + c.flush()
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        with self.assertRaises(compression.DecompressionError):
+            compression.decompress(compressed, "zstd", max_size=1000)
+        self.assertLess(tracemalloc.get_traced_memory()[1], 2 ** 20)
+
+    def test_zstandard_imported_lazily(self):
+        code = "import sys; from api import api; print('zstandard' in sys.modules)"
+        out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+        self.assertEqual(out.strip(), "False")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import datetime
 import unittest
+from array import array
 from datetime import datetime
 
 from tests import helper
@@ -207,13 +208,19 @@ class ClientIDsField(unittest.TestCase):
         f = api.ClientIDsField(required=True, nullable=True)
         self.assertEqual(f.valid([]), True, 'value = "": nullable=True')
 
-    @helper.cases([[0, 1], [1], [1, 9, 67, 1, 1, 6], [0, 0, 0]])
-    def test_clientidsfield_valid(self, arg):
+    @helper.cases([([0, 1], [0, 1]), ([1], [1]), ([1, 9, 67, 1, 1, 6], [1, 6, 9, 67]), ([0, 0, 0], [0]),
+                   ([2 ** 64 - 1, 5], [5, 2 ** 64 - 1])])
+    def test_clientidsfield_valid(self, arg, expected):
         f = api.ClientIDsField(required=True, nullable=False)
         self.assertEqual(f.valid(arg), True)
-        self.assertEqual(f.validate(arg), arg)
+        self.assertEqual(f.validate(arg), array("Q", expected))
+
+    def test_clientidsfield_max_size(self):
+        f = api.ClientIDsField(required=True, max_size=3)
+        self.assertEqual(f.valid([1, 2, 3]), True)
+        self.assertEqual(f.valid([1, 2, 3, 3]), False)
 
-    @helper.cases([[0, -1], [0, "1"], {0, 1}, 1, "0 1 2"])
+    @helper.cases([[0, -1], [0, "1"], [0, 1.0], [2 ** 64], {0, 1}, 1, "0 1 2"])
     def test_clientidsfield_invalid(self, arg):
         f = api.ClientIDsField(required=True, nullable=False)
         self.assertEqual(f.valid(arg), False)
@@ -221,5 +228,38 @@ class ClientIDsField(unittest.TestCase):
             f.validate(arg)
 
 
+class NumberFieldTest(unittest.TestCase):
+
+    def test_numberfield_empty_nullable(self):
+        f = api.NumberField(required=False)
+        self.assertEqual(f.valid(None), True, 'value = None: required=False')
+
+    @helper.cases([1, 0.5, 60])
+    def test_numberfield_valid(self, arg):
+        f = api.NumberField(required=True)
+        self.assertEqual(f.valid(arg), True)
+        self.assertEqual(f.validate(arg), arg)
+
+    @helper.cases([0, -1, "1", True, [1], float("nan"), float("inf"), 1e400])
+    def test_numberfield_invalid(self, arg):
+        f = api.NumberField(required=True)
+        self.assertEqual(f.valid(arg), False)
+        with self.assertRaises(api.ValidationError):
+            f.validate(arg)
+
+
+class RequestCleanDataTest(unittest.TestCase):
+
+    def test_clean_data_per_request(self):
+        r1 = api.ClientsInterestsRequest({"client_ids": [1], "date": "19.07.2017"})
+        r2 = api.ClientsInterestsRequest({"client_ids": [2, 3]})
+        self.assertTrue(r1.is_valid())
+        self.assertTrue(r2.is_valid())
+        self.assertEqual(list(r1.client_ids), [1])
+        self.assertEqual(r1.date, datetime(2017, 7, 19))
+        self.assertEqual(list(r2.client_ids), [2, 3])
+        self.assertEqual(r2.date, None)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,149 @@
+import json
+import unittest
+from datetime import datetime
+
+from api import history
+from api import store
+from tests import helper
+
+
+def day(value):
+    return datetime.strptime(value, "%d.%m.%Y")
+
+
+class HistoryIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.entries = [(day("01.01.2017").toordinal(), ["cars"]),
+                        (day("10.01.2017").toordinal(), []),
+                        (day("20.01.2017").toordinal(), ["pets", "ж"])]
+        self.index = history.HistoryIndex(history.HistoryIndex.build(self.entries))
+
+    @helper.cases([
+        ("31.12.2016", -1),
+        ("01.01.2017", 0),
+        ("09.01.2017", 0),
+        ("10.01.2017", 1),
+        ("20.01.2017", 2),
+        ("01.01.2030", 2),
+    ])
+    def test_find(self, date, position):
+        self.assertEqual(self.index.find(day(date).toordinal()), position)
+
+    def test_entries(self):
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.entries(), self.entries)
+
+    def test_empty(self):
+        index = history.HistoryIndex(history.HistoryIndex.build([]))
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.find(day("01.01.2017").toordinal()), -1)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            history.HistoryIndex('["cars"]')
+
+    @helper.cases([
+        ("31.12.2015", None),
+        ("01.03.2016", 2016),
+        ("31.12.2016", 2016),
+        ("01.01.2018", 2017),
+    ])
+    def test_directory_find(self, date, year):
+        segments = [(2016, day("01.03.2016").toordinal(), day("01.12.2016").toordinal()),
+                    (2017, day("05.05.2017").toordinal(), day("05.05.2017").toordinal())]
+        directory = history.Directory(history.Directory.build(segments))
+        self.assertEqual(directory.segments(), segments)
+        self.assertEqual(directory.find(day(date).toordinal()), year)
+        self.assertEqual(directory.last_date(), day("05.05.2017").toordinal())
+
+    def test_compact(self):
+        log = [[day("10.01.2017").toordinal(), ["yoga"]],
+               [day("05.01.2017").toordinal(), ["cars"]],
+               [day("10.01.2017").toordinal(), ["beer"]]]
+        index = history.HistoryIndex(history.compact(self.index, log))
+        self.assertEqual(index.entries(), [(day("01.01.2017").toordinal(), ["cars"]),
+                                           (day("10.01.2017").toordinal(), ["beer"]),
+                                           (day("20.01.2017").toordinal(), ["pets", "ж"])])
+
+    @helper.cases([
+        ("31.12.2016", []),
+        ("05.01.2017", ["cars"]),
+        ("11.01.2017", ["yoga"]),
+        ("20.01.2017", ["pets", "ж"]),
+        ("25.01.2017", ["zumba"]),
+    ])
+    def test_interests_as_of(self, date, expected):
+        log = [[day("11.01.2017").toordinal(), ["yoga"]], [day("25.01.2017").toordinal(), ["zumba"]]]
+        self.assertEqual(history.interests_as_of(self.index, log, day(date).toordinal()), expected)
+
+
+class IngestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = store.MemoryStore({"i:9": '["current"]'})
+
+    def as_of(self, cids, date):
+        return history.get_interests_many(self.store, cids, day(date))
+
+    def test_ingest(self):
+        history.ingest(self.store, [(1, day("10.01.2017"), ["cars"]),
+                                    (1, day("01.01.2017"), ["pets"]),
+                                    (2, day("05.01.2017"), ["beer"])])
+        self.assertEqual(self.as_of([1, 2, 9], "31.12.2016"), [[], [], ["current"]])
+        self.assertEqual(self.as_of([1, 2, 9], "05.01.2017"), [["pets"], ["beer"], ["current"]])
+        self.assertEqual(self.as_of([1, 2, 9], "10.01.2017"), [["cars"], ["beer"], ["current"]])
+        self.assertEqual(json.loads(self.store.get("i:1")), ["cars"])
+
+    def test_late_update_keeps_current(self):
+        history.ingest(self.store, [(1, day("10.01.2017"), ["cars"])])
+        history.ingest(self.store, [(1, day("01.01.2017"), ["pets"])])
+        self.assertEqual(json.loads(self.store.get("i:1")), ["cars"])
+        self.assertEqual(self.as_of([1], "02.01.2017"), [["pets"]])
+
+    def test_backfill_keeps_current(self):
+        history.ingest(self.store, [(9, day("01.01.2016"), ["old"])])
+        self.assertEqual(json.loads(self.store.get("i:9")), ["current"])
+        self.assertEqual(self.as_of([9], "31.12.2015"), [[]])
+        self.assertEqual(self.as_of([9], "01.01.2020"), [["current"]])
+        history.ingest(self.store, [(9, day("01.01.2017"), ["new"])])
+        self.assertEqual(json.loads(self.store.get("i:9")), ["new"])
+        self.assertEqual(self.as_of([9], "01.06.2016"), [["old"]])
+
+    def test_compaction(self):
+        for i in range(1, 11):
+            compacted = history.ingest(self.store, [(1, day("%02d.01.2017" % i), [str(i)])], compact_every=4)
+            self.assertEqual(compacted, int(i % 4 == 0))
+        self.assertEqual(json.loads(self.store.get("il:1")), [[day("09.01.2017").toordinal(), ["9"]],
+                                                              [day("10.01.2017").toordinal(), ["10"]]])
+        self.assertEqual(len(history.HistoryIndex(self.store.get("ih:1:2017"))), 8)
+        self.assertEqual(history.compact_many(self.store, [1, 2]), 1)
+        self.assertEqual(self.store.get("il:1"), "[]")
+        self.assertEqual(len(history.HistoryIndex(self.store.get("ih:1:2017"))), 10)
+        self.assertEqual(history.Directory(self.store.get("ih:1")).segments(),
+                         [(2017, day("01.01.2017").toordinal(), day("10.01.2017").toordinal())])
+        for i in range(1, 11):
+            self.assertEqual(self.as_of([1], "%02d.01.2017" % i), [[str(i)]])
+
+    def test_segments(self):
+        updates = [(1, day("01.06.%d" % year), [str(year)]) for year in range(2010, 2020)]
+        history.ingest(self.store, updates, compact_every=1)
+        self.assertEqual(history.Directory(self.store.get("ih:1")).find(day("01.01.2015").toordinal()), 2014)
+        written = []
+        self.store.add_listener(written.extend)
+        history.ingest(self.store, [(1, day("01.07.2012"), ["late"])], compact_every=1)
+        self.assertEqual(sorted(written), ["ih:1", "ih:1:2012", "il:1"])
+        self.assertEqual(self.as_of([1], "31.12.2009"), [[]])
+        self.assertEqual(self.as_of([1], "01.01.2013"), [["late"]])
+        self.assertEqual(self.as_of([1], "01.01.2014"), [["2013"]])
+        self.assertEqual(self.as_of([1], "01.01.2030"), [["2019"]])
+        self.assertEqual(json.loads(self.store.get("i:1")), ["2019"])
+        reads = []
+        get_many = self.store.get_many
+        self.store.get_many = lambda keys: reads.append(keys) or get_many(keys)
+        self.as_of([1], "01.01.2015")
+        self.assertEqual(reads, [["ih:1", "il:1", "i:1"], ["ih:1:2014"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import time
+import unittest
+
+from api import keyspace
+from tests import helper
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_buckets(self):
+        h = keyspace.Histogram()
+        for value in (0, 1, 2, 3, 4, 100):
+            h.add(value)
+        h.add(5, weight=10)
+        self.assertEqual(h.buckets, {0: 1, 1: 1, 2: 2, 3: 11, 7: 1})
+        self.assertEqual(h.count, 16)
+        self.assertEqual(h.total, 160)
+        self.assertEqual(keyspace.Histogram.bucket_range(3), (4, 7))
+        lines = h.format("B").splitlines()
+        self.assertEqual(len(lines), 8)
+        self.assertIn("4B-7B", lines[3])
+        self.assertTrue(lines[3].endswith("#" * 40))
+
+    def test_empty(self):
+        self.assertIn("empty", keyspace.Histogram().format())
+
+
+class KeyspaceTest(unittest.TestCase):
+
+    @helper.cases([(b"uid:abc", "uid:"), (b"i:1", "i:"), (b"ih:1", "ih:"), (b"x:1", keyspace.OTHER), (b"\xff", keyspace.OTHER)])
+    def test_key_prefix(self, key, prefix):
+        self.assertEqual(keyspace.key_prefix(key), prefix)
+
+    @helper.cases([
+        (keyspace.compact_json_saving, b'["cars", "pets"]', 1),
+        (keyspace.compact_json_saving, '["\\u0436", "b"]'.encode(), 4 + 1),
+        (keyspace.compact_json_saving, b'not json', 0),
+        (keyspace.interest_ids_saving, b'["cars", "pets"]', 14),
+        (keyspace.interest_ids_saving, b'{}', 0),
+        (keyspace.hash_bucket_saving, b'5.0', 100 - (4 + 3 + keyspace.HASH_FIELD_OVERHEAD)),
+    ])
+    def test_savings(self, saving, value, expected):
+        self.assertEqual(saving(b"i:12", value, 100), expected)
+
+    def test_binary_key_saving(self):
+        self.assertEqual(keyspace.binary_key_saving(b"uid:" + b"0" * 32, b"1.5", 60), 16)
+        self.assertEqual(keyspace.binary_key_saving(b"uid:x", b"1.5", 60), 0)
+
+    def test_in_sample(self):
+        keys = [b"i:%d" % i for i in range(10000)]
+        sampled = [key for key in keys if keyspace.in_sample(key, 0.1)]
+        self.assertAlmostEqual(len(sampled) / len(keys), 0.1, delta=0.02)
+        self.assertEqual(sampled, [key for key in keys if keyspace.in_sample(key, 0.1)])
+        self.assertTrue(all(keyspace.in_sample(key, 1) for key in keys))
+
+    def test_rate_limiter(self):
+        limiter = keyspace.RateLimiter(1000)
+        started = time.monotonic()
+        for _ in range(5):
+            limiter.wait(20)
+        self.assertGreaterEqual(time.monotonic() - started, 0.08)
+
+
+if __name__ == "__main__":
+    unittest.main()
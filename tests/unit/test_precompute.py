@@ -0,0 +1,174 @@
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+
+from api import precompute
+from api import scoring
+from api import store
+from tests import helper
+
+PROFILE = {"phone": "79175002040", "email": "stupnikov@otus.ru", "gender": 1, "birthday": "01.01.2000"}
+
+
+def request_score(s, profile):
+    birthday = profile.get("birthday")
+    phone = profile.get("phone")
+    return scoring.get_score(s, str(phone) if phone else None, profile.get("email"),
+                             datetime.strptime(birthday, "%d.%m.%Y") if birthday else None,
+                             profile.get("gender"), profile.get("first_name"), profile.get("last_name"))
+
+
+class ParseEventTest(unittest.TestCase):
+
+    @helper.cases([
+        {"profile": PROFILE},
+        {"profile": {"first_name": "a", "last_name": "b"}},
+        {"profile": {"phone": 79175002040, "email": "stupnikov@otus.ru"}},
+    ])
+    def test_same_key_and_score_as_request(self, event):
+        s = store.MemoryStore()
+        score = request_score(s, event["profile"])
+        (key, _), = s.data.items()
+        for data in (event, json.dumps(event), json.dumps(event).encode("utf-8")):
+            self.assertEqual(precompute.parse_event(data), ("upsert", key, score))
+
+    @helper.cases([
+        "",
+        "[]",
+        {"profile": [1]},
+        {"op": "merge", "profile": PROFILE},
+        {"profile": {"phone": "123"}},
+        {"profile": {"first_name": "a"}},
+    ])
+    def test_invalid(self, data):
+        with self.assertRaises(ValueError):
+            precompute.parse_event(data)
+
+    @helper.cases([({"ts": 1.5}, 1.5), ('{"ts": 2}', 2), ({"ts": "1"}, None), ({"ts": True}, None), ("x", None)])
+    def test_event_time(self, data, expected):
+        self.assertEqual(precompute.event_time(data), expected)
+
+    @helper.cases([
+        [["s", [("1-0", {"event": "a"}), ("2-0", {"event": "b"})]]],
+        {"s": [("1-0", {"event": "a"}), ("2-0", {"event": "b"})]},
+        {"s": [[("1-0", {"event": "a"}), ("2-0", {"event": "b"})]]},
+    ])
+    def test_stream_entries(self, reply):
+        self.assertEqual(precompute.stream_entries(reply), [("1-0", {"event": "a"}), ("2-0", {"event": "b"})])
+
+
+class PrecomputerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = store.MemoryStore()
+        self.source = precompute.QueueSource()
+        self.precomputer = precompute.Precomputer(self.store, self.source, batch_size=10, batch_timeout=0.01)
+
+    def test_request_hits_precomputed_score(self):
+        self.source.events.put({"profile": PROFILE, "ts": time.time() - 1})
+        self.assertEqual(self.precomputer.run_once(), 1)
+        (key, (value, _)), = self.store.data.items()
+        self.assertEqual(float(value), request_score(store.MemoryStore(), PROFILE))
+        self.store.cache_set(key, 99, 60)
+        self.assertEqual(request_score(self.store, PROFILE), 99)
+        metrics = self.precomputer.metrics.snapshot()
+        self.assertEqual((metrics["events"], metrics["written"], metrics["batches"]), (1, 1, 1))
+        self.assertGreaterEqual(metrics["lag_sec"], 1)
+
+    def test_batch_last_event_wins(self):
+        other = {"first_name": "a", "last_name": "b"}
+        for event in ({"profile": PROFILE}, {"profile": other}, {"op": "delete", "profile": PROFILE},
+                      {"profile": other}, "{", {"profile": {}}):
+            self.source.events.put(event)
+        self.assertEqual(self.precomputer.run_once(), 6)
+        self.assertEqual(len(self.store.data), 1)
+        self.assertEqual(request_score(self.store, other), 0.5)
+        metrics = self.precomputer.metrics.snapshot()
+        self.assertEqual((metrics["written"], metrics["deleted"], metrics["invalid"]), (1, 1, 2))
+        self.assertEqual(metrics["lag_sec"], None)
+
+    def test_delete(self):
+        request_score(self.store, PROFILE)
+        self.source.events.put({"op": "delete", "profile": PROFILE})
+        self.precomputer.run_once()
+        self.assertEqual(self.store.data, {})
+
+    def test_run(self):
+        for i in range(25):
+            self.source.events.put({"profile": {"first_name": str(i), "last_name": "b"}})
+        self.assertEqual(self.precomputer.run(max_events=25), 25)
+        self.assertEqual(len(self.store.data), 25)
+        self.assertEqual(self.precomputer.metrics.batches, 3)
+        stop = threading.Event()
+        stop.set()
+        self.assertEqual(self.precomputer.run(stop), 0)
+
+    def test_metrics_rate(self):
+        metrics = precompute.Metrics()
+        metrics.observe(10, 10, 0, 0, [0.5, 0.25])
+        self.assertEqual(metrics.snapshot()["lag_sec"], 0.5)
+        metrics.observe(10, 10, 0, 0, [0.1])
+        snapshot = metrics.snapshot()
+        self.assertEqual((snapshot["events"], snapshot["lag_sec"], snapshot["max_lag_sec"]), (20, 0.1, 0.5))
+        self.assertGreater(snapshot["events_per_sec"], 0)
+        self.assertEqual(metrics.snapshot()["recent_events_per_sec"], 0)
+        self.assertIn("20 events", metrics.format())
+
+
+class FileTailSourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "events.jsonl")
+
+    def append(self, data, path=None):
+        with open(path or self.path, "ab") as f:
+            f.write(data)
+
+    def test_tail(self):
+        self.append(b'{"old": 1}\n')
+        source = precompute.FileTailSource(self.path, poll_interval=0.001)
+        self.addCleanup(source.close)
+        self.assertEqual(source.read(10, 0.01), [])
+        self.append(b'{"ts": 5}\n\n{"a"')
+        self.assertEqual(source.read(10, 0.01), [(b'{"ts": 5}\n', 5)])
+        self.append(b': 1}\n')
+        self.assertEqual(source.read(10, 0.01), [(b'{"a": 1}\n', None)])
+
+    def test_from_start_and_batch_size(self):
+        self.append(b"1\n2\n3\n")
+        source = precompute.FileTailSource(self.path, from_start=True)
+        self.addCleanup(source.close)
+        self.assertEqual([line for line, _ in source.read(2, 0)], [b"1\n", b"2\n"])
+        self.assertEqual([line for line, _ in source.read(2, 0)], [b"3\n"])
+
+    def test_rotation_and_truncation(self):
+        source = precompute.FileTailSource(self.path, poll_interval=0.001)
+        self.addCleanup(source.close)
+        self.assertEqual(source.read(10, 0), [])
+        self.append(b"1\n")
+        self.assertEqual(source.read(10, 0.01), [(b"1\n", None)])
+        os.rename(self.path, self.path + ".1")
+        self.append(b"2\n4\n")
+        self.assertEqual(source.read(10, 0.01), [(b"2\n", None), (b"4\n", None)])
+        with open(self.path, "wb") as f:
+            f.write(b"3\n")
+        self.assertEqual(source.read(10, 0.01), [(b"3\n", None)])
+
+    def test_queue_source(self):
+        events = queue.Queue()
+        source = precompute.QueueSource(events)
+        self.assertEqual(source.read(10, 0), [])
+        events.put('{"ts": 1}')
+        events.put({})
+        self.assertEqual(source.read(10, 0), [('{"ts": 1}', 1), ({}, None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
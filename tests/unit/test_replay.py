@@ -0,0 +1,90 @@
+import json
+import logging
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+
+from api import api
+from api import replay
+from tests import helper
+
+
+def log_line(time, path, body, request_id):
+    record = logging.LogRecord("root", logging.INFO, "", 0,
+                               "%s: %s %s" % (path, body, request_id), None, None)
+    formatter = logging.Formatter('[%(asctime)s] %(levelname).1s %(message)s',
+                                  datefmt=replay.LOG_DATE_FORMAT)
+    return formatter.format(record).replace(formatter.formatTime(record, replay.LOG_DATE_FORMAT), time)
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = [
+            {"account": "horns&hoofs", "login": "h&f", "method": "online_score", "token": "x",
+             "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}},
+            {"login": "admin", "method": "clients_interests", "token": "expired",
+             "arguments": {"client_ids": [1, 2]}},
+            {"account": "it's", "login": "h\"f", "method": "online_score", "token": "",
+             "arguments": {}},
+        ]
+        self.lines = [
+            log_line("2017.07.19 10:00:00", "/method/", json.dumps(self.requests[0]).encode(), "r0"),
+            "[2017.07.19 10:00:00] I {'request_id': 'r0', 'response': {}, 'code': 200}\n",
+            log_line("2017.07.19 10:00:00", "/method/", json.dumps(self.requests[1]).encode(), "r1"),
+            log_line("2017.07.19 10:00:02", "/method/", json.dumps(self.requests[2]).encode(), "r2"),
+            log_line("2017.07.19 10:00:03", "/method/", b"{not json", "r3"),
+            "[2017.07.19 10:00:04] E Unexpected error: x\n",
+        ]
+
+    def test_parse_log(self):
+        records = list(replay.parse_log(self.lines))
+        self.assertEqual([r[3] for r in records], ["r0", "r1", "r2", "r3"])
+        self.assertEqual(json.loads(records[2][2]), self.requests[2])
+        self.assertEqual(records[3][2], b"{not json")
+
+    def test_load_offsets_and_tokens(self):
+        captured = replay.load(self.lines)
+        self.assertEqual([c.offset for c in captured], [0, 0.5, 2, 3])
+        self.assertEqual([c.method for c in captured],
+                         ["online_score", "clients_interests", "online_score", None])
+        for c, request in zip(captured, self.requests):
+            helper.set_valid_auth(request)
+            self.assertEqual(json.loads(c.body), request)
+
+    def test_load_batch_and_profile(self):
+        batch = [dict(self.requests[0]), dict(self.requests[1]), "x"]
+        lines = [
+            log_line("2017.07.19 10:00:00", "/admin/profile/", b'{"login": "admin", "token": "x"}', "p0"),
+            log_line("2017.07.19 10:00:01", "/batch/", json.dumps(batch).encode(), "b0"),
+        ]
+        captured = replay.load(lines)
+        self.assertEqual([(c.request_id, c.offset, c.method) for c in captured], [("b0", 0, "batch")])
+        for request in batch[:2]:
+            helper.set_valid_auth(request)
+        self.assertEqual(json.loads(captured[0].body), batch)
+
+    @helper.cases([(1.0, None, [0, 0.5, 2, 3]), (2.0, None, [0, 0.25, 1, 1.5]),
+                   (1.0, 4, [0, 0.25, 0.5, 0.75])])
+    def test_schedule(self, speed, rate, expected):
+        self.assertEqual(replay.schedule(replay.load(self.lines), speed, rate), expected)
+
+    def test_replay(self):
+        handler = type("Handler", (api.MainHTTPHandler,),
+                       {"log_message": lambda *args: None,
+                        "store_config": {"backend": "memory", "data": {"i:1": "[]", "i:2": "[]"}}})
+        server = ThreadingHTTPServer(("localhost", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        captured = replay.load(self.lines)
+        replayer = replay.Replayer("localhost", server.server_address[1], concurrency=2)
+        with self.assertLogs(level=logging.INFO):
+            replayer.run(captured, replay.schedule(captured, rate=1000))
+        self.assertEqual(replayer.codes, {api.OK: 2, api.INVALID_REQUEST: 1, api.BAD_REQUEST: 1})
+        self.assertEqual(len(replayer.latencies), 4)
+        self.assertIn("p99=", replayer.report(1.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
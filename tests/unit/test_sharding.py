@@ -0,0 +1,84 @@
+import unittest
+from collections import Counter
+from unittest import mock
+
+from api import sharding
+from api import store
+from tests import helper
+
+
+class HashRingTest(unittest.TestCase):
+
+    def test_ring_stable(self):
+        r1 = sharding.HashRing(["a", "b", "c"])
+        r2 = sharding.HashRing(["c", "a", "b"])
+        keys = ["uid:{}".format(i) for i in range(1000)]
+        self.assertEqual([r1.get_node(k) for k in keys], [r2.get_node(k) for k in keys])
+
+    def test_ring_distribution(self):
+        ring = sharding.HashRing(["a", "b", "c", "d"])
+        counts = Counter(ring.get_node("i:{}".format(i)) for i in range(20000))
+        self.assertEqual(set(counts), {"a", "b", "c", "d"})
+        self.assertLess(max(counts.values()) / min(counts.values()), 1.5)
+
+    def test_ring_add_node(self):
+        old = sharding.HashRing(["a", "b", "c"])
+        new = sharding.HashRing(["a", "b", "c", "d"])
+        keys = ["i:{}".format(i) for i in range(20000)]
+        moved = list(sharding.moved_keys(keys, old, new))
+        self.assertTrue(all(new_node == "d" for _, _, new_node in moved))
+        self.assertLess(abs(len(moved) / len(keys) - 0.25), 0.1)
+
+    def test_ring_empty(self):
+        with self.assertRaises(ValueError):
+            sharding.HashRing([])
+
+    @helper.cases(["localhost:6379/0", "10.0.0.1:6380/2"])
+    def test_node_name(self, name):
+        self.assertEqual(sharding.node_name(sharding.parse_node(name)), name)
+
+    def test_make_ring_matches_store(self):
+        nodes = ["h1:6379", "h2:6379/0", "h3"]
+        ring = sharding.make_ring(nodes)
+        with mock.patch.object(store, "Store"):
+            store_ring = sharding.create_sharded_store(nodes).ring
+        keys = ["uid:{}".format(i) for i in range(1000)]
+        self.assertEqual([ring.get_node(k) for k in keys], [store_ring.get_node(k) for k in keys])
+
+
+class ShardedStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.shards = {name: store.MemoryStore() for name in ("a", "b", "c")}
+        self.store = sharding.ShardedStore(self.shards)
+
+    def test_routing(self):
+        for i in range(100):
+            self.store.cache_set("uid:{}".format(i), i, 60)
+        for name, shard in self.shards.items():
+            self.assertTrue(shard.data)
+            self.assertTrue(all(self.store.ring.get_node(k) == name for k in shard.data))
+        self.assertEqual(self.store.cache_get("uid:42"), "42")
+
+    def test_batch(self):
+        keys = ["i:{}".format(i) for i in range(100)]
+        self.store.set_many([(k, k) for k in keys[::2]])
+        self.assertEqual(self.store.get_many(keys),
+                         [k if i % 2 == 0 else None for i, k in enumerate(keys)])
+        self.store.cache_set_many([(k, 1) for k in keys], 60)
+        self.assertEqual(self.store.cache_get_many(keys[:3] + ["x"]), ["1", "1", "1", None])
+        self.store.cache_delete_many(keys[:50])
+        self.assertEqual(self.store.cache_get_many(keys[49:51]), [None, "1"])
+        with self.assertRaises(ValueError):
+            self.store.get("x")
+
+    def test_notify(self):
+        written = []
+        self.store.add_listener(written.extend)
+        self.store.set("i:1", "[]")
+        self.store.set_many([("i:2", "[]"), ("i:3", "[]")])
+        self.assertEqual(written, ["i:1", "i:2", "i:3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import json
+import os
+import tempfile
+import unittest
+
+from api import scoring
+from api import snapshot
+from api import store
+from tests import helper
+
+
+class InterestsSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "interests.snap")
+        self.interests = {0: ["poker", "alcohol"], 1: ["yoga", "theater"],
+                          7: ["football", "beer"], 2 ** 40: ["zumba"]}
+        snapshot.write_snapshot(self.path, self.interests.items())
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    @helper.cases([0, 1, 7, 2 ** 40])
+    def test_snapshot_get(self, cid):
+        s = snapshot.InterestsSnapshot(self.path)
+        self.assertEqual(json.loads(bytes(s.get(cid))), self.interests[cid])
+
+    @helper.cases([2, 6, 8, 2 ** 41])
+    def test_snapshot_get_missing(self, cid):
+        s = snapshot.InterestsSnapshot(self.path)
+        self.assertEqual(s.get(cid), None)
+
+    def test_snapshot_empty(self):
+        snapshot.write_snapshot(self.path, [])
+        s = snapshot.InterestsSnapshot(self.path)
+        self.assertEqual(len(s), 0)
+        self.assertEqual(s.get(0), None)
+
+    def test_snapshot_reload(self):
+        s = snapshot.InterestsSnapshot(self.path, check_interval=0)
+        view = s.get(1)
+        snapshot.write_snapshot(self.path, [(1, ["chess"]), (3, '["go"]')])
+        self.assertEqual(json.loads(bytes(s.get(1))), ["chess"])
+        self.assertEqual(json.loads(bytes(s.get(3))), ["go"])
+        self.assertEqual(s.get(0), None)
+        self.assertEqual(json.loads(bytes(view)), ["yoga", "theater"])
+        self.assertFalse(s.reload())
+
+    def test_snapshot_bad_file(self):
+        with open(self.path, "wb") as f:
+            f.write(b"\0" * 64)
+        with self.assertRaises(ValueError):
+            snapshot.InterestsSnapshot(self.path)
+
+    def test_snapshot_store(self):
+        s = store.create_store({"backend": "snapshot", "path": self.path})
+        self.assertEqual(scoring.get_interests(s, 7), ["football", "beer"])
+        with self.assertRaises(ValueError):
+            scoring.get_interests(s, 3)
+        s.fallback.set("i:3", '["go"]')
+        values = s.get_many(["i:0", "i:3", "i:4", "uid:1"])
+        self.assertIsInstance(values[0], memoryview)
+        self.assertEqual([bytes(values[0])] + values[1:], [b'["poker", "alcohol"]', '["go"]', None, None])
+
+    def test_snapshot_mmap_store(self):
+        s = store.create_store({"backend": "mmap", "path": self.path})
+        self.addCleanup(s.close)
+        self.assertEqual(scoring.get_interests(s, 2 ** 40), ["zumba"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import time
+import unittest
+
+from api import store
+from tests import helper
+
+
+class MemoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = store.MemoryStore()
+
+    @helper.cases([("key_0", "111"), ("key_1", 4), ("key_2", 2.3)])
+    def test_memory_store_cache_set_get(self, key, value):
+        self.store.cache_set(key, value, 60)
+        self.assertEqual(self.store.cache_get(key), str(value))
+        self.assertEqual(self.store.get(key), str(value))
+
+    def test_memory_store_ttl_eviction(self):
+        self.store.cache_set("key_0", "1", 0.01)
+        self.store.set("key_1", "2")
+        time.sleep(0.02)
+        self.assertEqual(self.store.cache_get("key_0"), None)
+        self.assertEqual(self.store.cache_get("key_1"), "2")
+
+    def test_memory_store_sweep(self):
+        s = store.MemoryStore(sweep_every=2)
+        s.cache_set("key_0", "1", 0.01)
+        time.sleep(0.02)
+        s.set("key_1", "2")
+        self.assertNotIn("key_0", s.data)
+
+    def test_memory_store_get_missing(self):
+        with self.assertRaises(ValueError):
+            self.store.get("key_0")
+        self.assertEqual(self.store.cache_get("key_0"), None)
+
+    def test_memory_store_batch(self):
+        self.store.cache_set_many([("key_0", 1), ("key_1", 2)], 60)
+        self.assertEqual(self.store.cache_get_many(["key_1", "key_2", "key_0"]),
+                         ["2", None, "1"])
+        self.assertEqual(self.store.get_many(["key_0", "key_2"]), ["1", None])
+        self.store.cache_delete_many(["key_0", "key_2"])
+        self.assertEqual(self.store.cache_get_many(["key_0", "key_1"]), [None, "2"])
+
+
+class MmapStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.items = {"i:{}".format(i): '["interest {}"]'.format(i) for i in range(100)}
+        store.MmapStore.build(self.path, self.items.items())
+        self.store = store.MmapStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        os.remove(self.path)
+
+    @helper.cases(["i:0", "i:1", "i:10", "i:99", "i:55"])
+    def test_mmap_store_get(self, key):
+        self.assertEqual(self.store.get(key), self.items[key])
+
+    @helper.cases(["i:100", "i:", "", "z"])
+    def test_mmap_store_get_missing(self, key):
+        with self.assertRaises(ValueError):
+            self.store.get(key)
+
+    def test_mmap_store_get_many(self):
+        self.assertEqual(self.store.get_many(["i:3", "i:100", "i:7"]),
+                         [self.items["i:3"], None, self.items["i:7"]])
+
+    def test_mmap_store_hash_collision(self):
+        # keys with the same CRC-32
+        items = {"i:29685295": '["a"]', "i:32060020": '["b"]'}
+        store.MmapStore.build(self.path, items.items())
+        s = store.MmapStore(self.path)
+        self.addCleanup(s.close)
+        self.assertEqual(s.get_many(list(items) + ["i:0"]), list(items.values()) + [None])
+
+    def test_mmap_store_cache(self):
+        self.store.cache_set("uid:1", 3.0, 60)
+        self.assertEqual(self.store.cache_get("uid:1"), "3.0")
+
+    def test_mmap_store_bad_file(self):
+        with open(self.path, "wb") as f:
+            f.write(b"\0" * 64)
+        with self.assertRaises(ValueError):
+            store.MmapStore(self.path)
+
+
+class CreateStoreTest(unittest.TestCase):
+
+    def test_create_memory_store(self):
+        self.assertIsInstance(store.create_store({"backend": "memory"}), store.MemoryStore)
+
+    def test_create_unknown_store(self):
+        with self.assertRaises(ValueError):
+            store.create_store({"backend": "xxx"})
+
+
+if __name__ == "__main__":
+    unittest.main()
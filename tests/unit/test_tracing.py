@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+import unittest
+
+from api import api
+from api import store
+from api import tracing
+from tests import helper
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+class TracingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = ListExporter()
+        self.tracer = tracing.Tracer(self.exporter, sample_rate=1.0)
+
+    def test_unsampled_trace(self):
+        t = tracing.Tracer(self.exporter, sample_rate=0.0)
+        with t.trace("root", {}) as root:
+            self.assertIs(root, tracing.NOOP_SPAN)
+            self.assertIs(tracing.span("child"), tracing.NOOP_SPAN)
+        self.assertEqual(self.exporter.spans, [])
+
+    def test_no_exporter(self):
+        t = tracing.Tracer(None, sample_rate=1.0)
+        self.assertIs(t.trace("root", {}), tracing.NOOP_SPAN)
+
+    def test_span_tree(self):
+        with self.tracer.trace("root", {}, request_id="42"):
+            with tracing.span("child", key="value"):
+                with tracing.span("grandchild"):
+                    pass
+        grandchild, child, root = self.exporter.spans
+        self.assertEqual(root.attributes, {"request_id": "42"})
+        self.assertEqual(root.parent_id, None)
+        self.assertEqual(child.parent_id, root.span_id)
+        self.assertEqual(grandchild.parent_id, child.span_id)
+        self.assertEqual({s.trace_id for s in self.exporter.spans}, {root.trace_id})
+        self.assertEqual(child.attributes, {"key": "value"})
+        self.assertIsNone(tracing.current_span())
+
+    def test_span_error(self):
+        with self.assertRaises(KeyError):
+            with self.tracer.trace("root", {}):
+                raise KeyError("x")
+        self.assertEqual(self.exporter.spans[0].error, repr(KeyError("x")))
+
+    @helper.cases([
+        ("00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01", True),
+        ("00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-00", False),
+    ])
+    def test_traceparent(self, traceparent, sampled):
+        t = tracing.Tracer(self.exporter, sample_rate=1.0 - sampled)
+        with t.trace("root", {"traceparent": traceparent}) as root:
+            pass
+        if sampled:
+            self.assertEqual(root.trace_id, "0af7651916cd43dd8448eb211c80319c")
+            self.assertEqual(root.parent_id, "b7ad6b7169203331")
+        else:
+            self.assertIs(root, tracing.NOOP_SPAN)
+
+    def test_method_handler_spans(self):
+        s = store.MemoryStore()
+        request = {"account": "horns&hoofs", "login": "h&f", "method": "online_score",
+                   "arguments": {"phone": "79175002040", "email": "stupnikov@otus.ru"}}
+        helper.set_valid_auth(request)
+        with self.tracer.trace("root", {}):
+            _, code = api.method_handler({"body": request, "headers": {}}, {}, s)
+        self.assertEqual(code, api.OK)
+        names = [span.name for span in self.exporter.spans]
+        self.assertEqual(names, ["validation", "auth", "validation.arguments",
+                                 "store.cache_get", "store.cache_set", "scoring", "root"])
+        self.assertEqual(self.exporter.spans[1].attributes, {})
+
+    def test_file_exporter(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        exporter = tracing.FileExporter(path)
+        self.addCleanup(exporter.close)
+        t = tracing.Tracer(exporter, sample_rate=1.0)
+        with t.trace("root", {}):
+            with tracing.span("child"):
+                pass
+        with open(path) as f:
+            spans = [json.loads(line) for line in f]
+        self.assertEqual([s["name"] for s in spans], ["child", "root"])
+        self.assertEqual(spans[0]["parent_id"], spans[1]["span_id"])
+
+    def test_otlp_encode(self):
+        exporter = tracing.OTLPExporter.__new__(tracing.OTLPExporter)
+        exporter.service_name = "test"
+        with tracing.Tracer(self.exporter, 1.0).trace("root", {}, code=200):
+            pass
+        encoded = exporter.encode(self.exporter.spans)
+        span = encoded["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        self.assertEqual(span["name"], "root")
+        self.assertEqual(span["attributes"], [{"key": "code", "value": {"intValue": "200"}}])
+
+
+class RequestIdTest(unittest.TestCase):
+
+    def test_request_id_header(self):
+        handler = api.MainHTTPHandler.__new__(api.MainHTTPHandler)
+        self.assertEqual(handler.get_request_id({"X-Request-ID": "abc"}), "abc")
+        self.assertEqual(len(handler.get_request_id({})), 32)
+
+
+if __name__ == "__main__":
+    unittest.main()